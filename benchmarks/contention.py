@@ -0,0 +1,326 @@
+'''
+Contention benchmark: pack and unpack throughput from 1..N threads,
+through one shared schema and through per-thread copies, with process
+pools for comparison. Reports throughput, time spent waiting on the
+parsers' internal locks, and scaling efficiency.
+
+Usage:
+    python benchmarks/contention.py [--max-workers n] [--duration s]
+                                    [--schema name] [--save out.json]
+                                    [--compare base.json] [--quick]
+
+LICENSING
+-------------------------------------------------
+
+Smartyparse: A python library for smart dynamic binary de/encoding.
+    Copyright (C) 2016 Muterra, Inc.
+    
+    Contributors
+    ------------
+    Nick Badger
+        badg@muterra.io | badg@nickbadger.com | nickbadger.com
+
+    This library is free software; you can redistribute it and/or
+    modify it under the terms of the GNU Lesser General Public
+    License as published by the Free Software Foundation; either
+    version 2.1 of the License, or (at your option) any later version.
+
+    This library is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+    Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public
+    License along with this library; if not, write to the
+    Free Software Foundation, Inc.,
+    51 Franklin Street,
+    Fifth Floor,
+    Boston, MA  02110-1301 USA
+
+------------------------------------------------------
+
+'''
+
+import os
+import sys
+import time
+import argparse
+import threading
+import collections
+import concurrent.futures
+
+from smartyparse import SmartyParser
+from smartyparse import ListyParser
+
+import harness
+import schemas
+
+
+# Schema factories must be module-level, so process pools can use them.
+SCHEMAS = {
+    'tf_1': (schemas.make_tf_1, schemas.make_tv_1),
+    'tf_2': (schemas.make_tf_2, schemas.make_tv_2),
+    'tf_nest': (schemas.make_tf_nest, schemas.make_tv_nest),
+}
+
+
+# ###############################################
+# Lock instrumentation
+# ###############################################
+
+
+class TimedLock:
+    ''' Drop-in replacement for the parsers' threading.Lock that records
+    how long each thread spends waiting to acquire it.
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Each thread only ever touches its own key
+        self.wait_ns = collections.defaultdict(int)
+        
+    def __enter__(self):
+        start = time.perf_counter_ns()
+        self._lock.acquire()
+        self.wait_ns[threading.get_ident()] += time.perf_counter_ns() - start
+        return self
+        
+    def __exit__(self, *exc):
+        self._lock.release()
+        
+        
+def _parsables(root):
+    ''' Yields every parsable reachable from root, once each.
+    '''
+    seen = set()
+    stack = [root]
+    while stack:
+        parsable = stack.pop()
+        if parsable is None or id(parsable) in seen:
+            continue
+        seen.add(id(parsable))
+        yield parsable
+        
+        if isinstance(parsable, SmartyParser):
+            stack.extend(parsable._control.values())
+        elif isinstance(parsable, ListyParser):
+            stack.extend(parsable.parsers)
+            stack.append(parsable.terminant)
+            
+            
+def instrument(schema):
+    ''' Swaps a TimedLock into every parsable in schema, returning them.
+    '''
+    locks = []
+    for parsable in _parsables(schema):
+        parsable._mutex = TimedLock()
+        locks.append(parsable._mutex)
+    return locks
+    
+    
+# ###############################################
+# Workloads
+# ###############################################
+
+
+def _make_op(schema, make_obj, op):
+    if op == 'pack':
+        obj = make_obj()
+        return lambda: schema.pack(obj)
+    else:
+        packed = bytes(schema.pack(make_obj()))
+        return lambda: schema.unpack(packed)
+        
+        
+def _run_for(func, deadline):
+    count = 0
+    while time.perf_counter() < deadline:
+        func()
+        count += 1
+    return count
+    
+    
+def run_threads(schema_name, op, threads, shared, duration, timed):
+    ''' Runs op from the given number of threads for duration seconds.
+    Returns (total ops, elapsed seconds, total lock wait seconds).
+    '''
+    make_schema, make_obj = SCHEMAS[schema_name]
+    
+    if shared:
+        schema = make_schema()
+        locks = instrument(schema) if timed else []
+        ops = [_make_op(schema, make_obj, op) for __ in range(threads)]
+    else:
+        locks = []
+        ops = []
+        for __ in range(threads):
+            schema = make_schema()
+            if timed:
+                locks.extend(instrument(schema))
+            ops.append(_make_op(schema, make_obj, op))
+    
+    counts = [0] * threads
+    barrier = threading.Barrier(threads + 1)
+    deadline = [None]
+    
+    def worker(index):
+        barrier.wait()
+        counts[index] = _run_for(ops[index], deadline[0])
+        
+    workers = [threading.Thread(target=worker, args=(ii,)) 
+               for ii in range(threads)]
+    for thread in workers:
+        thread.start()
+        
+    start = time.perf_counter()
+    deadline[0] = start + duration
+    barrier.wait()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    
+    wait = sum(sum(lock.wait_ns.values()) for lock in locks) / 1e9
+    return sum(counts), elapsed, wait
+    
+    
+def _process_worker(schema_name, op, start_at, duration):
+    make_schema, make_obj = SCHEMAS[schema_name]
+    func = _make_op(make_schema(), make_obj, op)
+    # Start everyone at (roughly) the same time
+    while time.time() < start_at:
+        pass
+    start = time.perf_counter()
+    count = _run_for(func, start + duration)
+    return count, time.perf_counter() - start
+    
+    
+def run_processes(schema_name, op, processes, duration):
+    ''' Runs op from the given number of processes, each with its own
+    schema, for duration seconds. Returns (total ops, elapsed seconds).
+    '''
+    with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+        # Leave enough time for the pool to spin up
+        start_at = time.time() + 0.5 + 0.05 * processes
+        futures = [executor.submit(_process_worker, schema_name, op, 
+                                   start_at, duration)
+                   for __ in range(processes)]
+        results = [future.result() for future in futures]
+    # Workers overrun the deadline by up to one op each
+    return (sum(count for count, __ in results), 
+            max(elapsed for __, elapsed in results))
+    
+    
+# ###############################################
+# Running
+# ###############################################
+    
+    
+def _counts(max_workers):
+    count = 1
+    while count < max_workers:
+        yield count
+        count *= 2
+    yield max_workers
+    
+    
+def run(schema_name, max_workers, duration, processes=True):
+    results = []
+    
+    for op in ('pack', 'unpack'):
+        modes = [('shared', True), ('per-thread', False)]
+        if processes:
+            modes.append(('processes', None))
+            
+        for mode, shared in modes:
+            baseline = None
+            for workers in _counts(max_workers):
+                if shared is None:
+                    total, elapsed = run_processes(schema_name, op, workers,
+                                                   duration)
+                    wait = None
+                else:
+                    total, elapsed, __ = run_threads(
+                        schema_name, op, workers, shared, duration, False
+                    )
+                    # Lock timing adds overhead, so measure it separately
+                    __, timed_elapsed, wait = run_threads(
+                        schema_name, op, workers, shared, duration, True
+                    )
+                    # Report as a fraction of total thread-time
+                    wait = wait / (workers * timed_elapsed)
+                    
+                throughput = total / elapsed
+                if baseline is None:
+                    baseline = throughput
+                results.append({
+                    'name': '.'.join((schema_name, op, mode, str(workers))),
+                    'schema': schema_name,
+                    'op': op,
+                    'mode': mode,
+                    'workers': workers,
+                    'ops_per_s': throughput,
+                    'lock_wait_fraction': wait,
+                    'efficiency': throughput / (baseline * workers),
+                })
+                
+    return results
+    
+    
+COLUMNS = [
+    ('name', 'case', None),
+    ('ops_per_s', 'ops/s', ',.0f'),
+    ('lock_wait_fraction', 'lock wait', '.1%'),
+    ('efficiency', 'efficiency', '.1%'),
+]
+    
+    
+def main(argv=None):
+    argparser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    argparser.add_argument('--max-workers', type=int, 
+                           default=os.cpu_count() or 1)
+    argparser.add_argument('--duration', type=float, default=1.0,
+                           help='Seconds to run each configuration for.')
+    argparser.add_argument('--schema', choices=sorted(SCHEMAS), 
+                           action='append',
+                           help='Only run this schema (repeatable).')
+    argparser.add_argument('--no-processes', action='store_true',
+                           help='Skip the process pool comparison.')
+    argparser.add_argument('--save', help='Write JSON results to this path.')
+    argparser.add_argument('--compare', 
+                           help='Compare against JSON results at this path.')
+    argparser.add_argument('--threshold', type=float, default=0.1,
+                           help='Relative slowdown to flag as a regression.')
+    argparser.add_argument('--quick', action='store_true',
+                           help='Shorter runs (for smoke testing).')
+    args = argparser.parse_args(argv)
+    
+    if args.quick:
+        args.duration = min(args.duration, 0.1)
+        
+    environment = harness.environment()
+    print('Python', environment['python'].split()[0], '(GIL ' + 
+          ('enabled' if environment['gil_enabled'] else 'disabled') + ')')
+    
+    results = []
+    for schema_name in args.schema or ['tf_1']:
+        results.extend(run(schema_name, args.max_workers, args.duration,
+                           not args.no_processes))
+    harness.print_table(results, COLUMNS)
+    
+    if args.save:
+        harness.save(args.save, 'contention', results)
+        
+    if args.compare:
+        # Lower is better for compare(), so compare time per op
+        for row in results:
+            row['s_per_op'] = 1 / row['ops_per_s']
+        baseline = harness.load(args.compare)
+        for row in baseline['results']:
+            row['s_per_op'] = 1 / row['ops_per_s']
+        if harness.compare(baseline, results, 's_per_op', args.threshold):
+            return 1
+            
+    return 0
+    
+    
+if __name__ == '__main__':
+    sys.exit(main())
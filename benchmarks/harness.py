@@ -0,0 +1,284 @@
+'''
+Shared timing, memory and reporting machinery for the benchmarks.
+
+LICENSING
+-------------------------------------------------
+
+Smartyparse: A python library for smart dynamic binary de/encoding.
+    Copyright (C) 2016 Muterra, Inc.
+    
+    Contributors
+    ------------
+    Nick Badger
+        badg@muterra.io | badg@nickbadger.com | nickbadger.com
+
+    This library is free software; you can redistribute it and/or
+    modify it under the terms of the GNU Lesser General Public
+    License as published by the Free Software Foundation; either
+    version 2.1 of the License, or (at your option) any later version.
+
+    This library is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+    Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public
+    License along with this library; if not, write to the
+    Free Software Foundation, Inc.,
+    51 Franklin Street,
+    Fifth Floor,
+    Boston, MA  02110-1301 USA
+
+------------------------------------------------------
+
+'''
+
+import gc
+import sys
+import json
+import math
+import time
+import platform
+import datetime
+import subprocess
+import tracemalloc
+
+
+# ###############################################
+# Measurement
+# ###############################################
+
+
+def _calibrate(func, min_time):
+    ''' Finds a loop count that takes at least min_time seconds.
+    '''
+    loops = 1
+    while True:
+        elapsed = _run(func, loops)
+        if elapsed >= min_time or loops >= 1 << 24:
+            return loops
+        # Overshoot slightly, so this converges quickly
+        loops = max(loops * 2, int(loops * min_time * 1.2 / (elapsed or 1e-9)))
+        
+        
+def _run(func, loops):
+    start = time.perf_counter_ns()
+    for __ in range(loops):
+        func()
+    return (time.perf_counter_ns() - start) / 1e9
+    
+    
+def best_time(func, repeat=3, min_time=0.01):
+    ''' Returns (best seconds per call, loops per repeat), calling func
+    enough times per repeat to last at least min_time.
+    '''
+    loops = _calibrate(func, min_time)
+    return min(_run(func, loops) for __ in range(repeat)) / loops, loops
+    
+    
+def _noop():
+    pass
+    
+    
+def _reset_peak():
+    ''' Resets the traced peak, returning the traced memory it's now
+    relative to. tracemalloc.reset_peak is new in 3.9; before that, 
+    tracing is restarted instead.
+    '''
+    if hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+    else:
+        tracemalloc.stop()
+        tracemalloc.start()
+    return tracemalloc.get_traced_memory()[0]
+    
+    
+def _retained_blocks(func, loops):
+    ''' Counts the memory blocks still allocated (after collecting any
+    cyclic garbage) after calling func loops times.
+    '''
+    gc.collect()
+    before = sys.getallocatedblocks()
+    for __ in range(loops):
+        func()
+    gc.collect()
+    return sys.getallocatedblocks() - before
+    
+    
+def measure(name, func, nbytes=0, repeat=5, min_time=0.05, mem_loops=50):
+    ''' Times func (a zero-argument callable), returning a result dict.
+    
+    ns_per_op is the best of repeat runs. mb_per_s is computed from
+    nbytes, the number of bytes processed by a single call.
+    
+    CPython doesn't count individual allocations, so memory is reported
+    two ways: peak_bytes_per_op is the peak traced (tracemalloc) memory
+    of a single call, and retained_blocks_per_op is the number of memory
+    blocks still allocated after each call, once cyclic garbage is 
+    collected. The latter is not an allocation count: it only catches
+    growth and leaks. Freeing cached blocks (eg from free lists) can 
+    make the raw difference negative, which is reported as zero.
+    '''
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        # Warm up (and catch errors before spending any time)
+        func()
+        best, loops = best_time(func, repeat, min_time)
+        
+        retained = (_retained_blocks(func, mem_loops) - 
+                    _retained_blocks(_noop, mem_loops)) / mem_loops
+        
+        tracemalloc.start()
+        try:
+            baseline = _reset_peak()
+            func()
+            peak = tracemalloc.get_traced_memory()[1] - baseline
+        finally:
+            tracemalloc.stop()
+            
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+            
+    return {
+        'name': name,
+        'ns_per_op': best * 1e9,
+        'mb_per_s': (nbytes / best / 1e6) if nbytes else None,
+        'bytes_per_op': nbytes,
+        'peak_bytes_per_op': peak,
+        'retained_blocks_per_op': max(retained, 0),
+        'loops': loops,
+    }
+    
+    
+def peak_memory(func):
+    ''' Calls func once, returning (seconds, peak traced bytes).
+    '''
+    gc.collect()
+    tracemalloc.start()
+    try:
+        baseline = _reset_peak()
+        start = time.perf_counter_ns()
+        func()
+        elapsed = (time.perf_counter_ns() - start) / 1e9
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+    return elapsed, peak
+    
+    
+def _same(obj, recycled):
+    if isinstance(obj, float):
+        # Single-precision floats don't survive exactly
+        return math.isclose(obj, recycled, rel_tol=1e-6)
+    elif isinstance(obj, dict):
+        recycled = dict(recycled.items())
+        return obj.keys() == recycled.keys() and \
+               all(_same(obj[key], recycled[key]) for key in obj)
+    elif isinstance(obj, (list, tuple)):
+        return len(obj) == len(recycled) and \
+               all(_same(item, other) for item, other in zip(obj, recycled))
+    return obj == recycled
+    
+    
+def check_round_trip(name, obj, recycled):
+    ''' Raises unless recycled (unpacked from packing obj) matches obj,
+    so that broken cases are never timed.
+    '''
+    if not _same(obj, recycled):
+        raise RuntimeError(name + ' does not round-trip: packed ' + 
+                           repr(obj)[:80] + ', but unpacked ' + 
+                           repr(recycled)[:80])
+    
+    
+# ###############################################
+# Reporting
+# ###############################################
+
+
+def environment():
+    ''' Describes where the benchmark ran, so results can be compared.
+    '''
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], 
+            stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+        
+    gil = getattr(sys, '_is_gil_enabled', None)
+        
+    return {
+        'python': sys.version,
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'gil_enabled': gil() if gil else True,
+        'commit': commit,
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+    
+    
+def save(path, suite, results):
+    with open(path, 'w') as f:
+        json.dump(
+            {'suite': suite, 'environment': environment(), 'results': results},
+            f, 
+            indent=2
+        )
+        
+        
+def load(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+        
+        
+def _fmt(value, spec):
+    if value is None:
+        return '-'
+    return format(value, spec)
+    
+    
+def print_table(results, columns):
+    ''' columns is a list of (key, heading, format spec).
+    '''
+    widths = [max(len(heading), 12) for __, heading, __ in columns]
+    widths[0] = max([widths[0]] + [len(str(row[columns[0][0]]))
+                                   for row in results])
+    print('  '.join(heading.rjust(width) if ii else heading.ljust(width)
+                    for ii, ((__, heading, __), width)
+                    in enumerate(zip(columns, widths))))
+    for row in results:
+        cells = []
+        for ii, ((key, __, spec), width) in enumerate(zip(columns, widths)):
+            if ii:
+                cells.append(_fmt(row[key], spec).rjust(width))
+            else:
+                cells.append(str(row[key]).ljust(width))
+        print('  '.join(cells))
+        
+        
+def compare(baseline, results, key='ns_per_op', threshold=0.1):
+    ''' Prints the change in key for every result also in baseline.
+    Returns the names of any that got worse by more than threshold.
+    '''
+    old = {row['name']: row for row in baseline['results']}
+    regressions = []
+    
+    print()
+    print('Compared against', baseline['environment'].get('commit'))
+    for row in results:
+        if row['name'] not in old or not old[row['name']][key]:
+            continue
+        ratio = row[key] / old[row['name']][key]
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = '  REGRESSION'
+            regressions.append(row['name'])
+        elif ratio < 1 - threshold:
+            flag = '  improved'
+        print('{:<40} {:>8.2f}x{}'.format(row['name'], ratio, flag))
+        
+    return regressions
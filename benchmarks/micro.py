@@ -0,0 +1,192 @@
+'''
+Micro-benchmarks: pack and unpack for every parser primitive, and for
+the canonical SmartyParser/ListyParser schemas.
+
+Usage:
+    python benchmarks/micro.py [--save out.json] [--compare base.json]
+                               [--filter substring] [--quick]
+
+LICENSING
+-------------------------------------------------
+
+Smartyparse: A python library for smart dynamic binary de/encoding.
+    Copyright (C) 2016 Muterra, Inc.
+    
+    Contributors
+    ------------
+    Nick Badger
+        badg@muterra.io | badg@nickbadger.com | nickbadger.com
+
+    This library is free software; you can redistribute it and/or
+    modify it under the terms of the GNU Lesser General Public
+    License as published by the Free Software Foundation; either
+    version 2.1 of the License, or (at your option) any later version.
+
+    This library is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+    Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public
+    License along with this library; if not, write to the
+    Free Software Foundation, Inc.,
+    51 Franklin Street,
+    Fifth Floor,
+    Boston, MA  02110-1301 USA
+
+------------------------------------------------------
+
+'''
+
+import sys
+import copy
+import argparse
+
+from smartyparse import parsers
+
+import harness
+import schemas
+
+
+SMALL = 16
+LARGE = 1 << 20
+
+
+# ###############################################
+# Cases
+# ###############################################
+
+
+def parser_cases():
+    ''' Yields (name, parser, obj) for every primitive parser, with both
+    small and large payloads where the parser supports them.
+    '''
+    yield 'Null', parsers.Null(), None
+    yield 'Int8', parsers.Int8(), -10
+    yield 'Int16', parsers.Int16(signed=False), 301
+    yield 'Int32', parsers.Int32(endian='little'), -100000
+    yield 'Int64', parsers.Int64(signed=False), 10000000001
+    yield 'Float.single', parsers.Float(double=False), 11.11
+    yield 'Float.double', parsers.Float(), 1e-50
+    yield 'ByteBool', parsers.ByteBool(), True
+    yield 'Padding', parsers.Padding(length=SMALL), None
+    yield 'Literal', parsers.Literal(b'MAGIC'), b'MAGIC'
+    
+    for size, label in ((SMALL, 'small'), (LARGE, 'large')):
+        yield 'Blob.' + label, parsers.Blob(), b'x' * size
+        yield 'Blob.fixed.' + label, parsers.Blob(length=size), b'x' * size
+        yield 'String.' + label, parsers.String(), 'x' * size
+        yield 'String.fixed.' + label, parsers.String(length=size + 4), \
+            'x' * size
+        yield 'CString.' + label, parsers.CString(), 'x' * size
+        
+        
+def schema_cases():
+    ''' Yields (name, schema, factory for obj) for the canonical schemas.
+    Fresh objects are needed for every case, since packing mutates them
+    (filling in linked lengths, etc).
+    '''
+    for payload, label in ((SMALL, 'small'), (LARGE, 'large')):
+        tf_1 = schemas.make_tf_1()
+        yield 'tf_1.' + label, tf_1, lambda p=payload: schemas.make_tv_1(p)
+        yield 'tf_2.' + label, schemas.make_tf_2(), \
+            lambda p=payload: schemas.make_tv_2(p)
+        yield 'tf_nest.' + label, schemas.make_tf_nest(tf_1), \
+            lambda p=payload: schemas.make_tv_nest(p)
+        yield 'tf_nest2.' + label, schemas.make_tf_nest2(tf_1), \
+            lambda p=payload: schemas.make_tv_nest2(p)
+            
+    for items, label in ((4, 'small'), (1000, 'large')):
+        yield 'tf_list.' + label, schemas.make_tf_list(), \
+            lambda n=items: schemas.make_tv_list(n)
+        yield 'tf_exlist.' + label, schemas.make_tf_exlist(), \
+            lambda n=items: schemas.make_tv_list(n)
+            
+            
+def run(name_filter=None, quick=False):
+    options = {}
+    if quick:
+        options = {'repeat': 1, 'min_time': 0.005, 'mem_loops': 5}
+        
+    results = []
+    
+    for name, parser, obj in parser_cases():
+        packed = parser.pack(obj)
+        view = memoryview(packed)
+        harness.check_round_trip('parsers.' + name, obj, parser.unpack(view))
+        
+        for op, func in (
+            ('.pack', lambda parser=parser, obj=obj: parser.pack(obj)),
+            ('.unpack', lambda parser=parser, view=view: parser.unpack(view))
+        ):
+            if name_filter and name_filter not in name + op:
+                continue
+            results.append(harness.measure(
+                'parsers.' + name + op, func, len(packed), **options
+            ))
+        
+    for name, schema, make_obj in schema_cases():
+        packed = bytes(schema.pack(make_obj()))
+        harness.check_round_trip(name, make_obj(), schema.unpack(packed))
+        
+        if not name_filter or name_filter in name + '.pack':
+            # Build the object ahead of time, so that only packing is timed.
+            # Repacking it only refills what the first pack filled in, so
+            # it packs the same every time.
+            obj = make_obj()
+            results.append(harness.measure(
+                name + '.pack', 
+                lambda schema=schema, obj=obj: schema.pack(obj), 
+                len(packed), 
+                **options
+            ))
+            
+        if not name_filter or name_filter in name + '.unpack':
+            results.append(harness.measure(
+                name + '.unpack', 
+                lambda schema=schema, packed=packed: schema.unpack(packed),
+                len(packed), 
+                **options
+            ))
+            
+    return results
+    
+    
+COLUMNS = [
+    ('name', 'case', None),
+    ('ns_per_op', 'ns/op', ',.0f'),
+    ('mb_per_s', 'MB/s', ',.1f'),
+    ('peak_bytes_per_op', 'peak B/op', ',d'),
+    ('retained_blocks_per_op', 'retained/op', '.2f'),
+]
+    
+    
+def main(argv=None):
+    argparser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    argparser.add_argument('--save', help='Write JSON results to this path.')
+    argparser.add_argument('--compare', 
+                           help='Compare against JSON results at this path.')
+    argparser.add_argument('--threshold', type=float, default=0.1,
+                           help='Relative slowdown to flag as a regression.')
+    argparser.add_argument('--filter', help='Only run matching cases.')
+    argparser.add_argument('--quick', action='store_true',
+                           help='Fewer, shorter runs (for smoke testing).')
+    args = argparser.parse_args(argv)
+    
+    results = run(args.filter, args.quick)
+    harness.print_table(results, COLUMNS)
+    
+    if args.save:
+        harness.save(args.save, 'micro', results)
+        
+    if args.compare:
+        regressions = harness.compare(harness.load(args.compare), results, 
+                                      threshold=args.threshold)
+        if regressions:
+            return 1
+            
+    return 0
+    
+    
+if __name__ == '__main__':
+    sys.exit(main())
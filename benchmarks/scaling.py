@@ -0,0 +1,255 @@
+'''
+Macro-benchmarks: how pack and unpack time and peak memory scale with
+payload size, nesting depth, field count and list length.
+
+Usage:
+    python benchmarks/scaling.py [--dimension name] [--save out.json]
+                                 [--compare base.json] [--max-payload n]
+                                 [--max-items n] [--quick]
+
+LICENSING
+-------------------------------------------------
+
+Smartyparse: A python library for smart dynamic binary de/encoding.
+    Copyright (C) 2016 Muterra, Inc.
+    
+    Contributors
+    ------------
+    Nick Badger
+        badg@muterra.io | badg@nickbadger.com | nickbadger.com
+
+    This library is free software; you can redistribute it and/or
+    modify it under the terms of the GNU Lesser General Public
+    License as published by the Free Software Foundation; either
+    version 2.1 of the License, or (at your option) any later version.
+
+    This library is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+    Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public
+    License along with this library; if not, write to the
+    Free Software Foundation, Inc.,
+    51 Franklin Street,
+    Fifth Floor,
+    Boston, MA  02110-1301 USA
+
+------------------------------------------------------
+
+'''
+
+import sys
+import math
+import argparse
+
+from smartyparse import SmartyParser
+from smartyparse import ParseHelper
+from smartyparse import ListyParser
+from smartyparse import parsers
+
+import harness
+import schemas
+
+
+# ###############################################
+# Dimensions
+# ###############################################
+
+
+def _powers(start, stop, factor):
+    value = start
+    while value <= stop:
+        yield value
+        value *= factor
+        
+        
+def payload_cases(max_payload):
+    ''' tf_1 with both (link_length'd) bodies of the given size.
+    '''
+    tf_1 = schemas.make_tf_1()
+    for size in _powers(1, max_payload, 16):
+        yield size, tf_1, lambda size=size: schemas.make_tv_1(size)
+        
+        
+def depth_cases(max_depth):
+    ''' tf_1, wrapped in depth layers of tf_nest2.
+    '''
+    for depth in _powers(1, max_depth, 2):
+        schema = schemas.make_tf_1()
+        for __ in range(depth):
+            schema = schemas.make_tf_nest2(schema)
+            
+        def make_obj(depth=depth):
+            obj = schemas.make_tv_1(24)
+            for __ in range(depth):
+                obj = {'_0': 42, '_1': obj, '_2': -42}
+            return obj
+            
+        yield depth, schema, make_obj
+        
+        
+def field_cases(max_fields):
+    ''' Flat formats of count Int32 fields.
+    '''
+    for count in (10, 30, 100, 300, 1000):
+        if count > max_fields:
+            break
+        schema = SmartyParser()
+        for ii in range(count):
+            schema['_' + str(ii)] = ParseHelper(parsers.Int32())
+        yield count, schema, \
+            lambda count=count: {'_' + str(ii): ii for ii in range(count)}
+            
+            
+def item_cases(max_items):
+    ''' ListyParsers of count Int32 items.
+    '''
+    for count in _powers(1, max_items, 10):
+        schema = ListyParser(parsers=[ParseHelper(parsers.Int32())])
+        yield count, schema, lambda count=count: list(range(count))
+        
+        
+DIMENSIONS = {
+    'payload': ('bytes per body', payload_cases),
+    'depth': ('nesting levels', depth_cases),
+    'fields': ('fields', field_cases),
+    'items': ('list items', item_cases),
+}
+    
+    
+# ###############################################
+# Running
+# ###############################################
+
+
+def run_dimension(dimension, limit, quick=False):
+    unit, cases = DIMENSIONS[dimension]
+    repeat = 1 if quick else 3
+    min_time = 0.001 if quick else 0.02
+    results = []
+    
+    for size, schema, make_obj in cases(limit):
+        # Neither timing nor peak memory includes building the object to
+        # pack, so build it up front. Repacking it only refills what the
+        # first pack filled in, so it packs the same every time.
+        obj = make_obj()
+        packed = bytes(schema.pack(obj))
+        harness.check_round_trip(dimension + '.' + str(size), make_obj(),
+                                 schema.unpack(packed))
+        
+        pack_time, __ = harness.best_time(lambda: schema.pack(obj), 
+                                          repeat, min_time)
+        unpack_time, __ = harness.best_time(lambda: schema.unpack(packed), 
+                                            repeat, min_time)
+        __, pack_peak = harness.peak_memory(lambda: schema.pack(obj))
+        __, unpack_peak = harness.peak_memory(lambda: schema.unpack(packed))
+        
+        results.append({
+            'name': dimension + '.' + str(size),
+            'dimension': dimension,
+            'size': size,
+            'packed_bytes': len(packed),
+            'pack_s': pack_time,
+            'unpack_s': unpack_time,
+            'pack_ns_per_unit': pack_time * 1e9 / size,
+            'unpack_ns_per_unit': unpack_time * 1e9 / size,
+            'pack_peak_bytes': pack_peak,
+            'unpack_peak_bytes': unpack_peak,
+        })
+        
+    _add_exponents(results)
+    return unit, results
+    
+    
+def _add_exponents(results):
+    ''' Estimates the local scaling exponent k (as in time ~ size**k)
+    between consecutive points. k > 1 means superlinear.
+    '''
+    previous = None
+    for row in results:
+        for key in ('pack', 'unpack'):
+            exponent = None
+            if previous is not None:
+                try:
+                    exponent = (
+                        math.log(row[key + '_s'] / previous[key + '_s']) /
+                        math.log(row['size'] / previous['size'])
+                    )
+                except (ValueError, ZeroDivisionError):
+                    pass
+            row[key + '_exponent'] = exponent
+        previous = row
+        
+        
+def print_dimension(dimension, unit, results):
+    print()
+    print(dimension + ' (size = ' + unit + ')')
+    rows = [dict(row, size_label=row['size'],
+                 pack_peak_mb=row['pack_peak_bytes'] / 1e6,
+                 unpack_peak_mb=row['unpack_peak_bytes'] / 1e6,
+                 pack_ms=row['pack_s'] * 1e3,
+                 unpack_ms=row['unpack_s'] * 1e3)
+            for row in results]
+    harness.print_table(rows, [
+        ('size_label', 'size', None),
+        ('pack_ms', 'pack ms', ',.3f'),
+        ('pack_ns_per_unit', 'pack ns/unit', ',.1f'),
+        ('pack_exponent', 'pack k', '.2f'),
+        ('pack_peak_mb', 'pack peak MB', ',.3f'),
+        ('unpack_ms', 'unpack ms', ',.3f'),
+        ('unpack_ns_per_unit', 'unpack ns/unit', ',.1f'),
+        ('unpack_exponent', 'unpack k', '.2f'),
+        ('unpack_peak_mb', 'unpack peak MB', ',.3f'),
+    ])
+    
+    
+def main(argv=None):
+    argparser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    argparser.add_argument('--dimension', choices=sorted(DIMENSIONS),
+                           action='append', 
+                           help='Only run this dimension (repeatable).')
+    argparser.add_argument('--max-payload', type=int, default=1 << 26,
+                           help='Largest body size, in bytes.')
+    argparser.add_argument('--max-depth', type=int, default=64)
+    argparser.add_argument('--max-fields', type=int, default=1000)
+    argparser.add_argument('--max-items', type=int, default=10 ** 5)
+    argparser.add_argument('--save', help='Write JSON results to this path.')
+    argparser.add_argument('--compare', 
+                           help='Compare against JSON results at this path.')
+    argparser.add_argument('--threshold', type=float, default=0.1,
+                           help='Relative slowdown to flag as a regression.')
+    argparser.add_argument('--quick', action='store_true',
+                           help='Fewer, shorter runs (for smoke testing).')
+    args = argparser.parse_args(argv)
+    
+    limits = {
+        'payload': args.max_payload,
+        'depth': args.max_depth,
+        'fields': args.max_fields,
+        'items': args.max_items,
+    }
+    
+    results = []
+    for dimension in args.dimension or sorted(DIMENSIONS):
+        unit, rows = run_dimension(dimension, limits[dimension], args.quick)
+        print_dimension(dimension, unit, rows)
+        results.extend(rows)
+        
+    if args.save:
+        harness.save(args.save, 'scaling', results)
+        
+    if args.compare:
+        baseline = harness.load(args.compare)
+        regressions = harness.compare(baseline, results, 'pack_s', 
+                                      args.threshold)
+        regressions += harness.compare(baseline, results, 'unpack_s', 
+                                       args.threshold)
+        if regressions:
+            return 1
+            
+    return 0
+    
+    
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,206 @@
+'''
+Canonical schemas and test vectors for benchmarking. These mirror the
+formats used in tests/trashtest.py.
+
+LICENSING
+-------------------------------------------------
+
+Smartyparse: A python library for smart dynamic binary de/encoding.
+    Copyright (C) 2016 Muterra, Inc.
+    
+    Contributors
+    ------------
+    Nick Badger
+        badg@muterra.io | badg@nickbadger.com | nickbadger.com
+
+    This library is free software; you can redistribute it and/or
+    modify it under the terms of the GNU Lesser General Public
+    License as published by the Free Software Foundation; either
+    version 2.1 of the License, or (at your option) any later version.
+
+    This library is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+    Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public
+    License along with this library; if not, write to the
+    Free Software Foundation, Inc.,
+    51 Franklin Street,
+    Fifth Floor,
+    Boston, MA  02110-1301 USA
+
+------------------------------------------------------
+
+'''
+
+import copy
+
+from smartyparse import SmartyParser
+from smartyparse import ParseHelper
+from smartyparse import ListyParser
+from smartyparse import parsers
+from smartyparse import references
+
+
+# ###############################################
+# Schemas
+# ###############################################
+
+
+def make_tf_1():
+    ''' Generic format: fixed header and two length-linked blobs.
+    '''
+    tf_1 = SmartyParser()
+    tf_1['magic'] = ParseHelper(parsers.Blob(length=4))
+    tf_1['version'] = ParseHelper(parsers.Int32(signed=False))
+    tf_1['cipher'] = ParseHelper(parsers.Int8(signed=False))
+    tf_1['body1_length'] = ParseHelper(parsers.Int32(signed=False))
+    tf_1['body1'] = ParseHelper(parsers.Blob())
+    tf_1['body2_length'] = ParseHelper(parsers.Int32(signed=False))
+    tf_1['body2'] = ParseHelper(parsers.Blob())
+    tf_1.link_length('body1', 'body1_length')
+    tf_1.link_length('body2', 'body2_length')
+    return tf_1
+    
+    
+def make_tf_2():
+    ''' More exhaustive, mostly deterministic format.
+    '''
+    tf_2 = SmartyParser()
+    tf_2['_0'] = ParseHelper(parsers.Null())
+    tf_2['_1'] = ParseHelper(parsers.Int8(signed=True))
+    tf_2['_2'] = ParseHelper(parsers.Int8(signed=False))
+    tf_2['_3'] = ParseHelper(parsers.Int16(signed=True))
+    tf_2['_4'] = ParseHelper(parsers.Int16(signed=False))
+    tf_2['_5'] = ParseHelper(parsers.Int32(signed=True))
+    tf_2['_6'] = ParseHelper(parsers.Int32(signed=False))
+    tf_2['_7'] = ParseHelper(parsers.Int64(signed=True))
+    tf_2['_8'] = ParseHelper(parsers.Int64(signed=False))
+    tf_2['_9'] = ParseHelper(parsers.Float(double=False))
+    tf_2['_10'] = ParseHelper(parsers.Float())
+    tf_2['_11'] = ParseHelper(parsers.ByteBool())
+    tf_2['_12'] = ParseHelper(parsers.Padding(length=4))
+    tf_2['_13_length'] = ParseHelper(parsers.Int32(signed=False))
+    tf_2['_13'] = ParseHelper(parsers.String())
+    tf_2.link_length('_13', '_13_length')
+    return tf_2
+    
+    
+def make_tf_nest(tf_1=None):
+    ''' Two tf_1s, back to back.
+    '''
+    tf_1 = tf_1 or make_tf_1()
+    tf_nest = SmartyParser()
+    tf_nest['first'] = tf_1
+    tf_nest['second'] = tf_1
+    return tf_nest
+    
+    
+def make_tf_nest2(inner=None):
+    ''' A tf_1 (or any other inner format) sandwiched between two ints.
+    '''
+    inner = inner or make_tf_1()
+    tf_nest2 = SmartyParser()
+    tf_nest2['_0'] = ParseHelper(parsers.Int32())
+    tf_nest2['_1'] = inner
+    tf_nest2['_2'] = ParseHelper(parsers.Int32())
+    return tf_nest2
+    
+    
+def make_tag_typed():
+    ''' Self-describing, tag-switched format.
+    '''
+    pastr = SmartyParser()
+    pastr['length'] = ParseHelper(parsers.Int8(signed=False))
+    pastr['body'] = ParseHelper(parsers.String())
+    pastr.link_length('body', 'length')
+    
+    tag_typed = SmartyParser()
+    tag_typed['tag'] = ParseHelper(parsers.Int8(signed=False))
+    tag_typed['toggle'] = None
+    
+    @references(tag_typed)
+    def switch(self, tag):
+        if tag == 0:
+            self['toggle'] = ParseHelper(parsers.Int8(signed=False))
+        elif tag == 1:
+            self['toggle'] = ParseHelper(parsers.Int16(signed=False))
+        elif tag == 2:
+            self['toggle'] = ParseHelper(parsers.Int32(signed=False))
+        elif tag == 3:
+            self['toggle'] = ParseHelper(parsers.Int64(signed=False))
+        else:
+            self['toggle'] = pastr
+    tag_typed['tag'].register_callback('prepack', switch)
+    tag_typed['tag'].register_callback('postunpack', switch)
+    return tag_typed
+    
+    
+def make_tf_list():
+    ''' Implicit-length list of tag_typed items.
+    '''
+    return ListyParser(parsers=[make_tag_typed()])
+    
+    
+def make_tf_exlist():
+    ''' Terminated list of tag_typed items.
+    '''
+    # Unverified literals match anything, which would end the list before
+    # its first item. Terminants are packed from the list's buffer, so 
+    # substitute the literal itself.
+    terminant = ParseHelper(parsers.Literal(b'h'))
+    terminant.register_callback('prepack', lambda __: b'h', modify=True)
+    return ListyParser(parsers=[make_tag_typed()], terminant=terminant)
+    
+    
+# ###############################################
+# Vectors
+# ###############################################
+    
+    
+def make_tv_1(payload=24):
+    return {
+        'magic': b'[00]',
+        'version': 1,
+        'cipher': 2,
+        'body1': b'1' * payload,
+        'body2': b'2' * payload,
+    }
+    
+    
+def make_tv_2(payload=3):
+    return {
+        '_0': None,
+        '_1': -10,
+        '_2': 11,
+        '_3': -300,
+        '_4': 301,
+        '_5': -100000,
+        '_6': 100001,
+        '_7': -10000000000,
+        '_8': 10000000001,
+        '_9': 11.11,
+        '_10': 1e-50,
+        '_11': True,
+        '_12': None,
+        '_13': 'E' * payload,
+    }
+    
+    
+def make_tv_nest(payload=24):
+    return {'first': make_tv_1(payload), 'second': make_tv_1(payload)}
+    
+    
+def make_tv_nest2(payload=24):
+    return {'_0': 42, '_1': make_tv_1(payload), '_2': -42}
+    
+    
+def make_tv_list(items=4):
+    base = [
+        {'tag': 0, 'toggle': 5}, 
+        {'tag': 1, 'toggle': 51}, 
+        {'tag': 65, 'toggle': {'body': 'hello world'}}, 
+        {'tag': 2, 'toggle': 3453}
+    ]
+    return [copy.deepcopy(base[ii % len(base)]) for ii in range(items)]
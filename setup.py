@@ -19,7 +19,7 @@ long_description = (
     'marshalling, serializing, etc library. Capable of dynamic operations, ' +
     'self-describing formats, nested formats, etc. Use it to encode, ' +
     'decode, and develop binary formats quickly and easily. It supports ' +
-    '```python>=3.3```.'
+    '```python>=3.8```.'
 )
 
 # # If we're installing, don't bother building the long_description
@@ -74,8 +74,10 @@ setup(
         # Specify the Python versions you support here. In particular, ensure
         # that you indicate whether you support Python 2, Python 3 or both.
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.5',
-        'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
     ],
 
     # What does your project relate to?
@@ -94,6 +96,10 @@ setup(
     # requirements files see:
     # https://packaging.python.org/en/latest/requirements.html
     install_requires=[],
+    
+    # multiprocessing.shared_memory (used for parallel unpacking) is new
+    # in 3.8
+    python_requires='>=3.8',
 
     # List additional groups of dependencies here (e.g. development
     # dependencies). You can install these using the following syntax,
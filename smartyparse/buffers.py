@@ -0,0 +1,156 @@
+'''
+LICENSING
+-------------------------------------------------
+
+Smartyparse: A python library for smart dynamic binary de/encoding.
+    Copyright (C) 2016 Muterra, Inc.
+    
+    Contributors
+    ------------
+    Nick Badger
+        badg@muterra.io | badg@nickbadger.com | nickbadger.com
+
+    This library is free software; you can redistribute it and/or
+    modify it under the terms of the GNU Lesser General Public
+    License as published by the Free Software Foundation; either
+    version 2.1 of the License, or (at your option) any later version.
+
+    This library is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+    Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public
+    License along with this library; if not, write to the
+    Free Software Foundation, Inc.,
+    51 Franklin Street,
+    Fifth Floor,
+    Boston, MA  02110-1301 USA
+
+------------------------------------------------------
+
+'''
+
+# External deps
+import threading
+
+
+# ###############################################
+# Boilerplate
+# ###############################################
+
+
+__all__ = [
+    'BufferPool',
+    'Lease',
+]
+
+
+# ###############################################
+# Public API
+# ###############################################
+
+
+class Lease:
+    ''' A packed message in a buffer leased from a BufferPool. The 
+    message itself is available as the memoryview Lease.view. Releasing
+    the lease (or leaving its with block) puts the buffer back into the 
+    pool, after which neither view, nor anything sliced from it, may be
+    used.
+    '''
+    __slots__ = ('view', '_pool', '_buffer')
+    
+    def __init__(self, pool, buffer, length):
+        self._pool = pool
+        self._buffer = buffer
+        self.view = memoryview(buffer)[:length]
+        
+    def __enter__(self):
+        return self
+        
+    def __exit__(self, *exc):
+        self.release()
+        
+    def __len__(self):
+        return len(self.view)
+        
+    def __bytes__(self):
+        return self.view.tobytes()
+        
+    def release(self):
+        if self._buffer is not None:
+            self.view.release()
+            self._pool.give(self._buffer)
+            self._buffer = None
+            
+            
+class BufferPool:
+    ''' A threadsafe pool of reusable bytearrays for packing into. Pass
+    it to SmartyParser.pack or ListyParser.pack as pool=, or attach it
+    to a schema as schema.pool, and pack returns a Lease instead of a 
+    new bytearray.
+    
+    Buffers are pooled by size, in powers of two of at least min_size
+    bytes. Each message is packed into a buffer large enough for the
+    schema's previous message, which is grown if needed. Up to 
+    max_buffers buffers of each size are kept; buffers larger than 
+    max_size are never kept.
+    '''
+    
+    def __init__(self, min_size=256, max_size=1 << 24, max_buffers=64):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_buffers = max_buffers
+        # Number of new bytearrays created, for judging the pool's sizing
+        self.allocations = 0
+        # Buffers of at least 2 ** n bytes, by n
+        self._free = {}
+        self._lock = threading.Lock()
+        
+    def __reduce__(self):
+        # Buffers and locks don't travel; the configuration does.
+        return (type(self), (self.min_size, self.max_size, self.max_buffers))
+        
+    def __len__(self):
+        ''' The number of buffers currently available in the pool.
+        '''
+        return sum(len(free) for free in self._free.values())
+        
+    def lease(self, size=0):
+        ''' Returns a bytearray of at least size bytes from the pool.
+        Give it back with give().
+        '''
+        # Smallest power of two that fits
+        bits = (max(size, self.min_size) - 1).bit_length()
+        with self._lock:
+            free = self._free.get(bits)
+            if free:
+                return free.pop()
+            self.allocations += 1
+        return bytearray(1 << bits)
+        
+    def give(self, buffer):
+        ''' Returns a leased bytearray to the pool.
+        '''
+        # Largest power of two that the buffer fits; grown buffers can
+        # be any size.
+        size = len(buffer)
+        if size < self.min_size or size > self.max_size:
+            return
+        bits = size.bit_length() - 1
+        with self._lock:
+            free = self._free.setdefault(bits, [])
+            if len(free) < self.max_buffers:
+                free.append(buffer)
+                
+    def _pack(self, pack_at, obj, size, trusted):
+        ''' Leases a buffer of at least size bytes, and packs obj into
+        it with pack_at (see SmartyParser._pack_at).
+        '''
+        buffer = self.lease(size)
+        try:
+            length = pack_at(obj, buffer, 0, trusted)
+        except BaseException:
+            self.give(buffer)
+            raise
+        return Lease(self, buffer, length)
@@ -0,0 +1,165 @@
+'''
+LICENSING
+-------------------------------------------------
+
+Smartyparse: A python library for smart dynamic binary de/encoding.
+    Copyright (C) 2016 Muterra, Inc.
+    
+    Contributors
+    ------------
+    Nick Badger
+        badg@muterra.io | badg@nickbadger.com | nickbadger.com
+
+    This library is free software; you can redistribute it and/or
+    modify it under the terms of the GNU Lesser General Public
+    License as published by the Free Software Foundation; either
+    version 2.1 of the License, or (at your option) any later version.
+
+    This library is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+    Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public
+    License along with this library; if not, write to the
+    Free Software Foundation, Inc.,
+    51 Franklin Street,
+    Fifth Floor,
+    Boston, MA  02110-1301 USA
+
+------------------------------------------------------
+
+'''
+
+# External deps
+import collections
+
+
+# ###############################################
+# Boilerplate
+# ###############################################
+
+
+__all__ = [
+    'PackCache',
+]
+
+
+# ###############################################
+# Helpers
+# ###############################################
+
+
+def _freeze(obj):
+    ''' Returns a hashable equivalent of obj, for use as a cache key.
+    Raises TypeError if that isn't possible.
+    '''
+    # Mappings (including SmartyParseObjects) and sequences are frozen
+    # recursively. Byte-likes all pack identically.
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        return bytes(obj)
+    elif callable(getattr(obj, 'items', None)):
+        return frozenset((key, _freeze(value)) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        return tuple(_freeze(item) for item in obj)
+    # Include the type, since eg 1 == 1.0 == True, but they may well pack
+    # differently (or with different parsers).
+    hash(obj)
+    return (type(obj), obj)
+
+
+# ###############################################
+# Public API
+# ###############################################
+
+
+class PackCache:
+    ''' LRU cache of packed field values, for SmartyParser.cache_field.
+    Values are keyed on a frozen copy of the object packed, and the
+    cache holds at most max_bytes of packed data.
+    
+    Not threadsafe on its own; SmartyParsers only use it while holding
+    their lock.
+    '''
+    
+    def __init__(self, max_bytes=1 << 20):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Objects that couldn't be frozen, and so were never cached
+        self.uncacheable = 0
+        self.size = 0
+        self._entries = collections.OrderedDict()
+        
+    def __reduce__(self):
+        # Start afresh wherever we're loaded
+        return (type(self), (self.max_bytes,))
+        
+    def __len__(self):
+        return len(self._entries)
+        
+    def key(self, obj, exclude=()):
+        ''' Returns the cache key for obj, or None if it has none. Any
+        keys of obj in exclude (eg, linked length fields, which packing
+        fills in) are left out.
+        '''
+        try:
+            if exclude and callable(getattr(obj, 'items', None)):
+                return frozenset(
+                    (key, _freeze(value)) for key, value in obj.items()
+                    if key not in exclude
+                )
+            return _freeze(obj)
+        except TypeError:
+            self.uncacheable += 1
+            return None
+            
+    def get(self, key):
+        ''' Returns the packed bytes for key, or None if they aren't
+        cached.
+        '''
+        try:
+            packed = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return packed
+        
+    def put(self, key, packed):
+        ''' Caches packed for key, evicting the least recently used
+        entries as needed to stay within max_bytes.
+        '''
+        if len(packed) > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.size -= len(old)
+            
+        self._entries[key] = packed
+        self.size += len(packed)
+        while self.size > self.max_bytes:
+            __, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+            self.evictions += 1
+            
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+        
+    def stats(self):
+        ''' Returns a dict of hits, misses, hit_rate, evictions,
+        uncacheable, entries and bytes.
+        '''
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'uncacheable': self.uncacheable,
+            'entries': len(self._entries),
+            'bytes': self.size,
+        }
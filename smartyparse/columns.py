@@ -0,0 +1,475 @@
+'''
+LICENSING
+-------------------------------------------------
+
+Smartyparse: A python library for smart dynamic binary de/encoding.
+    Copyright (C) 2016 Muterra, Inc.
+    
+    Contributors
+    ------------
+    Nick Badger
+        badg@muterra.io | badg@nickbadger.com | nickbadger.com
+
+    This library is free software; you can redistribute it and/or
+    modify it under the terms of the GNU Lesser General Public
+    License as published by the Free Software Foundation; either
+    version 2.1 of the License, or (at your option) any later version.
+
+    This library is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+    Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public
+    License along with this library; if not, write to the
+    Free Software Foundation, Inc.,
+    51 Franklin Street,
+    Fifth Floor,
+    Boston, MA  02110-1301 USA
+
+------------------------------------------------------
+
+'''
+
+# External deps
+import array
+
+# Internal deps
+from . import parsers
+from .parsers import ParseError
+from .core import ParseHelper
+from .core import SmartyParser
+from .core import _LengthLink
+from .core import _projection
+from .core import _advance
+
+
+# ###############################################
+# Boilerplate
+# ###############################################
+
+
+__all__ = [
+    'unpack_columns',
+    'VarColumn',
+]
+
+
+# ###############################################
+# Helpers
+# ###############################################
+
+
+# How the end of each field is found
+_FIXED = 0
+_LINKED = 1
+_DELIMITED = 2
+
+# Normalizes packed ByteBools to 0 and 1, as struct would
+_BOOLS = bytes([0]) + bytes([1]) * 255
+
+
+class _RowsOnly(Exception):
+    ''' Raised while flattening a schema that can't be decoded a column
+    at a time (eg because of callbacks), which is then unpacked row by
+    row instead.
+    '''
+
+
+class _Field:
+    ''' One field of a flattened schema: how to find its extent within
+    each message, and, if it's wanted, the column its values go into.
+    Values are copied straight out of the buffer, without ever being
+    unpacked into objects of their own.
+    '''
+    
+    def __init__(self, path, parser, kind, wanted, length_of=None):
+        self.path = path
+        self.parser = parser
+        self.kind = kind
+        self.width = parser.length if kind == _FIXED else None
+        self.wanted = wanted
+        # The path of the field whose length this holds (link_length)
+        self.length_of = length_of
+        self.raw = None
+        self.column = None
+        # Padding and Null always unpack to None
+        self.empty = False
+        if wanted:
+            self._new_column()
+            
+    def _new_column(self):
+        parser = self.parser
+        if isinstance(parser, parsers._StructParserBase):
+            self.typecode = parser._array_typecode()
+            if self.typecode is None:
+                raise _RowsOnly()
+            self.raw = bytearray()
+        elif isinstance(parser, parsers.CString):
+            self.column = VarColumn(parser.encoding)
+        elif isinstance(parser, parsers.String):
+            self.column = VarColumn(parser.encoding)
+        elif isinstance(parser, parsers.Blob) or (
+            isinstance(parser, parsers.Literal) and parser._verify):
+                self.column = VarColumn()
+        elif isinstance(parser, parsers.Padding) or parser is parsers.Null or \
+            isinstance(parser, parsers.Null):
+                self.empty = True
+        else:
+            raise _RowsOnly()
+            
+    def _value(self, chunk):
+        ''' Trims (or checks) the packed bytes of a value, leaving only
+        what belongs in the column.
+        '''
+        parser = self.parser
+        if isinstance(parser, parsers.CString):
+            return chunk[:len(chunk) - len(parser.terminator)]
+        elif isinstance(parser, parsers.String) and parser.length is not None:
+            # Strip whole pad units, as String.unpack does
+            pad = parser._pad
+            end = len(chunk)
+            while end >= len(pad) and chunk[end - len(pad):end] == pad:
+                end -= len(pad)
+            return chunk[:end]
+        elif isinstance(parser, parsers.Literal) and chunk != parser.value:
+            raise ParseError('Mismatched literal: received ' + 
+                             str(bytes(chunk)) + ', expected ' + 
+                             str(parser.value), reason='literal_mismatch')
+        return chunk
+        
+    def collect(self, data, start, end):
+        ''' Appends the value at data[start:end] to the column.
+        '''
+        if self.raw is not None:
+            self.raw += data[start:end]
+        elif not self.empty:
+            column = self.column
+            column.values += self._value(data[start:end])
+            column.offsets.append(len(column.values))
+            
+    def gather(self, data, offset, stride, rows):
+        ''' Collects the values at offset within each of rows messages 
+        of stride bytes, a byte lane at a time.
+        '''
+        width = self.width
+        if self.empty:
+            return
+        elif width == 1:
+            gathered = bytearray(data[offset::stride])
+        else:
+            gathered = bytearray(rows * width)
+            for lane in range(width):
+                gathered[lane::width] = data[offset + lane::stride]
+                
+        if self.raw is not None:
+            self.raw = gathered
+        elif isinstance(self.parser, parsers.String):
+            # Pad has to come off value by value
+            for row in range(rows):
+                self.collect(gathered, row * width, (row + 1) * width)
+        else:
+            if isinstance(self.parser, parsers.Literal) and \
+                gathered != self.parser.value * rows:
+                    for row in range(rows):
+                        self._value(gathered[row * width:(row + 1) * width])
+            self.column.values = gathered
+            self.column.offsets = array.array(
+                'Q', range(0, rows * width + 1, width)
+            )
+            
+    def finish(self, rows):
+        if self.empty:
+            return [None] * rows
+        elif self.raw is None:
+            return self.column
+            
+        raw = self.raw
+        if self.parser._packer.format[-1] == '?':
+            raw = raw.translate(_BOOLS)
+        column = array.array(self.typecode)
+        column.frombytes(raw)
+        if not self.parser._native_order():
+            column.byteswap()
+        return column
+        
+    def _enter(self, exc, offset, data):
+        for name in reversed(self.path):
+            exc._enter(name)
+        exc._locate(offset, data=data)
+        
+        
+def _flatten(schema, wanted, prefix=(), fields=None):
+    ''' Flattens schema (and any nested SmartyParsers) into a list of
+    _Fields, raising _RowsOnly if it can't be decoded column-wise.
+    '''
+    if fields is None:
+        fields = []
+    if schema.callback_preunpack or schema.callback_postunpack or \
+        schema.align is not None or schema._offset_links or \
+        schema._count_links:
+            raise _RowsOnly()
+    if wanted and not wanted.keys() <= schema._control.keys():
+        unknown = sorted(wanted.keys() - schema._control.keys())
+        raise ValueError('Unknown fields: ' + repr(unknown))
+        
+    # Length fields (from link_length), by the name of their data
+    lengths = {}
+    linked = {}
+    for name, parsable in schema._control.items():
+        post = getattr(parsable, '_callback_postunpack', None)
+        if not post:
+            continue
+        func = post.func
+        if getattr(func, '__func__', None) is not _LengthLink.postunpack_len \
+            or func.__self__.parent is not schema:
+                raise _RowsOnly()
+        lengths[name] = func.__self__.data_name
+        
+    for name, parsable in schema._control.items():
+        path = prefix + (name,)
+        if wanted is None:
+            subwanted = None
+        else:
+            # Unrequested subtrees are still walked, to skip over them
+            subwanted = wanted.get(name, {})
+            
+        if isinstance(parsable, SmartyParser):
+            _flatten(parsable, subwanted, path, fields)
+            continue
+        elif not isinstance(parsable, ParseHelper) or \
+            parsable.callback_preunpack:
+                raise _RowsOnly()
+        elif subwanted:
+            raise ValueError('Cannot select subfields of ' + name + 
+                             ', which is not a SmartyParser.')
+                             
+        parser = parsable.parser
+        if name in linked:
+            kind = _LINKED
+        elif name in lengths.values():
+            # Data before its length can't be found on the way past
+            raise _RowsOnly()
+        elif parser.delimited:
+            kind = _DELIMITED
+        elif parser.length is not None:
+            kind = _FIXED
+        else:
+            raise _RowsOnly()
+            
+        length_of = None
+        if name in lengths:
+            if not isinstance(parser, parsers._StructParserBase):
+                raise _RowsOnly()
+            length_of = prefix + (lengths[name],)
+            linked[lengths[name]] = name
+            
+        is_wanted = (wanted is None or name in wanted) and \
+                    name not in schema._exclude_from_obj
+        fields.append(_Field(path, parser, kind, is_wanted, length_of))
+        
+    return fields
+    
+    
+def _gather(fields, data):
+    ''' Decodes consecutive, fixed-length messages column by column.
+    Returns the number of messages.
+    '''
+    stride = sum(field.width for field in fields)
+    if not data:
+        return 0
+    # Zero-length messages can't be delimited at all
+    _advance(0, stride, data)
+    if len(data) % stride:
+        raise ParseError('Final message is truncated.', 
+                         reason='length_mismatch', 
+                         offset=len(data) - len(data) % stride, data=data)
+                         
+    rows = len(data) // stride
+    offset = 0
+    for field in fields:
+        if field.wanted:
+            try:
+                field.gather(data, offset, stride, rows)
+            except ParseError as exc:
+                field._enter(exc, offset, data)
+                raise
+        offset += field.width
+    return rows
+    
+    
+def _walk(fields, data):
+    ''' Decodes consecutive, variable-length messages, reading only the
+    length fields and terminators needed to find each value. Returns the
+    number of messages.
+    '''
+    end_of_data = len(data)
+    rows = 0
+    seeker = 0
+    while seeker < end_of_data:
+        start = seeker
+        lengths = {}
+        for field in fields:
+            try:
+                if field.kind == _FIXED:
+                    end = seeker + field.width
+                elif field.kind == _LINKED:
+                    end = seeker + lengths[field.path]
+                else:
+                    end = seeker + field.parser.find_length(data[seeker:])
+                    
+                if end > end_of_data:
+                    raise ParseError('Message is truncated.', 
+                                     reason='length_mismatch')
+                if field.length_of is not None:
+                    lengths[field.length_of] = \
+                        field.parser._packer.unpack_from(data, seeker)[0]
+                if field.wanted:
+                    field.collect(data, seeker, end)
+                    
+            except ParseError as exc:
+                field._enter(exc, seeker, data)
+                raise
+            seeker = end
+            
+        seeker = _advance(start, seeker - start, data)
+        rows += 1
+    return rows
+
+
+def _new_column(parsable):
+    if isinstance(parsable, ParseHelper):
+        parser = parsable.parser
+        if isinstance(parser, parsers._StructParserBase):
+            typecode = parser._array_typecode()
+            if typecode is not None:
+                return array.array(typecode)
+        elif isinstance(parser, (parsers.String, parsers.CString)):
+            return VarColumn(parser.encoding)
+        elif isinstance(parser, (parsers.Blob, parsers.Literal)):
+            return VarColumn()
+    return []
+    
+    
+def _plan(schema, wanted, prefix=(), plan=None):
+    ''' Returns a list of (path, column) for every field of schema (or
+    those in the projection tree wanted), flattening nested
+    SmartyParsers into their dotted paths.
+    '''
+    if plan is None:
+        plan = []
+    for name, parsable in schema._control.items():
+        # Linked lengths aren't part of the unpacked object
+        if name in schema._exclude_from_obj:
+            continue
+        if wanted is not None and name not in wanted:
+            continue
+            
+        path = prefix + (name,)
+        subwanted = None if wanted is None else wanted[name]
+        if isinstance(parsable, SmartyParser):
+            _plan(parsable, subwanted, path, plan)
+        else:
+            plan.append((path, _new_column(parsable)))
+    return plan
+    
+    
+def _unpack_rows(schema, data, wanted):
+    ''' Unpacks each message in turn, and then transposes them into
+    columns. Used for schemas that can't be decoded column-wise.
+    '''
+    plan = _plan(schema, wanted)
+    appenders = [(path, column.append) for path, column in plan]
+    
+    seeker = 0
+    while seeker < len(data):
+        obj = schema.unpack(data[seeker:], fields=wanted)
+        seeker = _advance(seeker, schema.length, data)
+        
+        for path, append in appenders:
+            value = obj
+            for name in path:
+                value = value[name]
+            append(value)
+            
+    return {'.'.join(path): column for path, column in plan}
+
+
+# ###############################################
+# Public API
+# ###############################################
+
+
+class VarColumn:
+    ''' A column of variable-length values, stored Arrow-style as one
+    contiguous bytearray of values, and an array.array('Q') of offsets
+    into it: value i is values[offsets[i]:offsets[i + 1]]. Strings are
+    stored encoded (with encoding), and decoded on access.
+    '''
+    
+    def __init__(self, encoding=None):
+        self.encoding = encoding
+        self.offsets = array.array('Q', [0])
+        self.values = bytearray()
+        
+    def __len__(self):
+        return len(self.offsets) - 1
+        
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('Column index out of range.')
+            
+        value = bytes(self.values[self.offsets[index]:self.offsets[index + 1]])
+        if self.encoding is not None:
+            return value.decode(self.encoding)
+        return value
+        
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+            
+    def append(self, value):
+        if self.encoding is not None:
+            value = value.encode(self.encoding)
+        self.values += value
+        self.offsets.append(len(self.values))
+        
+        
+def unpack_columns(schema, source, fields=None):
+    ''' Unpacks the consecutive messages in source into columns, one per
+    field, returned as a dict of {dotted path: column}. Nested 
+    SmartyParsers are flattened into the columns of their fields.
+    
+    Integer, float and ByteBool fields become array.arrays. Blob,
+    Literal, String and CString fields become VarColumns. Anything else
+    (eg ListyParsers) is collected into a plain list.
+    
+    fields selects only some of the fields, as with SmartyParser.unpack;
+    the rest are skipped over without being decoded.
+    
+    Schemas made up of fixed-length fields, length-linked fields and
+    CStrings (without any other callbacks) are decoded straight into 
+    their columns, without unpacking any messages: fixed-length 
+    messages a column at a time, by stride, and variable-length ones by
+    reading only the lengths and terminators needed to find each value.
+    String values are only decoded (and checked) when accessed. Other 
+    schemas are unpacked message by message.
+    '''
+    wanted = _projection(fields)
+    data = memoryview(source)
+    
+    try:
+        flattened = _flatten(schema, wanted)
+    except _RowsOnly:
+        return _unpack_rows(schema, data, wanted)
+        
+    if all(field.kind == _FIXED for field in flattened):
+        rows = _gather(flattened, data)
+    else:
+        rows = _walk(flattened, data)
+    return {'.'.join(field.path): field.finish(rows) 
+            for field in flattened if field.wanted}
@@ -37,11 +37,15 @@ import abc
 import collections
 import inspect
 import functools
+import operator
 import threading
+import array
+import struct
 
 # Internal deps
 from . import parsers
 from .parsers import ParseError
+from .caching import PackCache
 
 
 # ###############################################
@@ -53,6 +57,7 @@ __all__ = [
     'ParseHelper',
     'SmartyParser',
     'ListyParser',
+    'Reference',
     'references',
     'ParseError'
 ]
@@ -265,6 +270,175 @@ class _SmartyparseCallback():
         s = str(func) + ': modify=' + str(self.modify)
         return s
         
+    def __reduce__(self):
+        # NOOP is a lambda, and therefore can't be pickled; None is
+        # restored to NOOP by the func setter. Pass func as state rather
+        # than as an argument, so that it can reference (potentially
+        # cyclically) the parsable that owns us.
+        if self.func == self.NOOP:
+            func = None
+        else:
+            func = self.func
+        return (type(self), (None, self.modify), func)
+        
+    def __setstate__(self, func):
+        self.func = func
+        
+        
+class _LengthLink:
+    ''' The callbacks generated by SmartyParser.link_length. These are
+    methods of a (picklable) object instead of closures, so that linked
+    SmartyParsers can be persisted and shipped to worker processes.
+    '''
+    def __init__(self, parent, data_name):
+        self.parent = parent
+        self.data_name = data_name
+        
+    def postunpack_len(self, unpacked_length):
+        # print('postunpack length ', unpacked_length)
+        self.parent._control[self.data_name].length = unpacked_length
+        
+    def prepack_dat(self, obj_dat):
+        del self.parent._control[self.data_name].length
+        
+    def prepack_len(self, obj_len):
+        # This is a deferred call, so we have a window to grab the real
+        # length from the parser.
+        return self.parent._control[self.data_name].length
+        
+
+class _CountLink:
+    ''' The callbacks generated by SmartyParser.link_count, picklable for
+    the same reasons as _LengthLink.
+    '''
+    def __init__(self, parent, items_name):
+        self.parent = parent
+        self.items_name = items_name
+        
+    def postunpack_count(self, count):
+        items = self.parent._control[self.items_name]
+        if isinstance(items, ListyParser):
+            items.count = count
+            stride = items._stride()
+            if stride is None:
+                # The list finds its own length as it goes
+                del items.length
+            else:
+                items.length = count * stride
+        else:
+            items.length = count * items.parser.element.length
+            
+    def prepack_items(self, obj_items):
+        # Don't hold over anything from the last unpack
+        items = self.parent._control[self.items_name]
+        del items.length
+        if isinstance(items, ListyParser):
+            items.count = None
+            
+            
+def _advance(seeker, length, data):
+    ''' Returns the position just past a message of length at seeker,
+    when walking consecutive messages. Zero-length messages would never
+    advance the walk, so they can't be delimited at all.
+    '''
+    if not length:
+        raise ParseError('Zero-length message; consecutive messages cannot '
+                         'be delimited.', reason='indeterminate_length', 
+                         offset=seeker, data=data)
+    return seeker + length
+
+
+def _zero_pad(packed, seeker, padding):
+    ''' Zeroes padding bytes of packed at seeker, returning the position
+    just past them.
+    '''
+    if padding:
+        packed[seeker:seeker + padding] = bytes(padding)
+    return seeker + padding
+
+
+def _self_delimiting(parsable):
+    ''' Returns True if parsable can find its own length in the data 
+    that follows it, without being told it (or running to the end).
+    '''
+    if isinstance(parsable, ParseHelper):
+        return parsable.parser.delimited or parsable.parser.length is not None
+    elif isinstance(parsable, ListyParser):
+        return parsable.terminant is not None
+    elif isinstance(parsable, SmartyParser):
+        # Sections were checked when they were linked
+        return all(
+            name in parsable._offset_links or parsable._is_linked(name) or
+            _self_delimiting(field) 
+            for name, field in parsable._control.items()
+        )
+    return False
+
+
+def _static_length(parsable):
+    ''' Returns the length of parsable if it's the same for every value,
+    or None otherwise.
+    '''
+    if isinstance(parsable, ParseHelper):
+        if parsable.parser.delimited:
+            return None
+        return parsable.parser.length
+    elif isinstance(parsable, SmartyParser):
+        # Sections are as long as whatever they hold
+        if parsable._offset_links:
+            return None
+        alignments, struct_align, __ = parsable._get_layout()
+        total = 0
+        for name, field in parsable._control.items():
+            length = _static_length(field)
+            if length is None:
+                return None
+            if alignments is not None:
+                total += -total % alignments[name]
+            total += length
+        if alignments is not None:
+            total += -total % struct_align
+        return total
+    return None
+    
+    
+def _natural_alignment(parsable):
+    ''' Returns the alignment a C compiler would give parsable as a
+    struct member: numbers align to their size, aligned SmartyParsers to
+    their largest member, and everything else to bytes.
+    '''
+    if isinstance(parsable, ParseHelper):
+        parser = parsable.parser
+        if isinstance(parser, parsers.Array):
+            parser = parser.element
+        if isinstance(parser, parsers._StructParserBase):
+            return parser.length
+    elif isinstance(parsable, SmartyParser) and parsable.align is not None:
+        return parsable._get_layout()[1]
+    return 1
+    
+    
+def _struct_code(parsable):
+    ''' Returns (byte order, struct format) for a field that can be
+    folded into a precompiled struct, or None if it can't. Single bytes
+    have no byte order.
+    '''
+    if not isinstance(parsable, ParseHelper) or \
+        parsable.callback_preunpack or parsable.callback_postunpack or \
+        parsable.callback_prepack or parsable.callback_postpack:
+            return None
+            
+    parser = parsable.parser
+    if isinstance(parser, parsers._StructParserBase):
+        order = None if parser.length == 1 else parser._packer.format[0]
+        return order, parser._packer.format[1:]
+    elif type(parser) is parsers.Blob and parser.length is not None and \
+        parser._intern is None:
+            return None, str(parser.length) + 's'
+    elif isinstance(parser, parsers.Padding):
+        return None, str(parser.length) + 'x'
+    return None
+        
 
 class _SPOMeta(type):
     ''' Metaclass for SmartyParseObjects created through _smartyobject.
@@ -382,6 +556,11 @@ def _smartyobject(fieldnames):
                 return self[key]
             except AttributeError:
                 return default
+                
+        def __reduce__(self):
+            # The class itself is dynamic, so pickle by fieldnames instead
+            return _rebuild_smartyobject, (tuple(self.__slots__),
+                                           dict(self.items()))
             
         def __repr__(self):
             c = type(self).__name__
@@ -408,6 +587,54 @@ def _smartyobject(fieldnames):
     return SmartyParseObject
 
 
+def _projection(fields):
+    ''' Converts an iterable of dotted field paths into a tree of dicts,
+    where None selects the whole field:
+    ['a', 'b.c', 'b.d'] -> {'a': None, 'b': {'c': None, 'd': None}}
+    Trees (and None, for everything) are passed through.
+    '''
+    if fields is None or isinstance(fields, dict):
+        return fields
+    if isinstance(fields, str):
+        raise TypeError('fields must be an iterable of field names.')
+        
+    tree = {}
+    for path in fields:
+        node = tree
+        *parents, leaf = path.split('.')
+        for name in parents:
+            # Selecting the whole parent trumps selecting its children
+            if name in node and node[name] is None:
+                break
+            node = node.setdefault(name, {})
+        else:
+            node[leaf] = None
+    return tree
+
+
+def _as_bytearray(packed):
+    ''' Packing always returns bytearrays, but modifying postpack
+    callbacks may have returned something else.
+    '''
+    if isinstance(packed, bytearray):
+        return packed
+    return bytearray(packed)
+
+
+@functools.lru_cache(maxsize=256)
+def _cached_smartyobject(fieldnames):
+    ''' Shares SmartyParseObject classes between unpickled objects, since
+    class creation is expensive.
+    '''
+    return _smartyobject(list(fieldnames))
+    
+    
+def _rebuild_smartyobject(fieldnames, values):
+    ''' Unpickles a SmartyParseObject.
+    '''
+    return _cached_smartyobject(fieldnames)(**values)
+
+
 class _ParsableBase(metaclass=abc.ABCMeta):
     ''' Base class for anything parsable. Subclassed by both ParseHelper
     and SmartyParser.
@@ -442,6 +669,25 @@ class _ParsableBase(metaclass=abc.ABCMeta):
         for call_on, func_def in callbacks.items():
             self.register_callback(call_on=call_on, *func_def)
         
+    def __getstate__(self):
+        ''' Parsables are picklable (as long as their callbacks are), so
+        that finished schemas can be persisted, or sent to workers. Locks
+        and any instrumentation (profiling, metrics) are left behind.
+        '''
+        state = self.__dict__.copy()
+        del state['_mutex']
+        state.pop('pack', None)
+        state.pop('unpack', None)
+        # SmartyParsers and ListyParsers only learn their lengths while
+        # parsing, so don't persist whatever the last run left behind.
+        if self.parser is self:
+            state['_length'] = None
+        return state
+        
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._mutex = threading.Lock()
+        
     def _infer_length(self, data_length=None):
         ''' Attempts to infer length from the parser, or, barring that,
         from the data itself.
@@ -472,11 +718,13 @@ class _ParsableBase(metaclass=abc.ABCMeta):
         if self_expectation != None and self_expectation != inferred:
             raise ParseError('Incorrect expectations while '
                                 'inferring length. Did you try to assign '
-                                'a different length to a fixed-length parser?')
+                                'a different length to a fixed-length parser?',
+                                reason='length_mismatch')
         if data_expectation != None and data_expectation != inferred:
             raise ParseError('Expectation/reality misalignment while '
                                 'inferring length. Data length does not match '
-                                'inferred length.')
+                                'inferred length.',
+                                reason='length_mismatch')
             
         # And finally, update our length
         self.length = inferred
@@ -626,6 +874,55 @@ class _ParsableBase(metaclass=abc.ABCMeta):
     def unpack(self, data):
         pass
         
+    def can_unpack(self, data, offset=0):
+        ''' Cheaply checks whether data at offset could possibly be
+        unpacked by self. False means it definitely cannot; True means
+        it might (unpack may still raise). Used by ListyParsers to skip
+        candidates without raising (and catching) ParseErrors.
+        '''
+        return True
+        
+    def can_pack(self, obj):
+        ''' Cheaply checks whether obj could possibly be packed by self.
+        False means it definitely cannot; True means it might (pack may
+        still raise).
+        '''
+        return True
+        
+    def profile(self):
+        ''' Returns an (already enabled) FieldProfiler for self, which
+        records per-field timings and counts until disabled. See
+        smartyparse.profiling.FieldProfiler.
+        '''
+        from .profiling import FieldProfiler
+        profiler = FieldProfiler(self)
+        profiler.enable()
+        return profiler
+
+    def track(self, name, registry=None):
+        ''' Records calls, bytes, errors and latencies for every pack
+        and unpack of self under name, in registry (defaulting to the
+        process-wide smartyparse.metrics.registry).
+        '''
+        if registry is None:
+            from .metrics import registry
+        registry.track(self, name)
+
+    def untrack(self, registry=None):
+        ''' Stops recording metrics for self.
+        '''
+        if registry is None:
+            from .metrics import registry
+        registry.untrack(self)
+
+    def _measure(self, unpack_from):
+        ''' Returns the length of the object at self.offset within
+        unpack_from, decoding as little as possible along the way.
+        Parsables that can't be skipped are simply unpacked.
+        '''
+        self.unpack(unpack_from)
+        return self.length
+        
     def _pack_padding(self, pack_into):
         ''' Instead of packing an object, packs in padding.
         '''
@@ -648,6 +945,59 @@ def references(referent):
             return func(referent, *args, **kwargs)
         return injected
     return referent_wrapper
+    
+    
+class Reference:
+    ''' A lazy reference to a section of an unpacked message, as created
+    by SmartyParser.link_offset. Nothing is parsed until deref() is 
+    called, after which the result is kept.
+    
+    References hold onto the buffer they were unpacked from, so any 
+    mmap (etc) backing it must stay open until they're dereferenced.
+    Pickling a Reference copies just its section out of the buffer.
+    '''
+    __slots__ = ('parsable', 'data', 'position', 'length', '_value', 
+                 '_parsed')
+    
+    def __init__(self, parsable, data, position, length=None):
+        self.parsable = parsable
+        self.data = data
+        self.position = position
+        self.length = length
+        self._value = None
+        self._parsed = False
+        
+    def deref(self):
+        ''' Unpacks (if needed) and returns the referenced section.
+        '''
+        if not self._parsed:
+            if not 0 <= self.position <= len(self.data):
+                raise ParseError('Section offset is outside of the data.', 
+                                 reason='length_mismatch', 
+                                 offset=self.position, data=self.data)
+            if self.length is None:
+                self._value = self.parsable.unpack(self.data[self.position:])
+            else:
+                # Whatever the parsable was left with is stale by now
+                self.parsable.length = self.length
+                self._value = self.parsable.unpack(
+                    self.data[self.position:self.position + self.length]
+                )
+            self._parsed = True
+        return self._value
+        
+    def __reduce__(self):
+        if self.length is None:
+            section = bytes(self.data[self.position:])
+        else:
+            section = bytes(
+                self.data[self.position:self.position + self.length]
+            )
+        return (type(self), (self.parsable, section, 0, self.length))
+        
+    def __repr__(self):
+        return '<Reference to ' + type(self.parsable).__name__ + \
+               ' at ' + str(self.position) + '>'
 
 
 class StaticParser():
@@ -713,8 +1063,10 @@ class ParseHelper(_ParsableBase):
         # instead of defining __len__ or returning an ambiguous zero.
         
         # Test self._length first, self.parser.length second
-        # Will raise later if mismatch
-        return self._length or self.parser.length
+        # Will raise later if mismatch. Zero is a perfectly good length.
+        if self._length is None:
+            return self.parser.length
+        return self._length
         
     @length.setter
     def length(self, length):
@@ -724,7 +1076,7 @@ class ParseHelper(_ParsableBase):
     def length(self):
         self._length = None
         
-    def unpack(self, unpack_from):
+    def unpack(self, unpack_from, trusted=False):
         # Check/infer lengths. Awkwardly redundant with unpack_from, but
         # necessary to ensure data length always matches parser length
         # DON'T PASS unpack_from, because it won't do any good. Known
@@ -732,66 +1084,150 @@ class ParseHelper(_ParsableBase):
         # slice to the end, which build_slice will handle.
         
         with self._mutex:
-            self._infer_length()
-            self._build_slice()
-            data = unpack_from[self.slice]
+            try:
+                # Delimited parsers find their own length, every time
+                if self.parser.delimited:
+                    self.length = self.parser.find_length(
+                        memoryview(unpack_from)[self.offset:]
+                    )
+                # Trusted data can skip checking lengths for consistency.
+                # Without any data, inference could never change them.
+                if not trusted:
+                    self._infer_length()
+                self._build_slice()
+                data = unpack_from[self.slice]
+                # Linked lengths and counts come from the data itself, so
+                # slicing past the end of it is a truncation, not a
+                # shorter value
+                if not trusted and self.length is not None and \
+                        len(data) < self.length:
+                    raise ParseError('Data is shorter than the field.',
+                                     reason='length_mismatch')
+                    
+                # Pre-unpack calls on data
+                # Modification vs non-modification is handled by the
+                # SmartyparseCallback
+                data = self._callback_preunpack(data)
                 
-            # Pre-unpack calls on data
-            # Modification vs non-modification is handled by the
-            # SmartyparseCallback
-            data = self._callback_preunpack(data)
-            
-            # Parse data -> obj
-            obj = self.parser.unpack(data)
-            
-            # Post-unpack calls on obj
-            # Modification vs non-modification is handled by the
-            # SmartyparseCallback
-            obj = self._callback_postunpack(obj)
+                # Parse data -> obj
+                obj = self.parser.unpack(data)
+                
+                # Post-unpack calls on obj
+                # Modification vs non-modification is handled by the
+                # SmartyparseCallback
+                obj = self._callback_postunpack(obj)
+                
+            except ParseError as exc:
+                # Just references: nothing is rendered unless needed
+                available = max(len(unpack_from) - self.offset, 0)
+                if self.length is not None:
+                    available = min(available, self.length)
+                exc._locate(self.offset, self.length, available, unpack_from)
+                raise
             
             return obj
         
-    def pack(self, obj, pack_into):
+    def pack(self, obj, pack_into, trusted=False):
         with self._mutex:
+            # Delimited lengths are only known once packed, so don't hold
+            # over any length from the previous run.
+            if self.parser.delimited:
+                del self.length
+                
             # First check to see if the bytearray is large enough
             if len(pack_into) < self.offset:
                 # Too small to even start. Python will be hard-to-predict
-                # here (see above). Raise.
-                # print(this_obj)
-                # print(fieldname)
-                logger.error(
-                    'Parser packing index too large. Current state:\n' +
-                    '    obj to pack:' + str(obj) + '\n' +
-                    '    current offset: ' + str(self.offset) + '\n' +
-                    '    current packed: ' + str(pack_into) + '\n'
-                )
+                # here (see above). Raise. Don't format anything unless
+                # it's actually going to be logged: obj and pack_into may
+                # be huge.
+                if logger.isEnabledFor(logging.ERROR):
+                    logger.error(
+                        'Parser packing index too large: offset %d, but '
+                        'only %d bytes packed (packing %s).',
+                        self.offset, len(pack_into), type(obj).__name__
+                    )
                 raise ParseError(
-                    'Attempt to assign out of range; cannot infer padding.'
+                    'Attempt to assign out of range; cannot infer padding.',
+                    reason='out_of_range', offset=self.offset, 
+                    data=pack_into
                 )
                 
-            # Next, build the slice.
-            self._build_slice(pack_into=pack_into)
-            
-            # Pre-pack calls on obj
-            # Modification vs non-modification is handled by the
-            # SmartyparseCallback
-            obj = self._callback_prepack(obj)
-            
-            # Parse obj -> data
-            data = self.parser.pack(obj)
-            
-            # Post-pack calls on data
-            # Modification vs non-modification is handled by the
-            # SmartyparseCallback
-            data = self._callback_postpack(data)
+            data = None
+            try:
+                # Next, build the slice.
+                self._build_slice(pack_into=pack_into)
                 
-            # Now infer/check length and pack it into the object
-            self._infer_length(len(data))
-            pack_into[self.slice] = data
+                # Pre-pack calls on obj
+                # Modification vs non-modification is handled by the
+                # SmartyparseCallback
+                obj = self._callback_prepack(obj)
+                
+                # Parse obj -> data
+                data = self.parser.pack(obj)
+                
+                # Post-pack calls on data
+                # Modification vs non-modification is handled by the
+                # SmartyparseCallback
+                data = self._callback_postpack(data)
+                    
+                # Now infer/check length and pack it into the object
+                if not trusted:
+                    self._infer_length(len(data))
+                elif self.parser.length is None:
+                    self._length = len(data)
+                # Lengths only known once packed leave the slice open-ended,
+                # which would truncate anything in pack_into past the field.
+                if self._slice.stop is None:
+                    self._build_slice(pack_into=pack_into)
+                pack_into[self.slice] = data
+                
+            except ParseError as exc:
+                actual = None if data is None else len(data)
+                exc._locate(self.offset, self.length, actual, pack_into)
+                raise
         
             # And for consistency, return the packed object
             return pack_into
         
+    def can_unpack(self, data, offset=0):
+        # Modified data could be anything
+        if self._callback_preunpack.modify:
+            return True
+        # Only static lengths count: self._length may be left over from
+        # the last item (eg delimited or length-linked fields)
+        length = self.parser.length
+        if length is not None and len(data) - offset < length:
+            return False
+        return self.parser.can_unpack(data, offset)
+        
+    def can_pack(self, obj):
+        # As could modified objects
+        if self._callback_prepack.modify:
+            return True
+        return self.parser.can_pack(obj)
+        
+    def _measure(self, unpack_from):
+        # Anything with a known length and no unpack callbacks to run can
+        # be skipped entirely.
+        if self.length is None or self.parser.delimited or \
+            self.callback_preunpack or self.callback_postunpack:
+                return super()._measure(unpack_from)
+        return self.length
+        
+    def _pack_detached(self, obj):
+        ''' Runs the full packing process on obj, but instead of packing
+        the result into a buffer, returns it (by reference, if the
+        parser allows it).
+        '''
+        with self._mutex:
+            if self.parser.delimited:
+                del self.length
+            obj = self._callback_prepack(obj)
+            data = self.parser.pack(obj)
+            data = self._callback_postpack(data)
+            self._infer_length(len(data))
+            return data
+        
     def __repr__(self):
         ''' Some limited handling of subclasses is included.
         '''
@@ -835,6 +1271,14 @@ class ListyParser(_ParsableBase):
     added.
     '''
     
+    # A BufferPool to pack into (see smartyparse.buffers), if attached
+    pool = None
+    # The number of items to unpack, if known (see SmartyParser.link_count)
+    count = None
+    # True if the length was found while packing or unpacking, rather than
+    # set from outside (eg by link_length)
+    _found_length = False
+    
     def __init__(self, parsers, terminant=None, require_term=True, offset=0,
                  callbacks=None):
         super().__init__(offset, callbacks)
@@ -843,6 +1287,35 @@ class ListyParser(_ParsableBase):
         self.parsers = parsers
         self.length = None
         
+    @property
+    def length(self):
+        return self._length
+        
+    @length.setter
+    def length(self, length):
+        self._length = length
+        self._found_length = False
+        
+    @length.deleter
+    def length(self):
+        self._length = None
+        self._found_length = False
+        
+    def _found(self, length):
+        ''' Records a length found while packing or unpacking. It only 
+        applies to that run, so it's forgotten before the next unpack.
+        '''
+        self._length = length
+        self._found_length = True
+        
+    def _forget_found_length(self):
+        if self._found_length:
+            del self.length
+            
+    def _infer_length(self, *args, **kwargs):
+        self._forget_found_length()
+        super()._infer_length(*args, **kwargs)
+        
     @property
     def terminant(self):
         return self._terminant
@@ -871,18 +1344,24 @@ class ListyParser(_ParsableBase):
         # ListyParsers are their own parsers.
         return self
         
-    def _attempt_pack_single(self, obj, pack_into, seeker):
+    def _attempt_pack_single(self, obj, pack_into, seeker, trusted=False):
         # Iterates through available parsers and returns length to advance
         seeker_advance = 0
         
         # I should change this nomenclature to differentiate between 
         # parsables like ParseHelper and the actual parsers
         for parser in self.parsers:
+            # Skip anything that definitely won't work, without the
+            # expense of failing (and maybe partially packing)
+            if not parser.can_pack(obj):
+                continue
+                
             parser.offset = seeker
-            parser._infer_length()
+            if not trusted:
+                parser._infer_length()
             
             try:
-                parser.pack(obj=obj, pack_into=pack_into)
+                parser.pack(obj=obj, pack_into=pack_into, trusted=trusted)
                 seeker_advance = parser.length or 0
                 break
             except ParseError:
@@ -893,11 +1372,13 @@ class ListyParser(_ParsableBase):
         # This will only execute if break was not called, indicating no
         # successful parser discovery.
         else:
-            raise ParseError('Could not find a valid parser for iterant.')
+            raise ParseError('Could not find a valid parser for iterant.',
+                             reason='no_valid_parser', offset=seeker, 
+                             data=pack_into)
             
         return seeker_advance
         
-    def pack(self, obj, pack_into=None):
+    def pack(self, obj, pack_into=None, trusted=False, pool=None):
         ''' Automatically assembles a message from an indefinite-length
         list. Objects to pack must be iterables and are returned as
         tuples when unpacking.
@@ -905,67 +1386,137 @@ class ListyParser(_ParsableBase):
         Note that this tries to infer the correct parser length for each
         parser, in order. Once again, if ANY matches, it will
         automatically use the first match.
+        
+        If trusted=True, redundant length consistency checks are 
+        skipped. If pool (or self.pool) is a BufferPool, the list is 
+        packed into a buffer leased from it. See SmartyParser.pack.
         '''
-        with self._mutex:
-            # This should eventually be done with more intelligent
-            # preallocation than a blatant punt (if possible; might not be.)
-            packed = bytearray()
-            # Cannot do pack_into = pack_into or bytearray() because empty
-            # bytearray evaluates to False.
-            
-            # Use this to control the "cursor" position
-            # When nested, the parser is passed a slice. This is gross, but
-            # it's getting the job done I suppose.
-            # seeker = self.offset
-            seeker = 0
+        if pool is None:
+            pool = self.pool
+        if pool is not None and pack_into is None:
+            return pool._pack(self._pack_list_at, obj, self.length or 0, 
+                              trusted)
             
+        with self._mutex:
             # Pre-pack calls on obj
             # Modification vs non-modification is handled by the
             # SmartyparseCallback
             obj = self._callback_prepack(obj)
-        
-            # Parse each of the individual objects
-            for this_obj in obj:
-                # Advance the seeker
-                seeker_advance = self._attempt_pack_single(this_obj, packed,
-                                                           seeker)
-                seeker += seeker_advance
             
+            packed = bytearray()
+            self._pack_items(obj, packed, trusted=trusted)
             # Now call the terminant on the packed data
-            if self.terminant:
-                self.terminant.offset = seeker
-                self.terminant.pack(obj=packed, pack_into=packed)
-                self.terminant.offset = 0
+            self._pack_terminant(packed, trusted)
             
             # Finally, call the post-pack callback and return.
             packed = self._callback_postpack(packed)
             
-            if pack_into is None:
-                pack_into = bytearray()
-                
             # Calculate the length from the observed difference between the
             # final seeker position and the start offset
             # self.length = seeker - self.offset
-            self.length = len(packed)
+            self._found(len(packed))
             # Now build the slice, which is only used if we're nested.
             self._build_slice(pack_into=pack_into)
-                
-            # Freeze my own shit before returning, or we get errors.
-            pack_into[self.slice] = bytes(packed)
+            
+            # Copy into pack_into directly, without an intermediate bytes
+            # copy, or, if there's nothing to copy into, skip it entirely.
+            if pack_into is None:
+                return _as_bytearray(packed)
+            pack_into[self.slice] = packed
         
             return pack_into
         
-    def _attempt_unpack_single(self, unpack_from, load_into, seeker):
+    def _pack_items(self, objs, packed, seeker=0, trusted=False):
+        ''' Packs each of objs, in order, into the packed bytearray
+        starting at seeker, without any callbacks or terminant. Returns
+        the position just past the last item.
+        '''
+        # Parse each of the individual objects
+        for index, this_obj in enumerate(objs):
+            # Advance the seeker
+            try:
+                seeker_advance = self._attempt_pack_single(this_obj, packed,
+                                                           seeker, trusted)
+            except ParseError as exc:
+                exc._enter(index)
+                raise
+            seeker += seeker_advance
+            
+        return seeker
+        
+    def _pack_terminant(self, packed, trusted=False, seeker=None):
+        ''' Packs the terminant (if any) into packed at seeker (by 
+        default, appending it). Returns the position just past it.
+        '''
+        if seeker is None:
+            seeker = len(packed)
+        if self.terminant:
+            self.terminant.offset = seeker
+            self.terminant.pack(obj=packed, pack_into=packed, 
+                                trusted=trusted)
+            seeker += self.terminant.length or 0
+            self.terminant.offset = 0
+        return seeker
+            
+    def _pack_batch(self, objs):
+        ''' Packs a batch of list items for parallel_pack.
+        '''
+        packed = bytearray()
+        with self._mutex:
+            self._pack_items(objs, packed)
+        return packed
+        
+    def _pack_at(self, obj, packed, start, trusted=False):
+        ''' Packs obj as a single list item into packed at start (see
+        SmartyParser._pack_at), returning the position just past it. 
+        List callbacks need the whole list, so they aren't called; 
+        callers must refuse ListyParsers that have them.
+        '''
+        with self._mutex:
+            return self._pack_items((obj,), packed, start, trusted)
+            
+    def _pack_list_at(self, obj, packed, start, trusted=False):
+        ''' Packs the whole list obj into packed at start, as 
+        SmartyParser._pack_at does for messages.
+        '''
+        if self.callback_postpack:
+            data = self.pack(obj, pack_into=bytearray(), trusted=trusted)
+            packed[start:start + len(data)] = data
+            return start + len(data)
+            
+        with self._mutex:
+            obj = self._callback_prepack(obj)
+            end = self._pack_items(obj, packed, start, trusted)
+            end = self._pack_terminant(packed, trusted, end)
+            self._found(end - start)
+            return end
+            
+    def parallel_pack(self, iterable, workers=None, out=None,
+                      chunk_size=1000, factory=None):
+        ''' Packs the (potentially very long) iterable as a list, using a
+        pool of worker processes. See smartyparse.parallel.parallel_pack.
+        '''
+        from .parallel import parallel_pack
+        return parallel_pack(self, iterable, workers=workers, out=out,
+                             chunk_size=chunk_size, factory=factory)
+        
+    def _attempt_unpack_single(self, unpack_from, load_into, seeker, 
+                               trusted=False):
         # Tries all parsers for the given position, returning the advance
         # and terminant=True/False if successful. Raise parseerror otherwise.
         # I should change this nomenclature to differentiate between
         # parsables like ParseHelper and the actual parsers
         for parser in self._unpack_try_order:
+            # Skip anything that definitely won't work
+            if not parser.can_unpack(unpack_from, seeker):
+                continue
+                
             parser.offset = seeker
-            parser._infer_length()
+            if not trusted:
+                parser._infer_length()
             
             try:
-                obj = parser.unpack(unpack_from=unpack_from)
+                obj = parser.unpack(unpack_from=unpack_from, trusted=trusted)
                 load_into.append(obj)
                 seeker_advance = parser.length or 0
                 break
@@ -977,12 +1528,14 @@ class ListyParser(_ParsableBase):
         # This will only execute if break was not called, indicating no
         # successful parser discovery.
         else:
-            raise ParseError('Could not find a valid parser for iterant.')
+            raise ParseError('Could not find a valid parser for iterant.',
+                             reason='no_valid_parser', offset=seeker, 
+                             data=unpack_from)
             
         # Return the offset and if it was the terminant.
         return seeker_advance, parser is self.terminant
         
-    def unpack(self, unpack_from):
+    def unpack(self, unpack_from, trusted=False):
         with self._mutex:
             # print(self.length)
             # Create output object and reframe as memoryview to avoid copies
@@ -994,32 +1547,53 @@ class ListyParser(_ParsableBase):
             # This is extremely likely to introduce hard-to-find bugs when
             # reusing ListyParsers, but it's a quick fix.
             if self.length is None:
-                self._length = len(data)
+                self._found(len(data) - self.offset)
             self._build_slice()
             
             # Error trap if no known length but preunpack callback:
             if self.length is None and self.callback_preunpack:
                 raise ParseError('Cannot call pre-unpack callback with '
                                  'indeterminate length. Your format may '
-                                 'be impossible to explicitly unpack.')
+                                 'be impossible to explicitly unpack.',
+                                 reason='indeterminate_length')
             # We can always unambiguously call this now, thanks to above.
             self._callback_preunpack(data[self.slice])
             
             # Use this to control the "cursor" position
             seeker = self.offset
             
-            # Repeat until we get a terminate signal or we're at the EOF
+            # Repeat until we get a terminate signal or we're at the EOF (or
+            # have as many items as we were told to expect)
             terminate = False
             endpoint = self.slice.stop or len(unpack_from)
+            count = self.count
             while seeker < endpoint and not terminate:
-                seeker_advance, terminate = \
-                    self._attempt_unpack_single(data, unpacked, seeker)
+                if count is not None and len(unpacked) >= count:
+                    break
+                try:
+                    seeker_advance, terminate = self._attempt_unpack_single(
+                        data, unpacked, seeker, trusted
+                    )
+                except ParseError as exc:
+                    exc._enter(len(unpacked))
+                    raise
                 seeker += seeker_advance
                 
             # If we hit the terminant, remove value from unpacked, else
             # check if we should have terminated. Not sure if awkward.
             if terminate:
                 terminant = unpacked.pop()
+                # The list ends with its terminant, not with the data
+                self._found(seeker - self.offset)
+            elif count is not None:
+                if len(unpacked) < count:
+                    raise ParseError(
+                        'Expected {} list items, but found {}.'.format(
+                            count, len(unpacked)),
+                        reason='length_mismatch', offset=seeker, data=data
+                    )
+                # Now we know where we stopped
+                self._found(seeker - self.offset)
             # This will be called if (and only if) EOF is encountered
             # without seeing a terminate.
             else:
@@ -1030,10 +1604,61 @@ class ListyParser(_ParsableBase):
             unpacked = tuple(self._callback_postunpack(unpacked))
             return unpacked
         
+    def record_offsets(self, unpack_from):
+        ''' Scans a packed list for its items, returning an 
+        array.array('Q') of the offset of each, followed by the end of
+        the final item (ie, the start of the terminant, if any). Items
+        are decoded to determine which parser matches them.
+        '''
+        with self._mutex:
+            data = memoryview(unpack_from)
+            offsets = array.array('Q', [0])
+            scratch = []
+            seeker = 0
+            while seeker < len(data):
+                seeker_advance, terminate = self._attempt_unpack_single(
+                    data, scratch, seeker
+                )
+                scratch.clear()
+                if terminate:
+                    break
+                seeker = _advance(seeker, seeker_advance, data)
+                offsets.append(seeker)
+            return offsets
+            
+    def _unpack_item(self, unpack_from, offset):
+        ''' Unpacks the single list item at offset in unpack_from.
+        '''
+        with self._mutex:
+            unpacked = []
+            self._attempt_unpack_single(memoryview(unpack_from), unpacked, 
+                                        offset)
+            return unpacked[0]
+        
+    def _stride(self):
+        ''' Returns the length of every item, if they're all the same, or
+        None otherwise.
+        '''
+        if self.terminant:
+            return None
+        lengths = {_static_length(parser) for parser in self.parsers}
+        if len(lengths) != 1 or None in lengths:
+            return None
+        return lengths.pop()
+        
+    def _measure(self, unpack_from):
+        # Only skippable if something (ex. link_length) told us our length
+        self._forget_found_length()
+        if self.length is None or self.callback_preunpack or \
+            self.callback_postunpack:
+                return super()._measure(unpack_from)
+        return self.length
+        
     def _verify_termination(self):
         if self.terminant and self.require_term:
             raise ParseError(
-                'EOF encountered without required list termination.'
+                'EOF encountered without required list termination.',
+                reason='missing_terminant'
             )
         else:
             return True
@@ -1041,9 +1666,21 @@ class ListyParser(_ParsableBase):
 
 class SmartyParser(_ParsableBase):
     ''' One-stop shop for easy parsing. No muss, no fuss, just coconuts.
+    
+    If align is 'native', fields are aligned as a C compiler would 
+    (each number to its own size), with trailing padding to the largest
+    alignment. If it's an int, no field is aligned to more than that 
+    (as with #pragma pack(n)). Alignment is relative to the start of 
+    the message. Padding is zeroed on pack, and ignored on unpack.
     '''
     
-    def __init__(self, offset=0, callbacks=None):
+    # A BufferPool to pack into (see smartyparse.buffers), if attached
+    pool = None
+    align = None
+    # The alignment and compiled struct layout, worked out on first use
+    _layout = None
+    
+    def __init__(self, offset=0, callbacks=None, align=None):
         # Initialize offset.
         # This is required to prevent race condition / call before assignment
         # in super, because offset.setter references offset.
@@ -1053,6 +1690,18 @@ class SmartyParser(_ParsableBase):
         # link_forward and link_backward
         self._override = {}
         self._cache = {}
+        # Opt-in caches of packed field values, by field name
+        self._pack_caches = {}
+        # Item count fields, and the items they count, from link_count
+        self._count_links = {}
+        # Out-of-line sections, and (offset field, base field) for each,
+        # from link_offset
+        self._offset_links = collections.OrderedDict()
+        
+        if align is not None and align != 'native' and (
+            not isinstance(align, int) or align < 1 or align & (align - 1)):
+                raise ValueError('align must be "native" or a power of two.')
+        self.align = align
         
         self._control = collections.OrderedDict()
         self.length = None
@@ -1083,10 +1732,36 @@ class SmartyParser(_ParsableBase):
         del self._control[name]
         self._update_obj()
         
+    def __getstate__(self):
+        state = super().__getstate__()
+        # The object class is generated, so regenerate it on load. Any
+        # deferred calls are stale (and closures, besides).
+        del state['_obj']
+        state['_defer_eval'] = (
+            self._defer_eval[0], 
+            {name: [] for name in self._defer_eval[1]}
+        )
+        # Profiling swaps out the control dict; don't persist that either
+        state['_control'] = collections.OrderedDict(self._control)
+        # Structs can't be pickled, but can easily be compiled again
+        state.pop('_layout', None)
+        return state
+        
+    def __setstate__(self, state):
+        # Schemas pickled before pack caches or count links existed
+        state.setdefault('_pack_caches', {})
+        state.setdefault('_count_links', {})
+        state.setdefault('_offset_links', collections.OrderedDict())
+        super().__setstate__(state)
+        self._update_obj()
+        
     def _infer_length(self, *args, **kwargs):
         result = super()._infer_length(*args, **kwargs)
         # As a last resort, try discovering if we've a static length
-        if result is None:
+        if result is None and (self.align is not None or self._offset_links):
+            # Padding and sections need the whole layout
+            result = _static_length(self)
+        elif result is None:
             try:
                 static_length = 0
                 for parser in self._control.values():
@@ -1127,6 +1802,106 @@ class SmartyParser(_ParsableBase):
         '''
         self._obj = _smartyobject([item for item in list(self._control)
                                    if item not in self._exclude_from_obj])
+        self._layout = None
+        
+    def _get_layout(self):
+        ''' Works out (once) the alignment of every field, the alignment
+        of the whole message, and the precompiled struct for the message
+        (if it's static). Returns (alignments, struct_align, compiled),
+        where alignments is None if unaligned, and compiled is either
+        None or (struct.Struct, field names, padding field names, 
+        blob lengths, fields).
+        '''
+        if self._layout is not None:
+            return self._layout
+            
+        alignments = None
+        struct_align = 1
+        if self.align is not None:
+            alignments = {}
+            for name, parsable in self._control.items():
+                alignment = _natural_alignment(parsable)
+                if self.align != 'native':
+                    alignment = min(alignment, self.align)
+                alignments[name] = alignment
+                struct_align = max(struct_align, alignment)
+                
+        self._layout = (alignments, struct_align, 
+                        self._compile(alignments, struct_align))
+        return self._layout
+        
+    def _get_compiled(self):
+        ''' Returns the precompiled struct from _get_layout, first 
+        recompiling it if any of the fields (or their callbacks) have 
+        changed since it was compiled. Callbacks can be registered 
+        directly on the fields, so this can't rely on the SmartyParser
+        being told about them.
+        '''
+        compiled = self._get_layout()[2]
+        if compiled is None:
+            return None
+            
+        fields = compiled[4]
+        if self.callback_preunpack or self.callback_postunpack or \
+            self.callback_prepack or self.callback_postpack or \
+            self._exclude_from_obj or len(fields) != len(self._control) or \
+            any(self._control.get(name) is not parsable or 
+                parsable.parser is not parser or 
+                _struct_code(parsable) is None 
+                for name, parsable, parser in fields):
+                    self._layout = None
+                    compiled = self._get_layout()[2]
+        return compiled
+        
+    def _compile(self, alignments, struct_align):
+        ''' Folds every field (and any alignment padding) into a single
+        struct, if they're all static, unlinked and callback-free, and
+        share a byte order.
+        '''
+        if self.callback_preunpack or self.callback_postunpack or \
+            self.callback_prepack or self.callback_postpack or \
+            self._exclude_from_obj or not self._control:
+                return None
+                
+        orders = set()
+        codes = []
+        names = []
+        padding = []
+        blobs = []
+        fields = []
+        offset = 0
+        for name, parsable in self._control.items():
+            code = _struct_code(parsable)
+            if code is None:
+                return None
+            fields.append((name, parsable, parsable.parser))
+            order, code = code
+            if order is not None:
+                orders.add(order)
+                
+            if alignments is not None and -offset % alignments[name]:
+                codes.append(str(-offset % alignments[name]) + 'x')
+                offset += -offset % alignments[name]
+            codes.append(code)
+            offset += parsable.parser.length
+            if code.endswith('x'):
+                padding.append(name)
+            else:
+                # struct silently pads or truncates 's' values, so their
+                # lengths are checked before packing, as in Blob.pack
+                if code.endswith('s'):
+                    blobs.append((len(names), parsable.parser.length))
+                names.append(name)
+                
+        if alignments is not None and -offset % struct_align:
+            codes.append(str(-offset % struct_align) + 'x')
+        if len(orders) > 1:
+            return None
+            
+        packer = struct.Struct((orders.pop() if orders else '>') + 
+                               ''.join(codes))
+        return (packer, tuple(names), tuple(padding), tuple(blobs), 
+                tuple(fields))
     
     def link_forward(self, source_name, link_name, f_pack, f_unpack, exclude=True):
         ''' Use this when the metadata follows the data in the packed
@@ -1213,38 +1988,29 @@ class SmartyParser(_ParsableBase):
         # Before unpacking the length field, we know basically nothing.
         # State check: length {len: X, val: ?}; data {len: None, val: ?}
         # Now unpack the length, and then this gets called:
-        def postunpack_len(unpacked_length, data_name=data_name):
-            # print('postunpack length ', unpacked_length)
-            self._control[data_name].length = unpacked_length
-        self._control[length_name].register_callback('postunpack', postunpack_len)
+        link = _LengthLink(self, data_name)
+        self._control[length_name].register_callback('postunpack', 
+                                                     link.postunpack_len)
         # State check: length {len: X, val: n}; data {len: n, val: ?}
         # Now we unpack the data, resulting in...
         # State check: length {len: X, val: n}; data {len: n, val: Y}
-        # Which calls this...
-        def postunpack_dat(unpacked_data, data_name=data_name):
-            # print('postunpack data')
-            pass
-            # del self._control[data_name].length
-        self._control[data_name].register_callback('postunpack', postunpack_dat)
-        # Which resets data to its original state.
+        # The data needs no postunpack callback of its own. Leaving it
+        # callback-free also lets _measure skip over it without decoding.
         
         # ------------ Packing management ------------------------------
         # Before packing the data field, we know basically nothing.
         # BUT, we need to enforce that against previous calls, which may
         # have left a residual length in the parser from _infer_length()
-        def prepack_dat(obj_dat, data_name=data_name):
-            del self._control[data_name].length
-        self._control[data_name].register_callback('prepack', prepack_dat)
+        self._control[data_name].register_callback('prepack', 
+                                                   link.prepack_dat)
         # State check: length {len: X, val: ?}; data {len: ?, val: ?}
         # Now we go to pack the length, but hit the deferred call.
         # Now we get around to packing the data, and...
         # State check: length {len: X, val: ?}; data {len: n, val: Y}
         # Now we get to the deferred call for the length pack, so we...
-        def prepack_len(obj_len, data_name=data_name):
-            # This is a deferred call, so we have a window to grab the real
-            # length from the parser.
-            return self._control[data_name].length
-        self._control[length_name].register_callback('prepack', prepack_len, modify=True)
+        self._control[length_name].register_callback('prepack', 
+                                                     link.prepack_len, 
+                                                     modify=True)
         # State check: length {len: X, val: n}; data {len: n, val: Y}
         # There is no need for a state reset, because we've injected the
         # length directly into the parser, bypassing its state entirely.
@@ -1253,6 +2019,135 @@ class SmartyParser(_ParsableBase):
         # Exclude the length field from the input/output of pack/unpack
         self._exclude_from_obj.add(length_name)
         self._defer_eval[0][length_name] = data_name
+        self._layout = None
+        
+    def link_count(self, items_name, count_name):
+        ''' Like link_length, but the field at count_name holds the
+        number of items in the field at items_name, which must be a
+        ListyParser, or a ParseHelper for a parsers.Array. As with
+        link_length, count_name is then left out of the objects passed
+        to pack and returned from unpack.
+        
+        On pack, the count is taken from len() of the items. On unpack,
+        exactly that many items are unpacked. If every item has the same
+        static length (eg an Array, or a ListyParser of fixed-length 
+        SmartyParsers), the items can be skipped over without decoding
+        them at all, just like a length-linked field.
+        '''
+        keys = list(self._control.keys())
+        if keys.index(items_name) < keys.index(count_name):
+            raise ValueError('Counts cannot follow their linked items, or '
+                             'objects would be impossible to unpack.')
+                             
+        items = self._control[items_name]
+        if not isinstance(items, ListyParser) and not (
+            isinstance(items, ParseHelper) and 
+            isinstance(items.parser, parsers.Array)):
+                raise ValueError('Counted items must be a ListyParser or an '
+                                 'Array.')
+                                 
+        link = _CountLink(self, items_name)
+        self._control[count_name].register_callback('postunpack', 
+                                                    link.postunpack_count)
+        items.register_callback('prepack', link.prepack_items)
+        
+        # The count is known before anything is packed, so (unlike
+        # lengths) it doesn't need to be deferred.
+        self._exclude_from_obj.add(count_name)
+        self._count_links[count_name] = items_name
+        self._layout = None
+        
+    def link_offset(self, target_name, offset_name, base=None):
+        ''' Moves the field at target_name out of line, into a section 
+        after the rest of the message, and stores its position in the 
+        (integer) field at offset_name, as for a table of contents. The 
+        offset is counted from the start of the message, or from the
+        start of the field named by base. As with link_length, 
+        offset_name is then left out of the objects passed to pack and
+        returned from unpack.
+        
+        On pack, sections are laid out in the order they were linked,
+        and their offsets are filled in afterwards. On unpack, sections
+        aren't parsed at all; instead, the field holds a Reference, 
+        which unpacks the section when dereferenced. Sections must 
+        therefore be able to find their own lengths (eg fixed-length or
+        delimited fields, terminated ListyParsers, or anything whose 
+        length or count is already linked). The length of an unpacked 
+        message runs to the end of its furthest section, so messages 
+        with sections can be nested in others, or packed back to back.
+        '''
+        for name in (target_name, offset_name) + ((base,) if base else ()):
+            if name not in self._control:
+                raise ValueError('Unknown field: ' + repr(name))
+            
+        pointer = self._control[offset_name]
+        if not isinstance(pointer, ParseHelper) or \
+            not isinstance(pointer.parser, parsers._StructParserBase) or \
+            pointer.parser._packer.format[-1] not in 'bBhHiIlLqQ':
+                raise ValueError('Offsets must be integer fields.')
+                
+        outline = set(self._offset_links) | {target_name}
+        if offset_name in outline or base in outline:
+            raise ValueError('Offset and base fields must be in-line.')
+        if target_name in self._exclude_from_obj or \
+            self._defer_eval[1].get(target_name):
+                raise ValueError('Linked fields cannot be moved out of line.')
+        if not self._is_linked(target_name) and \
+            not _self_delimiting(self._control[target_name]):
+                raise ValueError('Sections must be able to find their own '
+                                 'lengths. Link their lengths or counts '
+                                 'first.')
+                
+        self._offset_links[target_name] = (offset_name, base)
+        self._exclude_from_obj.add(offset_name)
+        self._layout = None
+        
+    def cache_field(self, name, max_bytes=1 << 20):
+        ''' Caches the packed bytes of the named field, keyed on (a 
+        frozen copy of) its value, so that repeated values are copied in
+        directly instead of being packed again. The cache is LRU, and 
+        holds at most max_bytes of packed data. Returns the PackCache,
+        whose stats() show whether it's worth having.
+        
+        Only cache fields that always pack the same way for the same 
+        value: on a hit, the field's own pack callbacks aren't called.
+        Fields that have their lengths linked to other fields can't be 
+        cached (though linked data can).
+        '''
+        if name not in self._control:
+            raise ValueError('Unknown field: ' + repr(name))
+        if name in self._defer_eval[0]:
+            raise ValueError('Length fields cannot be cached.')
+            
+        cache = PackCache(max_bytes)
+        self._pack_caches[name] = cache
+        return cache
+        
+    def uncache_field(self, name):
+        self._pack_caches.pop(name, None)
+        
+    def cache_stats(self):
+        ''' Returns {field name: stats} for every cached field. See 
+        PackCache.stats.
+        '''
+        return {name: cache.stats() 
+                for name, cache in self._pack_caches.items()}
+        
+    def _pack_cached(self, cache, parser, obj, packed, seeker, trusted):
+        ''' Packs obj with parser at seeker, through the cache.
+        '''
+        key = cache.key(obj, getattr(parser, '_exclude_from_obj', ()))
+        cached = None if key is None else cache.get(key)
+        
+        if cached is not None:
+            packed[seeker:seeker + len(cached)] = cached
+            # Linked length fields (and the seeker) need this
+            parser.length = len(cached)
+            return
+            
+        parser.pack(obj=obj, pack_into=packed, trusted=trusted)
+        if key is not None:
+            cache.put(key, bytes(packed[seeker:seeker + parser.length]))
         
     def _generate_deferred(self, fieldname, parser, obj, pack_into):
         # Figure out what parser we wait for
@@ -1281,7 +2176,7 @@ class SmartyParser(_ParsableBase):
         # Add that function into the appropriate register
         self._defer_eval[1][waitfor].append(deferred_call)
         
-    def pack(self, obj, pack_into=None):
+    def pack(self, obj, pack_into=None, trusted=False, pool=None):
         ''' Automatically assembles a message from an object. The object
         must have data accessible via __getitem__(key), with keys
         matching the SmartyParser definition.
@@ -1336,48 +2231,150 @@ class SmartyParser(_ParsableBase):
         Traceback (most recent call last):
           File "<stdin>", line 1, in <module>
         TypeError: memoryview assignment: lvalue and rvalue have different structures
+        
+        --------------
+        
+        If trusted=True, the redundant length consistency checks between
+        parsers, ParseHelpers and packed data are skipped. Only use this
+        for objects known to be consistent with the format (eg, those
+        that were themselves unpacked from it).
+        
+        If pool (or self.pool) is a smartyparse.buffers.BufferPool, the
+        message is packed directly into a buffer leased from it, and a
+        Lease is returned instead of a new bytearray. Release the lease
+        once done with it, to reuse the buffer.
         '''
-        # Add any exclusively avoided fields (currently only lengthlinked ones)
-        # into obj as None, in case they (probably) have not been defined.
+        if pool is None:
+            pool = self.pool
+        if pool is not None and pack_into is None:
+            return pool._pack(self._pack_at, obj, self.length or 0, trusted)
+            
         with self._mutex:
-            for key in self._exclude_from_obj:
-                obj[key] = None
+            packed = bytearray()
+            self._pack_fields(obj, packed, trusted=trusted)
+            
+            # Finally, call the post-pack callback and return.
+            packed = self._callback_postpack(packed)
+            
+            # Calculate the length from the observed difference between the
+            # final seeker position and the start offset
+            # self.length = seeker - self.offset
+            self.length = len(packed)
+            # Now build the slice, which is only used if we're nested.
+            self._build_slice(pack_into=pack_into)
+            
+            # Copy into pack_into directly, without an intermediate bytes
+            # copy, or, if there's nothing to copy into, skip it entirely.
+            if pack_into is None:
+                return _as_bytearray(packed)
+            pack_into[self.slice] = packed
+            return pack_into
             
-            # This should eventually be done with more intelligent
-            # preallocation than a blatant punt
+    def pack_iov(self, obj, min_size=4096):
+        ''' Packs obj into a list of buffers, suitable for passing
+        directly to socket.sendmsg or os.writev. Top-level Blob fields
+        of at least min_size bytes are not copied into the packed
+        header chunks; the original objects are included in the list by
+        reference instead.
+        
+        While packing, the offsets of any fields following a detached
+        blob do not include the blob itself. If a post-pack callback is
+        defined, the whole message must be available to it, so this
+        falls back to a single packed buffer (as do aligned messages, and
+        those with sections from link_offset).
+        '''
+        # Padding positions and section offsets depend on the whole 
+        # message too
+        if self.callback_postpack or self.align is not None or \
+            self._offset_links:
+            return [self.pack(obj, pack_into=bytearray())]
+            
+        with self._mutex:
+            detached = []
             packed = bytearray()
-            # Cannot do pack_into = pack_into or bytearray() because empty
-            # bytearray evaluates to False.
+            self._pack_fields(obj, packed, detached=detached, 
+                              min_size=min_size)
             
-            # Use this to control the "cursor" position
-            # seeker = self.offset
-            seeker = 0
+            iov = []
+            view = memoryview(packed)
+            last = 0
+            length = len(packed)
+            for position, data in detached:
+                if position > last:
+                    iov.append(view[last:position])
+                iov.append(data)
+                last = position
+                length += len(data)
+            if last < len(packed) or not iov:
+                iov.append(view[last:])
+                
+            self.length = length
+            return iov
             
-            # Pre-pack calls on obj
-            # Modification vs non-modification is handled by the
-            # SmartyparseCallback
-            obj = self._callback_prepack(obj)
+    def _pack_fields(self, obj, packed, seeker=0, detached=None, min_size=0,
+                     trusted=False):
+        ''' Packs every field in obj into the packed bytearray, starting
+        at seeker, and returns the position just past the last field. If
+        detached is a list, any (non-deferred) Blob fields of at least 
+        min_size are left out of the bytearray, and are instead appended
+        to detached as (position, data) tuples.
+        
+        Bytes already in packed past seeker are overwritten in place, so
+        a preallocated buffer is only resized if the message overruns it.
+        '''
+        # Add any exclusively avoided fields (currently only lengthlinked ones)
+        # into obj as None, in case they (probably) have not been defined.
+        for key in self._exclude_from_obj:
+            obj[key] = None
+        for count_name, items_name in self._count_links.items():
+            obj[count_name] = len(obj[items_name])
+        # Offsets are filled in once their sections are packed
+        for offset_name, __ in self._offset_links.values():
+            obj[offset_name] = 0
             
+        # Deferred calls only ever apply to the current run. Clear out any
+        # leftovers (for example, from a failed run), or they'll be called
+        # again, against stale buffers, on every subsequent run.
+        for waiting in self._defer_eval[1].values():
+            waiting.clear()
+        
+        # Pre-pack calls on obj
+        # Modification vs non-modification is handled by the
+        # SmartyparseCallback
+        obj = self._callback_prepack(obj)
+        
+        alignments, struct_align, __ = self._get_layout()
+        start = seeker
+        positions = {}
+        
+        try:
             # Don't use items, so that we can modify the parsehelpers
             # themselves
             for fieldname in self._control:
+                # Sections come after everything else
+                if fieldname in self._offset_links:
+                    continue
+                    
                 parser = self._control[fieldname]
                 this_obj = obj[fieldname]
                 call_after_parse = []
-                padding = b''
-                
-                # Save length to restore later
-                oldlen = parser.length
                 
+                if alignments is not None:
+                    seeker = _zero_pad(packed, seeker, 
+                                       (start - seeker) % alignments[fieldname])
+                if self._offset_links:
+                    positions[fieldname] = seeker
+            
                 # Don't forget this comes after the state save
                 parser.offset = seeker
                 # Check to see if the bytearray is large enough (is handled by
                 # the ParseHelper, actually)
-                    
+                
                 # Redundant with pack, but not triply so. Oh well.
-                parser._infer_length()
+                if not trusted:
+                    parser._infer_length()
                 # seeker_advance = parser.length or 0
-                    
+                
                 # Check to see if this is a delayed execution thingajobber
                 if fieldname in self._defer_eval[0]:
                     self._generate_deferred(fieldname, parser, obj, packed)
@@ -1387,43 +2384,121 @@ class SmartyParser(_ParsableBase):
                 # list
                 else:
                     call_after_parse = self._defer_eval[1][fieldname]
+                
+                    # Large blobs are left in place, and only their lengths
+                    # are packed (through any deferred calls). Size up the
+                    # blob after its prepack callback, which may be what 
+                    # turns it into bytes in the first place.
+                    if detached is not None and \
+                        isinstance(parser, ParseHelper) and \
+                        isinstance(parser.parser, parsers.Blob):
+                            data = parser._pack_detached(obj=this_obj)
+                            if memoryview(data).nbytes >= min_size:
+                                detached.append((seeker, data))
+                                # Note that this "skips" the seeker advance
+                                # below
+                                parser.offset = 0
+                                for deferred in call_after_parse:
+                                    deferred()
+                                continue
+                            # Already packed, so just copy it in
+                            parser._build_slice(pack_into=packed)
+                            packed[parser.slice] = data
+                        
                     # Only do this when not deferred.
-                    parser.pack(obj=this_obj, pack_into=packed)
-                    
+                    elif fieldname in self._pack_caches:
+                        self._pack_cached(self._pack_caches[fieldname], 
+                                          parser, this_obj, packed, seeker,
+                                          trusted)
+                    else:
+                        parser.pack(obj=this_obj, pack_into=packed, 
+                                    trusted=trusted)
+                
                 # Advance the seeker BEFORE the finally block resets the length
                 seeker += parser.length or 0
-                
+            
                 # And perform any scheduled deferred calls
                 # IT IS VERY IMPORTANT TO NOTE THAT THIS HAPPENS BEFORE
                 # RESTORING THE LENGTH AND OFFSET FROM THE ORIGINAL PARSER.
                 for deferred in call_after_parse:
                     deferred()
-                    
+                
                 # Reset the parser's offset
                 parser.offset = 0
+                
+            if self._offset_links:
+                seeker = self._pack_sections(obj, packed, start, seeker, 
+                                             positions, alignments, trusted)
+                
+        # Note where we were, for anyone catching this higher up
+        except ParseError as exc:
+            exc._enter(fieldname)
+            raise
             
-            # Finally, call the post-pack callback and return.
-            packed = self._callback_postpack(packed)
-            
-            if pack_into is None:
-                pack_into = bytearray()
+        if alignments is not None:
+            seeker = _zero_pad(packed, seeker, (start - seeker) % struct_align)
+        return seeker
+        
+    def _pack_sections(self, obj, packed, start, seeker, positions, 
+                       alignments, trusted):
+        ''' Packs the out-of-line sections from link_offset at seeker,
+        and then goes back to fill in their offsets.
+        '''
+        for fieldname, (offset_name, base) in self._offset_links.items():
+            parser = self._control[fieldname]
+            this_obj = obj[fieldname]
+            # Allow round-tripping containers without touching sections
+            if isinstance(this_obj, Reference):
+                this_obj = this_obj.deref()
                 
-            # Calculate the length from the observed difference between the
-            # final seeker position and the start offset
-            # self.length = seeker - self.offset
-            self.length = len(packed)
-            # Now build the slice, which is only used if we're nested.
-            self._build_slice(pack_into=pack_into)
+            if alignments is not None:
+                seeker = _zero_pad(packed, seeker, 
+                                   (start - seeker) % alignments[fieldname])
+            section = seeker
+            
+            parser.offset = seeker
+            if not trusted:
+                parser._infer_length()
+            parser.pack(obj=this_obj, pack_into=packed, trusted=trusted)
+            seeker += parser.length or 0
+            parser.offset = 0
+            
+            pointer = self._control[offset_name]
+            pointer.offset = positions[offset_name]
+            try:
+                pointer.pack(
+                    obj=section - (start if base is None else positions[base]),
+                    pack_into=packed
+                )
+            except ParseError as exc:
+                exc._enter(offset_name)
+                raise
+            finally:
+                pointer.offset = 0
                 
-            # Freeze my own shit before returning, or we get errors.
-            pack_into[self.slice] = bytes(packed)
-            return pack_into
+        return seeker
         
-    def unpack(self, unpack_from):
+    def unpack(self, unpack_from, trusted=False, fields=None):
         ''' Automatically unpacks an object from message.
         
         Returns a SmartyParseObject.
+        
+        If trusted=True, the redundant length consistency checks between
+        parsers and ParseHelpers are skipped. Only use this for data 
+        known to be well-formed (eg, that we packed ourselves, or that 
+        has been authenticated).
+        
+        If fields is defined, only those fields are unpacked, and the 
+        rest are skipped over, decoding only what's needed to find their
+        lengths. Nested fields are named by their dotted path, eg
+        ['version', 'first.body1']. The SmartyParseObject returned will
+        only contain the requested fields.
         '''
+        wanted = _projection(fields)
+        if wanted is not None and not wanted.keys() <= self._control.keys():
+            unknown = sorted(wanted.keys() - self._control.keys())
+            raise ValueError('Unknown fields: ' + repr(unknown))
+        
         with self._mutex:
             # Construct the output and reframe as memoryview for performance
             unpacked = self.obj()
@@ -1440,59 +2515,124 @@ class SmartyParser(_ParsableBase):
             if self.length is None and self.callback_preunpack:
                 raise ParseError('Cannot call pre-unpack callback with '
                                  'indeterminate length. Your format may '
-                                 'be impossible to explicitly unpack.')
+                                 'be impossible to explicitly unpack.',
+                                 reason='indeterminate_length')
             
             # We can always unambiguously call this now, thanks to above.
             self._callback_preunpack(data[self.slice])
             
             # Use this to control the "cursor" position
             seeker = self.offset
+            alignments, struct_align, __ = self._get_layout()
+            # In-line field positions, and offset values, for sections
+            positions = {}
+            pointers = {}
+            pointers_needed = {offset_name for offset_name, __ in 
+                               self._offset_links.values()} \
+                              if self._offset_links else ()
             
-            # Don't use items, so that we can modify the parsehelpers
-            # themselves
-            for fieldname in self._control:
-                parser = self._control[fieldname]
+            try:
+                # Don't use items, so that we can modify the parsehelpers
+                # themselves
+                for fieldname in self._control:
+                    # Sections are only parsed when dereferenced
+                    if fieldname in self._offset_links:
+                        continue
+                        
+                    parser = self._control[fieldname]
+                    
+                    if alignments is not None:
+                        seeker += (self.offset - seeker) % alignments[fieldname]
+                    if self._offset_links:
+                        positions[fieldname] = seeker
                 
-                # Save length to restore later
-                oldlen = parser.length
-                # Don't forget this comes after the state save
-                parser.offset = seeker
-                # Redundant with pack, but not triply so. Oh well.
-                parser._infer_length()
+                    # Save length to restore later
+                    oldlen = parser.length
+                    # Don't forget this comes after the state save
+                    parser.offset = seeker
+                    
+                    # Skip anything that wasn't requested. _measure does
+                    # its own inference, where it's needed at all.
+                    # Offsets are always needed, for any sections
+                    if wanted is not None and fieldname not in wanted and \
+                        fieldname not in pointers_needed:
+                        # Unless a link just set it, any length is left 
+                        # over from the last pack or unpack
+                        if not self._is_linked(fieldname):
+                            del parser.length
+                        seeker += parser._measure(data)
+                        parser.offset = 0
+                        continue
+                        
+                    # Redundant with pack, but not triply so. Oh well.
+                    if not trusted:
+                        parser._infer_length()
                 
-                # Previously, this is where we did this:
-                # -----
-                # # Check length to add
-                # seeker_advance = parser.length
-                # -----
-                # But, since we've removed the callback to clear the
-                # length of any lengthlinked data field after loading,
-                # we can now move it after. Also, this was causing bugs.
+                    # Previously, this is where we did this:
+                    # -----
+                    # # Check length to add
+                    # seeker_advance = parser.length
+                    # -----
+                    # But, since we've removed the callback to clear the
+                    # length of any lengthlinked data field after loading,
+                    # we can now move it after. Also, this was causing bugs.
                     
-                # print('name     ', fieldname)
-                # print('seeker   ', seeker)
-                # print('slice    ', parser.slice)
-                # print('data     ', bytes(data[seeker:]))
+                    # print('name     ', fieldname)
+                    # print('seeker   ', seeker)
+                    # print('slice    ', parser.slice)
+                    # print('data     ', bytes(data[seeker:]))
                     
-                # Aight we're good to go, but only return stuff that matters
-                obj = parser.unpack(data)
-                if fieldname not in self._exclude_from_obj:
-                    unpacked[fieldname] = obj
+                    # Aight we're good to go, but only return stuff that matters
+                    if wanted is None or wanted.get(fieldname) is None:
+                        obj = parser.unpack(data, trusted=trusted)
+                    elif isinstance(parser, SmartyParser):
+                        obj = parser.unpack(data, trusted=trusted, 
+                                            fields=wanted[fieldname])
+                    else:
+                        raise ValueError('Cannot select subfields of ' + 
+                                         fieldname + ', which is not a '
+                                         'SmartyParser.')
+                    if fieldname not in self._exclude_from_obj:
+                        unpacked[fieldname] = obj
+                    elif self._offset_links:
+                        pointers[fieldname] = obj
                     
-                # print('object   ', obj)
-                # print('length   ', self.length)
-                # print('-----------------------------------------------')
+                    # print('object   ', obj)
+                    # print('length   ', self.length)
+                    # print('-----------------------------------------------')
                 
-                # Check length to add
-                seeker_advance = parser.length
+                    # Check length to add
+                    seeker_advance = parser.length
                 
-                # If we got this far, we should advance the seeker accordingly.
-                # Use sliced instead of length in case postunpack callbacks
-                # got rid of it.
-                seeker += seeker_advance
+                    # If we got this far, we should advance the seeker
+                    # accordingly.
+                    # Use sliced instead of length in case postunpack callbacks
+                    # got rid of it.
+                    seeker += seeker_advance
                 
-                # Finally, reset the parser offset.
-                parser.offset = 0
+                    # Finally, reset the parser offset.
+                    parser.offset = 0
+                    
+            except ParseError as exc:
+                exc._enter(fieldname)
+                raise
+                
+            for fieldname, (offset_name, base) in self._offset_links.items():
+                position = pointers[offset_name] + \
+                           (self.offset if base is None else positions[base])
+                # The message runs to the end of its furthest section, so
+                # that anything following it (eg in an enclosing message)
+                # is found in the right place
+                end = self._measure_section(data, fieldname, position)
+                seeker = max(seeker, end)
+                if wanted is None or fieldname in wanted:
+                    unpacked[fieldname] = Reference(
+                        self._control[fieldname], data, position, 
+                        end - position
+                    )
+                
+            if alignments is not None:
+                seeker = self._skip_trailing(data, seeker, struct_align)
                     
             # Infer lengths
             self.length = seeker - self.offset
@@ -1507,3 +2647,306 @@ class SmartyParser(_ParsableBase):
             
             # Redundant if this wasn't newly created, but whatever
             return unpacked
+            
+    def _measure_section(self, data, fieldname, position):
+        ''' Returns the end of the section for fieldname at position,
+        decoding as little of it as possible.
+        '''
+        if not 0 <= position <= len(data):
+            raise ParseError('Section offset is outside of the data.', 
+                             reason='length_mismatch', offset=position, 
+                             data=data)
+        parser = self._control[fieldname]
+        # Unless a link just set it, any length is left over from the last
+        # pack or unpack
+        if not self._is_linked(fieldname):
+            del parser.length
+        parser.offset = position
+        try:
+            parser._infer_length()
+            end = position + parser._measure(data)
+        except ParseError as exc:
+            exc._enter(fieldname)
+            raise
+        finally:
+            parser.offset = 0
+        if end > len(data):
+            raise ParseError('Section is truncated.', 
+                             reason='length_mismatch', offset=end, data=data)
+        return end
+        
+    def _is_linked(self, fieldname):
+        ''' Returns True if the length (or count) of the named field is
+        set by link_length or link_count.
+        '''
+        return fieldname in self._defer_eval[0].values() or \
+               fieldname in self._count_links.values()
+        
+    def _skip_trailing(self, data, seeker, struct_align):
+        ''' Skips the trailing padding of an aligned message.
+        '''
+        seeker += (self.offset - seeker) % struct_align
+        if seeker > len(data):
+            raise ParseError('Aligned message is missing its trailing '
+                             'padding.', reason='length_mismatch', 
+                             offset=seeker, data=data)
+        return seeker
+        
+    def pack_into(self, buffer, offset, obj):
+        ''' Packs obj directly into buffer (any writable buffer, eg 
+        shared memory or an mmap) at offset, returning the number of 
+        bytes written. Messages made entirely of static, callback-free
+        fields are packed with a single precompiled struct.
+        '''
+        compiled = self._get_compiled()
+        if compiled is None:
+            data = self.pack(obj, pack_into=bytearray())
+            with memoryview(buffer) as view:
+                view.cast('B')[offset:offset + len(data)] = data
+            return len(data)
+            
+        packer, names, __, blobs, __ = compiled
+        values = [
+            obj[name] if type(obj[name]) is not memoryview 
+            else obj[name].tobytes() for name in names
+        ]
+        for index, length in blobs:
+            try:
+                mismatched = len(values[index]) != length
+            except TypeError as e:
+                raise ParseError('Failed to pack into buffer.', 
+                                 reason='invalid_value') from e
+            if mismatched:
+                raise ParseError('Data length does not match fixed-length '
+                                 'blob parser.', reason='length_mismatch')
+        try:
+            packer.pack_into(buffer, offset, *values)
+        except struct.error as e:
+            raise ParseError('Failed to pack into buffer.', 
+                             reason='invalid_value') from e
+        self.length = packer.size
+        return packer.size
+        
+    def unpack_from(self, buffer, offset=0):
+        ''' Unpacks a message from buffer at offset, as with unpack. 
+        Messages made entirely of static, callback-free fields are 
+        unpacked with a single precompiled struct, in which case Blobs
+        are returned as bytes (copied out of the buffer).
+        '''
+        compiled = self._get_compiled()
+        if compiled is None:
+            with memoryview(buffer) as view:
+                return self.unpack(view.cast('B')[offset:])
+                
+        packer, names, padding, __, __ = compiled
+        try:
+            values = packer.unpack_from(buffer, offset)
+        except struct.error as e:
+            raise ParseError('Failed to unpack from buffer.', 
+                             reason='length_mismatch') from e
+        unpacked = self._obj(**dict(zip(names, values)))
+        for name in padding:
+            unpacked[name] = None
+        self.length = packer.size
+        return unpacked
+        
+    def iter_unpack(self, unpack_from):
+        ''' Unpacks consecutive messages from unpack_from, yielding each
+        in turn, until all of unpack_from has been consumed.
+        '''
+        data = memoryview(unpack_from)
+        seeker = 0
+        while seeker < len(data):
+            yield self.unpack(data[seeker:])
+            seeker = _advance(seeker, self.length, data)
+            
+    def unpack_columns(self, source, fields=None):
+        ''' Unpacks consecutive messages into one column per field. See
+        smartyparse.columns.unpack_columns.
+        '''
+        from .columns import unpack_columns
+        return unpack_columns(self, source, fields=fields)
+        
+    def scan(self, unpack_from, where, fields=None):
+        ''' Like iter_unpack, but only yields the messages matching where,
+        a dict of {field: value} (with nested fields named by their
+        dotted paths). Values may also be predicates, called with the
+        field's value, eg {'version': lambda version: version >= 2}.
+        
+        Only the fields named in where are decoded to test each message;
+        non-matching messages are otherwise skipped over without being
+        unpacked. Matching messages are fully unpacked, unless fields
+        is defined, in which case only those fields are (see unpack).
+        '''
+        tests = {}
+        for path, expected in where.items():
+            if not callable(expected):
+                expected = functools.partial(operator.eq, expected)
+            tests[tuple(path.split('.'))] = expected
+            
+        # Resolve both projections once, rather than for every message
+        tested = _projection(list(where))
+        fields = _projection(fields)
+        
+        data = memoryview(unpack_from)
+        seeker = 0
+        while seeker < len(data):
+            message = data[seeker:]
+            candidate = self.unpack(message, fields=tested)
+            next_seeker = _advance(seeker, self.length, data)
+            
+            for path, test in tests.items():
+                value = candidate
+                for name in path:
+                    value = value[name]
+                if not test(value):
+                    break
+            else:
+                yield self.unpack(message, fields=fields)
+                
+            seeker = next_seeker
+            
+    def can_unpack(self, data, offset=0):
+        ''' Probes the leading fields, for as long as their positions
+        are static (ie, until reaching anything with a variable length,
+        or with callbacks that might redefine the fields after it).
+        '''
+        if self.callback_preunpack:
+            return True
+            
+        alignments = self._get_layout()[0]
+        start = offset
+        for fieldname, parser in self._control.items():
+            if fieldname in self._offset_links:
+                continue
+            if alignments is not None:
+                offset += (start - offset) % alignments[fieldname]
+            if not parser.can_unpack(data, offset):
+                return False
+            if not isinstance(parser, ParseHelper) or \
+                parser.parser.length is None or \
+                parser.callback_preunpack or parser.callback_postunpack:
+                    break
+            offset += parser.parser.length
+        return True
+        
+    def can_pack(self, obj):
+        ''' Probes the fields of obj, until reaching anything with 
+        callbacks that might redefine the fields after it.
+        '''
+        if self.callback_prepack:
+            return True
+            
+        for fieldname, parser in self._control.items():
+            if fieldname in self._exclude_from_obj:
+                continue
+            # Sections may be References, which aren't probed
+            if fieldname in self._offset_links and \
+                isinstance(obj.get(fieldname) if hasattr(obj, 'get') else 
+                           None, Reference):
+                    continue
+            try:
+                if not parser.can_pack(obj[fieldname]):
+                    return False
+            except (KeyError, TypeError):
+                return False
+            if not isinstance(parser, ParseHelper) or \
+                parser.callback_prepack or parser.callback_postpack:
+                    break
+        return True
+        
+    def _measure(self, unpack_from):
+        ''' Walks the fields from self.offset, decoding only the ones
+        needed to determine the total length (length fields, fields
+        with callbacks, etc). Messages with sections are unpacked, to
+        find where their sections end.
+        '''
+        if self.callback_preunpack or self.callback_postunpack or \
+            self._offset_links:
+                return super()._measure(unpack_from)
+            
+        with self._mutex:
+            data = memoryview(unpack_from)
+            seeker = self.offset
+            alignments, struct_align, __ = self._get_layout()
+            for fieldname in self._control:
+                parser = self._control[fieldname]
+                if alignments is not None:
+                    seeker += (self.offset - seeker) % alignments[fieldname]
+                parser.offset = seeker
+                # As in unpack, only linked lengths carry over
+                if not self._is_linked(fieldname):
+                    del parser.length
+                parser._infer_length()
+                seeker += parser._measure(data)
+                parser.offset = 0
+                
+            if alignments is not None:
+                seeker = self._skip_trailing(data, seeker, struct_align)
+            # Skipped fields are never checked against the data
+            if seeker > len(data):
+                raise ParseError('Message is truncated.', 
+                                 reason='length_mismatch', offset=seeker, 
+                                 data=data)
+            self.length = seeker - self.offset
+            return self.length
+            
+    def record_offsets(self, unpack_from):
+        ''' Scans unpack_from for consecutive messages, skipping over
+        anything that isn't needed to find their lengths. Returns an
+        array.array('Q') of the offset of each message, followed by the
+        end of the final message.
+        '''
+        data = memoryview(unpack_from)
+        offsets = array.array('Q', [0])
+        seeker = 0
+        while seeker < len(data):
+            seeker = _advance(seeker, self._measure(data[seeker:]), data)
+            offsets.append(seeker)
+        return offsets
+        
+    def parallel_unpack(self, source, workers=None, chunk_size=None,
+                        factory=None, offsets=None):
+        ''' Unpacks consecutive messages from source (a file path or a
+        bytes-like object) using a pool of worker processes, yielding
+        each message in order. See smartyparse.parallel.parallel_unpack.
+        '''
+        from .parallel import parallel_unpack
+        return parallel_unpack(self, source, workers=workers,
+                               chunk_size=chunk_size, factory=factory,
+                               offsets=offsets)
+                               
+    def _pack_batch(self, objs):
+        ''' Packs a batch of consecutive messages for parallel_pack.
+        '''
+        packed = bytearray()
+        end = 0
+        for obj in objs:
+            end = self._pack_at(obj, packed, end)
+        return packed
+        
+    def _pack_at(self, obj, packed, start, trusted=False):
+        ''' Packs obj directly into the (typically preallocated) packed
+        bytearray at start, returning the position just past the message.
+        Nothing in packed past the message is touched, unless it has to 
+        grow to fit. Post-pack callbacks need the message on its own, so
+        those fall back to an ordinary pack and copy.
+        '''
+        if self.callback_postpack:
+            data = self.pack(obj, pack_into=bytearray(), trusted=trusted)
+            packed[start:start + len(data)] = data
+            return start + len(data)
+            
+        with self._mutex:
+            end = self._pack_fields(obj, packed, start, trusted=trusted)
+            self.length = end - start
+            return end
+        
+    def parallel_pack(self, iterable, workers=None, out=None,
+                      chunk_size=1000, factory=None):
+        ''' Packs every object in iterable as consecutive messages, using
+        a pool of worker processes. See smartyparse.parallel.parallel_pack.
+        '''
+        from .parallel import parallel_pack
+        return parallel_pack(self, iterable, workers=workers, out=out,
+                             chunk_size=chunk_size, factory=factory)
@@ -0,0 +1,267 @@
+'''
+LICENSING
+-------------------------------------------------
+
+Smartyparse: A python library for smart dynamic binary de/encoding.
+    Copyright (C) 2016 Muterra, Inc.
+    
+    Contributors
+    ------------
+    Nick Badger
+        badg@muterra.io | badg@nickbadger.com | nickbadger.com
+
+    This library is free software; you can redistribute it and/or
+    modify it under the terms of the GNU Lesser General Public
+    License as published by the Free Software Foundation; either
+    version 2.1 of the License, or (at your option) any later version.
+
+    This library is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+    Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public
+    License along with this library; if not, write to the
+    Free Software Foundation, Inc.,
+    51 Franklin Street,
+    Fifth Floor,
+    Boston, MA  02110-1301 USA
+
+------------------------------------------------------
+
+'''
+
+# External deps
+import time
+import bisect
+import threading
+
+# Internal deps
+from .parsers import ParseError
+
+
+# ###############################################
+# Boilerplate
+# ###############################################
+
+
+__all__ = [
+    'MetricsRegistry',
+    'registry',
+    'LATENCY_BUCKETS',
+    'OTHER_ERROR',
+]
+
+
+# Upper bounds (in seconds) of the latency histogram buckets. Anything
+# slower than the last bound lands in a final, unbounded bucket.
+LATENCY_BUCKETS = (
+    1e-6, 2.5e-6, 5e-6, 
+    1e-5, 2.5e-5, 5e-5, 
+    1e-4, 2.5e-4, 5e-4, 
+    1e-3, 2.5e-3, 5e-3, 
+    1e-2, 2.5e-2, 5e-2, 
+    1e-1, 2.5e-1, 5e-1, 
+    1.0
+)
+
+# The error reason recorded for anything raised other than a ParseError
+OTHER_ERROR = 'other'
+
+
+# ###############################################
+# Helpers
+# ###############################################
+
+
+class _OpMetrics:
+    ''' Counters for a single operation (pack or unpack) on a single
+    named schema. Guarded by the lock of the owning _SchemaMetrics.
+    '''
+    __slots__ = ('calls', 'bytes', 'errors', 'latency_buckets', 
+                 'latency_sum')
+    
+    def __init__(self):
+        self.calls = 0
+        self.bytes = 0
+        self.errors = {}
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+        
+    def snapshot(self):
+        return {
+            'calls': self.calls,
+            'bytes': self.bytes,
+            'errors': dict(self.errors),
+            'latency': {
+                'buckets': LATENCY_BUCKETS,
+                'counts': tuple(self.latency_buckets),
+                'sum': self.latency_sum,
+            }
+        }
+        
+        
+class _SchemaMetrics:
+    ''' All of the metrics for one named schema.
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.ops = {'pack': _OpMetrics(), 'unpack': _OpMetrics()}
+        
+    def record(self, op, elapsed, length, reason=None):
+        ''' Records a single call. elapsed is in seconds; reason is the
+        ParseError reason (or OTHER_ERROR) if the call failed.
+        '''
+        bucket = bisect.bisect_left(LATENCY_BUCKETS, elapsed)
+        with self._lock:
+            metrics = self.ops[op]
+            metrics.calls += 1
+            metrics.latency_buckets[bucket] += 1
+            metrics.latency_sum += elapsed
+            if reason is None:
+                metrics.bytes += length
+            else:
+                metrics.errors[reason] = metrics.errors.get(reason, 0) + 1
+                
+    def snapshot(self):
+        with self._lock:
+            return {op: metrics.snapshot() for op, metrics in 
+                    self.ops.items()}
+                    
+                    
+def _timed(registry, name, parsable, op, lock):
+    ''' Wraps the pack or unpack method of a tracked parsable. lock is
+    shared by both wrappers, so that nothing else can change the length
+    of the parsable before it's recorded.
+    '''
+    method = getattr(parsable, op)
+    
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            with lock:
+                result = method(*args, **kwargs)
+                # A new buffer (or lease) is exactly the packed message,
+                # but a nested pack returns its parent's whole buffer.
+                if op == 'pack' and _pack_into(*args, **kwargs) is None:
+                    length = len(result)
+                else:
+                    length = parsable.length or 0
+        except ParseError as exc:
+            registry._get(name).record(op, time.perf_counter() - start, 0,
+                                       exc.reason)
+            raise
+        except Exception:
+            registry._get(name).record(op, time.perf_counter() - start, 0,
+                                       OTHER_ERROR)
+            raise
+        registry._get(name).record(op, time.perf_counter() - start, length)
+        return result
+    
+    # Remember whatever was on the instance before (if anything), so that
+    # untracking can put it back.
+    wrapper.replaced = vars(parsable).get(op)
+    wrapper.registry = registry
+    return wrapper
+
+
+def _pack_into(obj, pack_into=None, *args, **kwargs):
+    ''' Picks pack_into out of the arguments to pack.
+    '''
+    return pack_into
+
+
+# ###############################################
+# Public API
+# ###############################################
+
+
+class MetricsRegistry:
+    ''' A set of named schemas, each with pack and unpack counters for
+    calls, bytes processed, errors (by ParseError.reason), and a
+    latency histogram.
+    
+    Metrics are pulled rather than pushed: call snapshot() whenever
+    they're needed (eg from an exporter), and derive rates by comparing
+    successive snapshots. Tracking is opt-in per schema (see track());
+    untracked schemas pay nothing.
+    '''
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._schemas = {}
+        self._started = time.time()
+        
+    def _get(self, name):
+        schema_metrics = self._schemas.get(name)
+        if schema_metrics is None:
+            with self._lock:
+                schema_metrics = self._schemas.setdefault(name, 
+                                                          _SchemaMetrics())
+        return schema_metrics
+        
+    def track(self, schema, name):
+        ''' Starts recording every pack and unpack of schema under name.
+        That includes those made by any parent schema that contains it,
+        so a tracked field is counted once per pack or unpack of its
+        parent. Several schemas may share a name, in which case their
+        metrics are combined.
+        '''
+        self.untrack(schema)
+        self._get(name)
+        lock = threading.RLock()
+        schema.pack = _timed(self, name, schema, 'pack', lock)
+        schema.unpack = _timed(self, name, schema, 'unpack', lock)
+        
+    def untrack(self, schema):
+        ''' Stops recording schema. Already-recorded metrics are kept.
+        '''
+        for op in ('pack', 'unpack'):
+            method = vars(schema).get(op)
+            if getattr(method, 'registry', None) is self:
+                if method.replaced is None:
+                    delattr(schema, op)
+                else:
+                    setattr(schema, op, method.replaced)
+                    
+    def snapshot(self):
+        ''' Returns a point-in-time copy of all metrics, as plain dicts:
+        
+        {
+            'timestamp': time.time(),
+            'started': time.time() at creation or the last reset(),
+            'schemas': {
+                name: {
+                    'pack': {'calls', 'bytes', 'errors', 'latency'},
+                    'unpack': {...}
+                }
+            }
+        }
+        
+        errors maps each ParseError reason to its count, with any other
+        exception counted under OTHER_ERROR. latency has the
+        bucket upper bounds (in seconds), the count of calls in each
+        bucket (with one extra for anything slower than the last bound),
+        and the sum of all latencies.
+        '''
+        with self._lock:
+            schemas = dict(self._schemas)
+            
+        return {
+            'timestamp': time.time(),
+            'started': self._started,
+            'schemas': {name: schema_metrics.snapshot() for 
+                        name, schema_metrics in schemas.items()}
+        }
+        
+    def reset(self):
+        ''' Zeroes every counter, without untracking anything.
+        '''
+        with self._lock:
+            for name in self._schemas:
+                self._schemas[name] = _SchemaMetrics()
+            self._started = time.time()
+
+
+# The process-wide default registry
+registry = MetricsRegistry()
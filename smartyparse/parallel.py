@@ -0,0 +1,358 @@
+'''
+LICENSING
+-------------------------------------------------
+
+Smartyparse: A python library for smart dynamic binary de/encoding.
+    Copyright (C) 2016 Muterra, Inc.
+    
+    Contributors
+    ------------
+    Nick Badger
+        badg@muterra.io | badg@nickbadger.com | nickbadger.com
+
+    This library is free software; you can redistribute it and/or
+    modify it under the terms of the GNU Lesser General Public
+    License as published by the Free Software Foundation; either
+    version 2.1 of the License, or (at your option) any later version.
+
+    This library is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+    Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public
+    License along with this library; if not, write to the
+    Free Software Foundation, Inc.,
+    51 Franklin Street,
+    Fifth Floor,
+    Boston, MA  02110-1301 USA
+
+------------------------------------------------------
+
+'''
+
+# External deps
+import os
+import mmap
+import array
+import itertools
+import collections
+import multiprocessing
+import concurrent.futures
+
+# Internal deps
+from .core import _SPOMeta
+from .core import ListyParser
+
+
+# ###############################################
+# Boilerplate
+# ###############################################
+
+
+__all__ = [
+    'parallel_unpack',
+    'parallel_pack',
+]
+
+
+# ###############################################
+# Worker state
+# ###############################################
+
+
+# In the parent, this holds (schema, view) for each running job, so that
+# forked workers inherit them without any pickling. Keys are job tokens.
+_inherited = {}
+# In workers, the schema built by factory (if any)
+_worker_schema = None
+# In workers, any sources opened so far, so they're only mapped once
+_worker_sources = {}
+# Unique token for every job started in this process
+_job_counter = itertools.count()
+
+
+def _init_worker(factory):
+    ''' Process pool initializer.
+    '''
+    global _worker_schema
+    if factory is not None:
+        _worker_schema = factory()
+        
+        
+def _resolve_schema(token):
+    if _worker_schema is not None:
+        return _worker_schema
+    return _inherited[token][0]
+    
+    
+def _open_source(token, kind, name):
+    ''' Maps the source into the worker (once), returning a memoryview.
+    '''
+    key = (kind, name)
+    if key not in _worker_sources:
+        if kind == 'inherited':
+            view = _inherited[token][1]
+            keepalive = None
+            
+        elif kind == 'path':
+            with open(name, 'rb') as f:
+                keepalive = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            view = memoryview(keepalive)
+            
+        else:
+            from multiprocessing import shared_memory
+            keepalive = shared_memory.SharedMemory(name=name)
+            view = keepalive.buf
+            
+        _worker_sources[key] = (keepalive, view)
+        
+    return _worker_sources[key][1]
+    
+    
+def _detach(obj):
+    ''' Copies anything referencing the worker's mapped source (ie
+    memoryviews) so that it can be returned to the parent.
+    '''
+    if isinstance(obj, memoryview):
+        # Arrays unpack to typed views; keep them typed
+        if obj.format != 'B':
+            return array.array(obj.format, obj.tobytes())
+        return obj.tobytes()
+    elif isinstance(obj, tuple):
+        return tuple(_detach(item) for item in obj)
+    elif isinstance(obj, list):
+        return [_detach(item) for item in obj]
+    elif isinstance(type(obj), _SPOMeta):
+        for key, value in obj.items():
+            obj[key] = _detach(value)
+    return obj
+    
+    
+def _unpack_chunk(token, kind, name, start, stop):
+    ''' Worker entry point: unpacks every message between start and stop.
+    '''
+    schema = _resolve_schema(token)
+    view = _open_source(token, kind, name)
+    return [_detach(obj) for obj in schema.iter_unpack(view[start:stop])]
+    
+    
+def _pack_chunk(token, objs):
+    ''' Worker entry point: packs a contiguous slice of objects.
+    '''
+    return _resolve_schema(token)._pack_batch(objs)
+    
+    
+# ###############################################
+# Public API
+# ###############################################
+    
+    
+def _pool(workers, factory):
+    ''' Creates the process pool. Without a factory, workers must be
+    forked, so that they can inherit the schema.
+    '''
+    if factory is None:
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            raise ValueError('A schema factory is required on platforms that '
+                             'cannot fork.')
+        context = multiprocessing.get_context('fork')
+    else:
+        context = None
+        
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=context,
+        initializer=_init_worker,
+        initargs=(factory,)
+    )
+    
+    
+def _chunk_bounds(offsets, chunk_size):
+    ''' Splits the record offsets into (start, stop) byte ranges of
+    chunk_size records each.
+    '''
+    last = len(offsets) - 1
+    for first in range(0, last, chunk_size):
+        yield offsets[first], offsets[min(first + chunk_size, last)]
+        
+        
+def parallel_unpack(schema, source, workers=None, chunk_size=None,
+                    factory=None, offsets=None):
+    ''' Unpacks consecutive messages from source using a pool of worker
+    processes, yielding each message in order.
+    
+    source may be a file path or a bytes-like object. Files are mapped
+    by each worker; buffers are inherited by forked workers, or placed
+    into shared memory otherwise. Either way, the input itself is never
+    pickled. Blobs are returned as bytes instead of memoryviews, and
+    Arrays as array.arrays.
+    
+    offsets may be an existing array of message offsets (followed by
+    the end of the final message), as returned by record_offsets.
+    Otherwise, source is scanned for message boundaries first.
+    
+    factory, if given, must be a picklable callable returning an
+    equivalent schema; it's called once in every worker. Without it,
+    workers are forked, and inherit the schema.
+    '''
+    workers = workers or os.cpu_count() or 1
+    token = next(_job_counter)
+    
+    if isinstance(source, (str, os.PathLike)):
+        kind = 'path'
+        source = os.fspath(source)
+    else:
+        source = memoryview(source).cast('B')
+        kind = 'inherited' if factory is None else 'shm'
+            
+    return _parallel_unpack(schema, token, kind, source, workers, 
+                            chunk_size, factory, offsets)
+    
+
+def _parallel_unpack(schema, token, kind, source, workers, chunk_size,
+                     factory, offsets):
+    ''' Generator half of parallel_unpack, so that argument errors raise
+    immediately instead of on first iteration. Files and shared memory
+    are only opened once iterating starts, so that a generator that's
+    never iterated has nothing to clean up.
+    '''
+    keepalive = None
+    shm = None
+    try:
+        if kind == 'path':
+            name = source
+            view = memoryview(b'')
+            if offsets is None:
+                with open(name, 'rb') as f:
+                    if os.fstat(f.fileno()).st_size:
+                        keepalive = mmap.mmap(f.fileno(), 0,
+                                              access=mmap.ACCESS_READ)
+                        view = memoryview(keepalive)
+        elif kind == 'inherited':
+            name = token
+            view = source
+        else:
+            from multiprocessing import shared_memory
+            view = source
+            shm = shared_memory.SharedMemory(create=True, 
+                                             size=max(len(view), 1))
+            shm.buf[:len(view)] = view
+            name = shm.name
+            
+        if offsets is None:
+            offsets = schema.record_offsets(view)
+        # Don't hold on to the parent's mapping any longer than needed
+        if kind != 'inherited':
+            view.release()
+            if keepalive is not None:
+                keepalive.close()
+        
+        records = len(offsets) - 1
+        if records < 1:
+            return
+        if chunk_size is None:
+            chunk_size = max(1, -(-records // (workers * 4)))
+            
+        # Forked workers inherit this, but only use the view if inherited
+        _inherited[token] = (schema, view)
+            
+        with _pool(workers, factory) as executor:
+            # Keep a bounded window of chunks in flight, so that a slow
+            # consumer doesn't accumulate the whole result in memory.
+            bounds = _chunk_bounds(offsets, chunk_size)
+            pending = collections.deque()
+            for start, stop in itertools.islice(bounds, workers * 2):
+                pending.append(executor.submit(
+                    _unpack_chunk, token, kind, name, start, stop
+                ))
+                
+            while pending:
+                results = pending.popleft().result()
+                for start, stop in itertools.islice(bounds, 1):
+                    pending.append(executor.submit(
+                        _unpack_chunk, token, kind, name, start, stop
+                    ))
+                yield from results
+                
+    finally:
+        _inherited.pop(token, None)
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+            
+            
+def parallel_pack(schema, iterable, workers=None, out=None, chunk_size=1000,
+                  factory=None):
+    ''' Packs every object in iterable using a pool of worker processes,
+    each of which packs a contiguous chunk of chunk_size objects. The
+    chunks are written out in order, followed by the terminant (if
+    schema is a ListyParser with one), and are byte-identical to serial
+    packing.
+    
+    out may be a file path or a writable file-like object, in which case
+    only a bounded window of chunks is ever held in memory, and the
+    number of bytes written is returned. If out is None, a bytearray of
+    everything packed is returned instead.
+    
+    ListyParser terminants are packed on their own, and never see the
+    rest of the list. ListyParsers with pack callbacks must see the
+    whole list, and cannot be packed in parallel.
+    
+    factory behaves exactly as in parallel_unpack. Objects themselves
+    must be picklable.
+    '''
+    if isinstance(schema, ListyParser) and \
+        (schema.callback_prepack or schema.callback_postpack):
+            raise ValueError('ListyParsers with pack callbacks cannot be '
+                             'packed in parallel.')
+            
+    if out is None:
+        buffer = bytearray()
+        _parallel_pack(schema, iterable, workers, buffer.extend, chunk_size,
+                       factory)
+        return buffer
+        
+    elif isinstance(out, (str, os.PathLike)):
+        with open(out, 'wb') as f:
+            return _parallel_pack(schema, iterable, workers, f.write,
+                                  chunk_size, factory)
+                                  
+    else:
+        return _parallel_pack(schema, iterable, workers, out.write,
+                              chunk_size, factory)
+                              
+                              
+def _parallel_pack(schema, iterable, workers, write, chunk_size, factory):
+    workers = workers or os.cpu_count() or 1
+    token = next(_job_counter)
+    written = 0
+    
+    objs = iter(iterable)
+    chunks = iter(lambda: list(itertools.islice(objs, chunk_size)), [])
+    
+    try:
+        _inherited[token] = (schema, None)
+        with _pool(workers, factory) as executor:
+            pending = collections.deque()
+            for chunk in itertools.islice(chunks, workers * 2):
+                pending.append(executor.submit(_pack_chunk, token, chunk))
+                
+            while pending:
+                packed = pending.popleft().result()
+                for chunk in itertools.islice(chunks, 1):
+                    pending.append(executor.submit(_pack_chunk, token, chunk))
+                write(packed)
+                written += len(packed)
+                
+    finally:
+        _inherited.pop(token, None)
+        
+    if isinstance(schema, ListyParser) and schema.terminant is not None:
+        with schema._mutex:
+            packed = bytearray()
+            schema._pack_terminant(packed)
+        write(packed)
+        written += len(packed)
+        
+    return written
@@ -34,8 +34,12 @@ Smartyparse: A python library for smart dynamic binary de/encoding.
 # Global dependencies
 import logging
 import struct
+import sys
+import array
 import abc
 import collections
+import re
+import operator
 
 
 # ###############################################
@@ -56,11 +60,169 @@ logger = logging.getLogger(__name__)
 
 
 class ParseError(RuntimeError):
-    pass
-
-
+    ''' Raised whenever data cannot be packed or unpacked. reason is a
+    short, stable identifier for the kind of failure (for example, 
+    'literal_mismatch'), suitable for aggregating into metrics.
+    
+    As the error propagates, the parsables it passes through attach 
+    their context: the path of the field that failed, its offset within
+    the data, and its expected and actual lengths. Only a copy of at
+    most context_limit bytes either side of the failure is kept, so 
+    ParseErrors never hold on to the buffer being parsed (or any mmap
+    behind it). Nothing is rendered until str() or hexdump() is called.
+    '''
+    reason = 'unspecified'
+    offset = None
+    expected_length = None
+    actual_length = None
+    # The most context that hexdump() can show
+    context_limit = 256
+    _window = b''
+    _window_start = 0
+    
+    def __init__(self, *args, reason=None, offset=None, data=None):
+        super().__init__(*args)
+        if reason is not None:
+            self.reason = reason
+        self._path = []
+        if offset is not None:
+            self._locate(offset, data=data)
+            
+    @property
+    def path(self):
+        ''' The names of the fields (or indices of the list items) 
+        containing the failure, outermost first.
+        '''
+        return tuple(reversed(self._path))
+        
+    def _enter(self, name):
+        ''' Called by each containing parsable, innermost first.
+        '''
+        self._path.append(name)
+        
+    def _locate(self, offset, expected_length=None, actual_length=None, 
+                data=None):
+        ''' Records where the error occurred. Only the innermost (first)
+        location is kept.
+        '''
+        if self.offset is None:
+            self.offset = offset
+            self.expected_length = expected_length
+            self.actual_length = actual_length
+            if data is not None:
+                # Keep hexdump lines aligned
+                start = max(offset - self.context_limit, 0) // 16 * 16
+                with memoryview(data) as view:
+                    self._window = bytes(
+                        view[start:offset + self.context_limit]
+                    )
+                self._window_start = start
+            
+    def hexdump(self, context=32):
+        ''' Renders a hexdump of at most context bytes (up to 
+        context_limit) on either side of the failure offset.
+        '''
+        if self.offset is None:
+            return ''
+            
+        context = min(context, self.context_limit)
+        start = max(self.offset - context, 0) // 16 * 16
+        window = self._window[start - self._window_start:
+                              self.offset + context - self._window_start]
+        lines = []
+        for line_start in range(0, len(window), 16):
+            chunk = window[line_start:line_start + 16]
+            lines.append('{:08x}  {:<47}  |{}|'.format(
+                start + line_start, 
+                chunk.hex(' '),
+                ''.join(chr(b) if 32 <= b < 127 else '.' for b in chunk)
+            ))
+        return '\n'.join(lines)
+        
+    def __str__(self):
+        message = super().__str__()
+        context = []
+        if self._path:
+            context.append('field ' + ''.join(
+                '[{}]'.format(name) if isinstance(name, int) else '.' + name
+                for name in self.path
+            ).lstrip('.'))
+        if self.offset is not None:
+            context.append('offset {}'.format(self.offset))
+        if self.expected_length is not None:
+            context.append('expected {} bytes'.format(self.expected_length))
+        if self.actual_length is not None:
+            context.append('got {} bytes'.format(self.actual_length))
+            
+        if context:
+            message += ' (' + ', '.join(context) + ')'
+        return message
+        
+        
+class InternTable:
+    ''' A bounded table of canonical values. Equal strings (or bytes)
+    unpacked by parsers sharing a table are returned as the very same
+    object, so that heavily repeated values are only held in memory 
+    once. When the table reaches max_size values, it starts over.
+    '''
+    
+    def __init__(self, max_size=65536):
+        self.max_size = max_size
+        self._values = {}
+        
+    def __reduce__(self):
+        # Canonical values only mean anything within one process
+        return (type(self), (self.max_size,))
+        
+    def __len__(self):
+        return len(self._values)
+        
+    def intern(self, value):
+        canonical = self._values.get(value)
+        if canonical is None:
+            if len(self._values) >= self.max_size:
+                self._values.clear()
+            self._values[value] = canonical = value
+        return canonical
+        
+        
+def _intern_table(intern):
+    ''' Parsers take intern=True for their own table, or an InternTable
+    to share one (eg across a whole schema).
+    '''
+    if isinstance(intern, InternTable):
+        return intern
+    elif intern:
+        return InternTable()
+    return None
+        
+    
 class ParserBase(metaclass=abc.ABCMeta):
     length = None
+    # Delimited parsers have no fixed length, but can discover it by
+    # searching the data for their own end (see find_length).
+    delimited = False
+    
+    def find_length(self, data):
+        ''' For delimited parsers, returns the number of bytes at the
+        start of data that belong to the value, including any delimiter.
+        Returns None if unknown.
+        '''
+        return None
+    
+    def can_unpack(self, data, offset=0):
+        ''' Cheaply checks whether the data at offset could possibly be
+        unpacked by this parser. False means it definitely cannot; True
+        means it might (unpack may still raise).
+        '''
+        return True
+        
+    def can_pack(self, obj):
+        ''' Cheaply checks whether obj could possibly be packed by this 
+        parser. False means it definitely cannot; True means it might 
+        (pack may still raise).
+        '''
+        return True
     
     @abc.abstractmethod
     def unpack(self, data):
@@ -89,29 +251,96 @@ class _StructParserBase(ParserBase):
             raise ValueError('endian must be "big" or "little".')
             
         self._packer = struct.Struct(e + descriptor)
+        self._build_range(descriptor)
+        
+    def __getstate__(self):
+        # Structs can't be pickled, but their formats can
+        state = self.__dict__.copy()
+        state['_packer'] = self._packer.format
+        return state
+        
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._packer = struct.Struct(state['_packer'])
+        
+    def _build_range(self, descriptor):
+        ''' Integers get their range checked when probing.
+        '''
+        if descriptor in 'bBhHiIqQ':
+            bits = self._packer.size * 8
+            if descriptor.islower():
+                self._range = (-(1 << (bits - 1)), (1 << (bits - 1)) - 1)
+            else:
+                self._range = (0, (1 << bits) - 1)
+        else:
+            self._range = None
+            
+    def _array_typecode(self):
+        ''' Returns the array.array typecode for this parser's values,
+        or None if there isn't one.
+        '''
+        code = self._packer.format[-1]
+        if code in 'fd':
+            return code
+        elif code == '?':
+            return 'B'
+            
+        # Struct sizes are standard, but array's are native
+        for candidate in ('bhilq' if code.islower() else 'BHILQ'):
+            if array.array(candidate).itemsize == self._packer.size:
+                return candidate
+        return None
+        
+    def _native_order(self):
+        ''' True if values are stored in the host's byte order (or are
+        single bytes, and so have no order).
+        '''
+        if self._packer.size == 1:
+            return True
+        return (self._packer.format[0] == '<') == (sys.byteorder == 'little')
     
     @property
     def length(self):
         return self._packer.size
+        
+    def can_unpack(self, data, offset=0):
+        return len(data) - offset >= self._packer.size
+        
+    def can_pack(self, obj):
+        if self._range is None:
+            return True
+        try:
+            value = operator.index(obj)
+        except TypeError:
+            return False
+        return self._range[0] <= value <= self._range[1]
     
     def unpack(self, data):
         try:
             return self._packer.unpack(data)[0]
         except struct.error as e:
-            raise ParseError('Failed to parse value.') from e
+            raise ParseError('Failed to parse value.', 
+                             reason='invalid_value') from e
         
     def pack(self, obj):
         try:
             return self._packer.pack(obj)
         except struct.error as e:
-            raise ParseError('Failed to parse value.') from e
+            raise ParseError('Failed to parse value.', 
+                             reason='invalid_value') from e
         
 
 class Blob(ParserBase):
     ''' Class for a binary blob. Creates a bytes object from a 
     memoryview, and a memoryview from bytes.
-    '''    
-    def __init__(self, length=None):
+    
+    By default, unpacking returns a memoryview of the data, without
+    copying it. If intern is True (or an InternTable to share), it 
+    returns bytes instead, with repeated values sharing one object.
+    '''
+    _intern = None
+    
+    def __init__(self, length=None, intern=False):
         # Try a numeric comparison to evaluate typing on length
         if length != None:
             try:
@@ -122,6 +351,7 @@ class Blob(ParserBase):
             except Exception:
                 raise TypeError('Length must be int-like.')
         self._length = length
+        self._intern = _intern_table(intern)
         
     @property
     def length(self):
@@ -129,24 +359,44 @@ class Blob(ParserBase):
     
     def unpack(self, data):
         if self.length != None and len(data) != self.length:
-            raise ParseError('Data length does not match fixed-length blob parser.')
+            raise ParseError('Data length does not match fixed-length blob '
+                             'parser.', reason='length_mismatch')
         
+        if self._intern is not None:
+            return self._intern.intern(bytes(data))
+            
         # Efficiently expose the data
         return memoryview(data)
         
-    def pack(self, obj):
-        if self.length != None and len(obj) != self.length:
-            raise ParseError('Data length does not match fixed-length blob parser.')
+    def can_unpack(self, data, offset=0):
+        return self.length is None or len(data) - offset >= self.length
         
-        # Try to freeze the data
+    def can_pack(self, obj):
+        if self.length is None:
+            return True
+        try:
+            return memoryview(obj).nbytes == self.length
+        except TypeError:
+            return False
+        
+    def pack(self, obj):
+        # Don't freeze the data: it gets copied into the packed buffer
+        # anyway, and pack_iov needs the original object. Just make sure
+        # its length is counted in bytes.
         if isinstance(obj, memoryview):
-            out = bytes(obj)
-        elif isinstance(obj, bytearray):
-            out = bytes(obj)
-        else:
-            out = obj
+            if obj.format != 'B':
+                obj = obj.cast('B')
+        elif not isinstance(obj, (bytes, bytearray)):
+            # Eg array.array, whose len() counts items
+            view = memoryview(obj)
+            if view.itemsize != 1 or view.ndim != 1:
+                obj = view.cast('B')
             
-        return out
+        if self.length != None and len(obj) != self.length:
+            raise ParseError('Data length does not match fixed-length blob '
+                             'parser.', reason='length_mismatch')
+            
+        return obj
         
 
 class Padding(ParserBase):
@@ -164,12 +414,16 @@ class Padding(ParserBase):
     
     def unpack(self, data):
         if len(data) != self.length:
-            raise ParseError('Data length does not match fixed-length padding parser.')
+            raise ParseError('Data length does not match fixed-length padding '
+                             'parser.', reason='length_mismatch')
         # Could check the padding is 'valid' if we'd like, but no need yet
         
         # Always return None
         return None
         
+    def can_unpack(self, data, offset=0):
+        return len(data) - offset >= self.length
+        
     def pack(self, obj):
         # No object validation or anything.
         # Return it as bytes.
@@ -207,7 +461,8 @@ class Literal(ParserBase):
             if data != self.value:
                 raise ParseError(
                     'Mismatched literal: received ' + str(bytes(data)) +
-                    ', expected ' + str(self.value)
+                    ', expected ' + str(self.value),
+                    reason='literal_mismatch'
                 )
             else:
                 unpacked = self.value
@@ -217,10 +472,20 @@ class Literal(ParserBase):
             
         return unpacked
         
+    def can_unpack(self, data, offset=0):
+        # Only compares the prefix; the rest of data is never touched
+        if not self._verify:
+            return True
+        return data[offset:offset + self._length] == self._literal
+        
+    def can_pack(self, obj):
+        return not self._verify or obj == self._literal
+        
     def pack(self, obj):
         # Enforce symmetricity if verify=True
         if self._verify and obj != self.value:
-            raise ParseError('Passed object does not match specified literal.')
+            raise ParseError('Passed object does not match specified literal.',
+                             reason='literal_mismatch')
                 
         # Return it as bytes.
         return self._literal
@@ -306,17 +571,233 @@ class ByteBool(_StructParserBase):
         super().__init__(endian, '?')
         
 
+class Array(ParserBase):
+    ''' Create a parser for a packed array of numbers, all parsed by 
+    element (an Int or Float parser, including its endianness).
+    
+    If count is defined, the array is fixed-length. Otherwise, its
+    length must come from elsewhere (eg link_length or link_count).
+    
+    Arrays in the host's byte order unpack to a memoryview, cast to the
+    element type, without copying anything. Otherwise, they unpack to a
+    byteswapped array.array copy. Either way, they pack from any buffer
+    of matching elements (eg array.array, memoryview or numpy arrays) in
+    a single copy, or from any other iterable of numbers.
+    '''
+    def __init__(self, element, count=None):
+        if not isinstance(element, _StructParserBase) or \
+            element._array_typecode() is None:
+                raise TypeError('element must be a numeric parser, eg Int32.')
+        if count is not None and (int(count) != count or count < 0):
+            raise ValueError('count must be a positive int.')
+            
+        self.element = element
+        self.count = count
+        self._typecode = element._array_typecode()
+        self._native = element._native_order()
+        self._itemsize = element.length
+        # Formats of buffers that can be copied in directly
+        self._compatible = {
+            code for code in 'bBhHiIlLqQfd' 
+            if array.array(code).itemsize == self._itemsize and
+            (code in 'fd') == (self._typecode in 'fd') and
+            code.islower() == self._typecode.islower()
+        }
+        
+    @property
+    def length(self):
+        if self.count is None:
+            return None
+        return self.count * self._itemsize
+        
+    def can_unpack(self, data, offset=0):
+        return self.count is None or len(data) - offset >= self.length
+        
+    def can_pack(self, obj):
+        try:
+            return self.count is None or len(obj) == self.count
+        except TypeError:
+            return True
+            
+    def unpack(self, data):
+        if len(data) % self._itemsize or \
+            (self.count is not None and len(data) != self.length):
+                raise ParseError('Data length does not match array parser.',
+                                 reason='length_mismatch')
+                                 
+        if self._native:
+            return memoryview(data).cast('B').cast(self._typecode)
+            
+        unpacked = array.array(self._typecode)
+        unpacked.frombytes(data)
+        unpacked.byteswap()
+        return unpacked
+        
+    def pack(self, obj):
+        try:
+            view = memoryview(obj)
+        except TypeError:
+            view = None
+            
+        # Matching buffers are passed through, and copied into place in a
+        # single step by the ParseHelper
+        if view is not None and view.c_contiguous and \
+            view.format.lstrip('@=') in self._compatible:
+                packed = view.cast('B')
+                if not self._native:
+                    swapped = array.array(self._typecode)
+                    swapped.frombytes(packed)
+                    swapped.byteswap()
+                    packed = memoryview(swapped).cast('B')
+                    
+        else:
+            # Anything else is converted element by element (note that
+            # array.array would treat bytes as raw machine values)
+            if view is not None:
+                obj = view.tolist()
+            try:
+                converted = array.array(self._typecode, obj)
+            except (TypeError, ValueError, OverflowError) as e:
+                raise ParseError('Failed to parse array.', 
+                                 reason='invalid_value') from e
+            if not self._native:
+                converted.byteswap()
+            packed = memoryview(converted).cast('B')
+            
+        if self.count is not None and len(packed) != self.length:
+            raise ParseError('Array length does not match fixed-length array '
+                             'parser.', reason='length_mismatch')
+        return packed
+        
+
 class String(ParserBase):
     ''' Create a parser for a string.
+    
+    If length is defined, creates a fixed-width string. Shorter strings
+    are filled out with pad when packing, and trailing pad is stripped
+    when unpacking.
+    
+    If intern is True (or an InternTable to share), repeated unpacked
+    strings share one object.
     '''
-    def __init__(self, encoding='utf-8'):
+    _intern = None
+    
+    def __init__(self, encoding='utf-8', length=None, pad=b'\x00', 
+                 intern=False):
         # Test the encoding before applying it
         __ = str.encode('hello', encoding=encoding)
         self.encoding = encoding
+        
+        if length is not None:
+            if int(length) != length or length < 0:
+                raise ValueError('Length must be a positive int.')
+            if not pad:
+                raise ValueError('pad cannot be empty.')
+            try:
+                # Strip the decoded pad, so unpacking only decodes once
+                self._pad_str = bytes.decode(bytes(pad), encoding=encoding)
+            except UnicodeDecodeError as e:
+                raise ValueError('pad must be decodable with encoding.') from e
+        
+        self._length = length
+        self._pad = bytes(pad)
+        self._intern = _intern_table(intern)
+        
+    @property
+    def length(self):
+        return self._length
+    
+    def unpack(self, data):
+        # str() decodes directly from the buffer, so there's no need to
+        # recast memoryviews into bytes first.
+        if self._length is None:
+            value = str(data, self.encoding)
+        elif len(data) != self._length:
+            raise ParseError('Data length does not match fixed-length string '
+                             'parser.', reason='length_mismatch')
+        else:
+            value = str(data, self.encoding)
+            # Strip whole pad units, not any of the characters in them
+            if len(self._pad_str) == 1:
+                value = value.rstrip(self._pad_str)
+            else:
+                while value.endswith(self._pad_str):
+                    value = value[:-len(self._pad_str)]
+            
+        if self._intern is not None:
+            return self._intern.intern(value)
+        return value
+        
+    def pack(self, obj):
+        encoded = str.encode(obj, encoding=self.encoding)
+        
+        if self._length is None:
+            return encoded
+            
+        shortfall = self._length - len(encoded)
+        if shortfall < 0 or shortfall % len(self._pad):
+            raise ParseError('Encoded string cannot be padded to fixed-length '
+                             'string parser.', reason='length_mismatch')
+        return encoded + self._pad * (shortfall // len(self._pad))
+        
+        
+class CString(ParserBase):
+    ''' Create a parser for a terminated (by default, null-terminated)
+    string. The terminator is included in the packed data, but not in
+    the unpacked string. intern is as for String.
+    '''
+    delimited = True
+    _intern = None
+    
+    def __init__(self, encoding='utf-8', terminator=b'\x00', intern=False):
+        # Test the encoding before applying it
+        __ = str.encode('hello', encoding=encoding)
+        if not terminator:
+            raise ValueError('terminator cannot be empty.')
+            
+        self.encoding = encoding
+        self._terminator = bytes(terminator)
+        # re searches any buffer in place, so memoryviews are never copied
+        self._search = re.compile(re.escape(self._terminator)).search
+        self._intern = _intern_table(intern)
+        
+    @property
+    def terminator(self):
+        return self._terminator
+        
+    def _find_terminator(self, data):
+        ''' Returns the first terminator match in data that's aligned to
+        the terminator's width, or None.
+        '''
+        width = len(self._terminator)
+        pos = 0
+        while True:
+            match = self._search(data, pos)
+            # Multi-byte terminators (eg utf-16) must align to code units
+            if match is None or not match.start() % width:
+                return match
+            pos = match.start() + 1
+        
+    def find_length(self, data):
+        match = self._find_terminator(data)
+        if match is None:
+            raise ParseError('String terminator not found.', 
+                             reason='missing_terminator')
+        return match.end()
     
     def unpack(self, data):
-        # Don't forget to recast, in cast of memoryview
-        return bytes.decode(bytes(data), encoding=self.encoding)
+        width = len(self._terminator)
+        if data[len(data) - width:] != self._terminator:
+            raise ParseError('String data does not end with terminator.',
+                             reason='missing_terminator')
+        value = str(data[:len(data) - width], self.encoding)
+        if self._intern is not None:
+            return self._intern.intern(value)
+        return value
         
     def pack(self, obj):
-        return str.encode(obj, encoding=self.encoding)
\ No newline at end of file
+        encoded = str.encode(obj, encoding=self.encoding)
+        if self._find_terminator(encoded) is not None:
+            raise ParseError('String cannot contain its own terminator.',
+                             reason='invalid_value')
+        return encoded + self._terminator
@@ -0,0 +1,167 @@
+'''
+LICENSING
+-------------------------------------------------
+
+Smartyparse: A python library for smart dynamic binary de/encoding.
+    Copyright (C) 2016 Muterra, Inc.
+    
+    Contributors
+    ------------
+    Nick Badger
+        badg@muterra.io | badg@nickbadger.com | nickbadger.com
+
+    This library is free software; you can redistribute it and/or
+    modify it under the terms of the GNU Lesser General Public
+    License as published by the Free Software Foundation; either
+    version 2.1 of the License, or (at your option) any later version.
+
+    This library is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+    Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public
+    License along with this library; if not, write to the
+    Free Software Foundation, Inc.,
+    51 Franklin Street,
+    Fifth Floor,
+    Boston, MA  02110-1301 USA
+
+------------------------------------------------------
+
+'''
+
+# External deps
+import os
+import types
+import pickle
+import hashlib
+import tempfile
+
+
+# ###############################################
+# Boilerplate
+# ###############################################
+
+
+__all__ = [
+    'dumps',
+    'loads',
+    'cached',
+]
+
+
+# Bump this whenever the pickled layout of parsables changes, so that
+# stale caches are rebuilt instead of loaded.
+SCHEMA_FORMAT = 1
+_MAGIC = b'SPSC'
+_HEADER_LENGTH = len(_MAGIC) + 1 + 32
+
+
+# ###############################################
+# Helpers
+# ###############################################
+
+
+def _fingerprint(key):
+    return hashlib.sha256(key.encode('utf-8')).digest()
+    
+    
+def _factory_key(factory):
+    ''' Derives a cache key from the factory's name and bytecode, so that
+    editing the factory invalidates the cache. Changes to anything the
+    factory calls are NOT detected; pass an explicit key for those.
+    '''
+    code = getattr(factory, '__code__', None)
+    if code is None:
+        raise TypeError('Cannot derive a key for factory; pass key instead.')
+    return '{}.{}:{}'.format(factory.__module__, factory.__qualname__, 
+                             _code_key(code))
+    
+    
+def _code_key(const):
+    ''' Renders a code object (or one of its constants) reproducibly. 
+    Nested code objects (lambdas, comprehensions, inner functions) are
+    rendered by their contents, not their (per-process) addresses, and
+    frozensets in a stable order regardless of hash randomization.
+    '''
+    if isinstance(const, types.CodeType):
+        return '<{}:{}:({}):{!r}>'.format(
+            const.co_name, const.co_code.hex(), 
+            ','.join(_code_key(value) for value in const.co_consts),
+            const.co_names
+        )
+    elif isinstance(const, tuple):
+        return '(' + ','.join(_code_key(value) for value in const) + ')'
+    elif isinstance(const, frozenset):
+        return '{' + ','.join(sorted(_code_key(value) for value in const)) + \
+               '}'
+    return repr(const)
+    
+    
+def _header(key):
+    return _MAGIC + bytes((SCHEMA_FORMAT,)) + _fingerprint(key)
+
+
+# ###############################################
+# Public API
+# ###############################################
+
+
+def dumps(schema, key=''):
+    ''' Serializes a finished schema (SmartyParser, ListyParser or 
+    ParseHelper, including everything nested within it) to bytes. Any
+    callbacks must themselves be picklable (ie, module-level functions,
+    not lambdas or closures); link_length's are.
+    '''
+    return _header(key) + pickle.dumps(schema, pickle.HIGHEST_PROTOCOL)
+    
+    
+def loads(data, key=''):
+    ''' Loads a schema serialized with dumps(). Raises ValueError if the
+    data was written with a different key, or by an incompatible 
+    version of smartyparse.
+    
+    Like any pickle, only load schemas from trusted sources.
+    '''
+    data = memoryview(data)
+    if data[:_HEADER_LENGTH] != _header(key):
+        raise ValueError('Not a compatible serialized schema.')
+    return pickle.loads(data[_HEADER_LENGTH:])
+    
+    
+def cached(path, factory, key=None):
+    ''' Returns the schema cached at path, if it was built with the same
+    key. Otherwise, builds it by calling factory(), and caches it at 
+    path for next time. By default, the key is derived from the factory
+    itself.
+    
+    The cache is replaced atomically, so concurrently starting workers
+    can safely share one path.
+    '''
+    if key is None:
+        key = _factory_key(factory)
+        
+    # Anything unloadable is rebuilt, including caches referring to 
+    # classes (or modules) that have since been renamed or removed
+    try:
+        with open(path, 'rb') as f:
+            return loads(f.read(), key)
+    except (OSError, ValueError, pickle.UnpicklingError, EOFError, 
+            AttributeError, ImportError):
+        pass
+        
+    schema = factory()
+    data = dumps(schema, key)
+    
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.smartyparse-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+        
+    return schema
@@ -0,0 +1,307 @@
+'''
+LICENSING
+-------------------------------------------------
+
+Smartyparse: A python library for smart dynamic binary de/encoding.
+    Copyright (C) 2016 Muterra, Inc.
+    
+    Contributors
+    ------------
+    Nick Badger
+        badg@muterra.io | badg@nickbadger.com | nickbadger.com
+
+    This library is free software; you can redistribute it and/or
+    modify it under the terms of the GNU Lesser General Public
+    License as published by the Free Software Foundation; either
+    version 2.1 of the License, or (at your option) any later version.
+
+    This library is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+    Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public
+    License along with this library; if not, write to the
+    Free Software Foundation, Inc.,
+    51 Franklin Street,
+    Fifth Floor,
+    Boston, MA  02110-1301 USA
+
+------------------------------------------------------
+
+'''
+
+# External deps
+# (time.perf_counter_ns is new in 3.7, which python_requires covers)
+import time
+import threading
+import collections
+
+# Internal deps
+from .parsers import ParseError
+
+
+# ###############################################
+# Boilerplate
+# ###############################################
+
+
+__all__ = [
+    'FieldProfiler',
+]
+
+
+# ###############################################
+# Helpers
+# ###############################################
+
+
+class _TracingControl(collections.OrderedDict):
+    ''' Stands in for SmartyParser._control while profiling, recording
+    which field is about to be parsed, so that shared (reused) parsables
+    can be attributed to the right path.
+    '''
+    __slots__ = ('profiler',)
+    
+    def __getitem__(self, name):
+        self.profiler._local.pending = name
+        return super().__getitem__(name)
+        
+    def __setitem__(self, name, value):
+        super().__setitem__(name, value)
+        # Fields may be redefined mid-parse (eg by callbacks)
+        profiler = getattr(self, 'profiler', None)
+        if profiler is not None and profiler.enabled:
+            profiler._instrument(value, name)
+            
+            
+class _TimedCallback:
+    ''' Wraps a _SmartyparseCallback, charging its time to the field
+    currently being parsed.
+    '''
+    def __init__(self, profiler, wrapped):
+        self.profiler = profiler
+        self.wrapped = wrapped
+        
+    def __call__(self, arg):
+        start = time.perf_counter_ns()
+        try:
+            return self.wrapped(arg)
+        finally:
+            frame = self.profiler._frame()
+            if frame is not None:
+                frame[2]['callback_ns'] += time.perf_counter_ns() - start
+                
+    def __bool__(self):
+        return bool(self.wrapped)
+        
+    def __getattr__(self, name):
+        return getattr(self.wrapped, name)
+        
+        
+_CALLBACKS = (
+    '_callback_prepack', 
+    '_callback_postpack', 
+    '_callback_preunpack', 
+    '_callback_postunpack'
+)
+
+
+def _new_stats():
+    return {
+        'calls': 0,
+        'total_ns': 0,
+        'callback_ns': 0,
+        'bytes': 0,
+        'errors': 0,
+        'failed_attempts': 0,
+    }
+
+
+# ###############################################
+# Public API
+# ###############################################
+
+
+class FieldProfiler:
+    ''' Opt-in, per-field instrumentation for a SmartyParser, ListyParser
+    or ParseHelper (and everything nested within it).
+    
+    While enabled, every pack and unpack call is recorded against its
+    field path (for example, 'first.body1'), with its call count, total
+    perf_counter_ns time (inclusive of any nested fields), the part of
+    that time spent in callbacks, the number of bytes processed, and
+    the number of ParseErrors raised. For ListyParsers,
+    failed_attempts counts the candidate parsers that failed before one
+    succeeded. ListyParser candidates are named by their index in
+    ListyParser.parsers, and terminants as 'terminant'.
+    
+    Instrumentation works by temporarily replacing methods and callbacks
+    on the instances themselves, so once disabled, the parsables are
+    exactly as they were, and profiling costs nothing.
+    '''
+    
+    def __init__(self, schema):
+        self.schema = schema
+        self.enabled = False
+        self._stats = {}
+        self._instrumented = {}
+        self._local = threading.local()
+        
+    def __enter__(self):
+        self.enable()
+        return self
+        
+    def __exit__(self, *exc):
+        self.disable()
+        
+    def enable(self):
+        if not self.enabled:
+            self.enabled = True
+            self._instrument(self.schema, '')
+        
+    def disable(self):
+        if not self.enabled:
+            return
+        self.enabled = False
+        
+        for parsable, originals in self._instrumented.values():
+            for attr in ('pack', 'unpack'):
+                # Put back anything else installed on the instance (eg
+                # metrics tracking), or fall back to the class method.
+                if originals[attr] is None:
+                    delattr(parsable, attr)
+                else:
+                    setattr(parsable, attr, originals[attr])
+            for attr in _CALLBACKS:
+                current = getattr(parsable, attr)
+                # Don't clobber callbacks registered while profiling
+                if isinstance(current, _TimedCallback) and \
+                    current.wrapped is originals[attr]:
+                        setattr(parsable, attr, originals[attr])
+                elif isinstance(current, _TimedCallback):
+                    setattr(parsable, attr, current.wrapped)
+            if isinstance(getattr(parsable, '_control', None), 
+                          _TracingControl):
+                parsable._control = collections.OrderedDict(parsable._control)
+                
+        self._instrumented.clear()
+        
+    def reset(self):
+        self._stats.clear()
+        
+    def report(self):
+        ''' Returns {path: {op: stats}}, where op is 'pack' or 'unpack',
+        and stats is a dict of calls, total_ns, callback_ns, parse_ns,
+        bytes, errors and failed_attempts.
+        '''
+        report = {}
+        for (path, op), stats in sorted(self._stats.items()):
+            stats = dict(stats)
+            stats['parse_ns'] = stats['total_ns'] - stats['callback_ns']
+            report.setdefault(path or '<root>', {})[op] = stats
+        return report
+        
+    def format(self):
+        ''' Renders the report as a fixed-width table.
+        '''
+        lines = ['{:<32} {:<6} {:>8} {:>12} {:>12} {:>12} {:>8} {:>8}'.format(
+            'field', 'op', 'calls', 'parse us', 'callback us', 'bytes', 
+            'errors', 'failed'
+        )]
+        for path, ops in self.report().items():
+            for op, stats in ops.items():
+                lines.append(
+                    '{:<32} {:<6} {:>8} {:>12.1f} {:>12.1f} {:>12} {:>8} '
+                    '{:>8}'.format(
+                        path, op, stats['calls'], stats['parse_ns'] / 1e3, 
+                        stats['callback_ns'] / 1e3, stats['bytes'], 
+                        stats['errors'], stats['failed_attempts']
+                    )
+                )
+        return '\n'.join(lines)
+        
+    def _frame(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack:
+            return stack[-1]
+        return None
+        
+    def _instrument(self, parsable, name):
+        ''' Recursively wraps parsable and anything nested within it.
+        '''
+        # Avoid circular import
+        from .core import _ParsableBase, SmartyParser, ListyParser
+        
+        if not isinstance(parsable, _ParsableBase) or \
+            id(parsable) in self._instrumented:
+                return
+                
+        originals = {attr: getattr(parsable, attr) for attr in _CALLBACKS}
+        originals['pack'] = vars(parsable).get('pack')
+        originals['unpack'] = vars(parsable).get('unpack')
+        self._instrumented[id(parsable)] = (parsable, originals)
+        
+        for attr in _CALLBACKS:
+            setattr(parsable, attr, _TimedCallback(self, originals[attr]))
+        parsable.pack = self._wrap(parsable, parsable.pack, 'pack', name)
+        parsable.unpack = self._wrap(parsable, parsable.unpack, 'unpack', 
+                                     name)
+        
+        if isinstance(parsable, SmartyParser):
+            control = _TracingControl(parsable._control)
+            control.profiler = self
+            parsable._control = control
+            for fieldname, child in control.items():
+                self._instrument(child, fieldname)
+                
+        elif isinstance(parsable, ListyParser):
+            for index, child in enumerate(parsable.parsers):
+                self._instrument(child, str(index))
+            self._instrument(parsable.terminant, 'terminant')
+            
+    def _wrap(self, parsable, method, op, default_name):
+        from .core import ListyParser
+        local = self._local
+        
+        def wrapper(*args, **kwargs):
+            # Fields of SmartyParsers are named as they're looked up
+            name = getattr(local, 'pending', None)
+            if name is None:
+                name = default_name
+            local.pending = None
+            
+            stack = getattr(local, 'stack', None)
+            if stack is None:
+                stack = local.stack = []
+            if stack:
+                parent = stack[-1]
+                path = parent[0] + '.' + name if parent[0] else name
+            else:
+                parent = None
+                path = name
+                
+            key = (path, op)
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = _new_stats()
+                
+            stack.append((path, parsable, stats))
+            start = time.perf_counter_ns()
+            try:
+                result = method(*args, **kwargs)
+            except ParseError:
+                stats['errors'] += 1
+                if parent is not None and isinstance(parent[1], ListyParser):
+                    parent[2]['failed_attempts'] += 1
+                raise
+            finally:
+                stats['total_ns'] += time.perf_counter_ns() - start
+                stats['calls'] += 1
+                stack.pop()
+                local.pending = None
+                
+            stats['bytes'] += parsable.length or 0
+            return result
+            
+        return wrapper
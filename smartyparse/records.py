@@ -0,0 +1,471 @@
+'''
+LICENSING
+-------------------------------------------------
+
+Smartyparse: A python library for smart dynamic binary de/encoding.
+    Copyright (C) 2016 Muterra, Inc.
+    
+    Contributors
+    ------------
+    Nick Badger
+        badg@muterra.io | badg@nickbadger.com | nickbadger.com
+
+    This library is free software; you can redistribute it and/or
+    modify it under the terms of the GNU Lesser General Public
+    License as published by the Free Software Foundation; either
+    version 2.1 of the License, or (at your option) any later version.
+
+    This library is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+    Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public
+    License along with this library; if not, write to the
+    Free Software Foundation, Inc.,
+    51 Franklin Street,
+    Fifth Floor,
+    Boston, MA  02110-1301 USA
+
+------------------------------------------------------
+
+'''
+
+# External deps
+import io
+import os
+import errno
+import sys
+import mmap
+import zlib
+import array
+import struct
+
+# Internal deps
+from .core import ListyParser
+
+
+# ###############################################
+# Boilerplate
+# ###############################################
+
+
+__all__ = [
+    'build_index',
+    'open_indexed',
+    'IndexedFile',
+    'RecordWriter',
+]
+
+
+# Index files are a small header followed by little-endian uint64 record
+# offsets: the start of every record, and then the end of the last one.
+# The header also records the size and mtime of the data file as it was
+# indexed, and the CRC32 of its last (up to) _TAIL_SIZE bytes, so that
+# files rewritten since can be told apart from ones appended to.
+_INDEX_MAGIC = b'SPIX'
+_INDEX_VERSION = 2
+_INDEX_HEADER = struct.Struct('<4sIQqI')
+_TAIL_SIZE = 4096
+
+
+# ###############################################
+# Helpers
+# ###############################################
+
+
+def _index_path(path, index_path):
+    if index_path is None:
+        return os.fspath(path) + '.idx'
+    return os.fspath(index_path)
+    
+    
+def _map(path):
+    ''' Read-only mmap of path, or None if it's empty (which can't be
+    mapped).
+    '''
+    with open(path, 'rb') as f:
+        if not os.fstat(f.fileno()).st_size:
+            return None
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        
+        
+def _scan(schema, path, start=0):
+    ''' Returns the offsets of the records in path, from start onwards.
+    '''
+    mapped = _map(path)
+    if mapped is None:
+        return array.array('Q', [start])
+        
+    try:
+        with memoryview(mapped) as view:
+            offsets = schema.record_offsets(view[start:])
+        if start:
+            offsets = array.array('Q', (offset + start for offset in offsets))
+        return offsets
+    finally:
+        try:
+            mapped.close()
+        # A ParseError's traceback still references slices of the mapping
+        # (through its frames); it will be closed once they're gone.
+        except BufferError:
+            pass
+        
+        
+def _fingerprint(path, size=None):
+    ''' Returns (size, mtime in ns, CRC32 of the tail) of the file at
+    path, as if it ended at size (by default, where it actually ends).
+    '''
+    with open(path, 'rb') as f:
+        stat = os.fstat(f.fileno())
+        if size is None:
+            size = stat.st_size
+        f.seek(max(size - _TAIL_SIZE, 0))
+        tail = f.read(min(size, _TAIL_SIZE))
+    return size, stat.st_mtime_ns, zlib.crc32(tail)
+    
+    
+def _is_current(path, fingerprint):
+    ''' Returns True if the file at path is as it was when fingerprinted
+    (except for anything appended to it since).
+    '''
+    size, mtime, crc = fingerprint
+    current = os.path.getsize(path)
+    if current == size:
+        return _fingerprint(path) == fingerprint
+    return current > size and _fingerprint(path, size)[2] == crc
+        
+        
+def _to_disk(offsets):
+    if sys.byteorder != 'little':
+        offsets = array.array('Q', offsets)
+        offsets.byteswap()
+    return offsets.tobytes()
+    
+    
+def _write_index(index_path, offsets, fingerprint):
+    tmp = index_path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(_INDEX_HEADER.pack(_INDEX_MAGIC, _INDEX_VERSION, 
+                                   *fingerprint))
+        f.write(_to_disk(offsets))
+    os.replace(tmp, index_path)
+    
+    
+def _extend_index(index_path, added, fingerprint):
+    ''' Appends offsets to the index, updating its fingerprint.
+    '''
+    with open(index_path, 'r+b') as f:
+        f.write(_INDEX_HEADER.pack(_INDEX_MAGIC, _INDEX_VERSION, 
+                                   *fingerprint))
+        f.seek(0, os.SEEK_END)
+        f.write(_to_disk(added))
+    
+    
+def _read_index(index_path):
+    ''' Returns the fingerprint and offsets stored in the index, or None
+    if it's missing or unreadable.
+    '''
+    try:
+        with open(index_path, 'rb') as f:
+            header = f.read(_INDEX_HEADER.size)
+            body = f.read()
+    except OSError:
+        return None
+        
+    if len(header) != _INDEX_HEADER.size:
+        return None
+    magic, version, *fingerprint = _INDEX_HEADER.unpack(header)
+    if (magic, version) != (_INDEX_MAGIC, _INDEX_VERSION):
+        return None
+            
+    # Ignore any partially-written trailing entry
+    offsets = array.array('Q')
+    offsets.frombytes(body[:len(body) - len(body) % offsets.itemsize])
+    if sys.byteorder != 'little':
+        offsets.byteswap()
+    if not offsets:
+        return None
+    return tuple(fingerprint), offsets
+
+
+# ###############################################
+# Public API
+# ###############################################
+
+
+def build_index(schema, path, index_path=None):
+    ''' Scans the file at path for the records of schema, and writes
+    their offsets to a sidecar index file (by default, path + '.idx').
+    Returns the offsets, as an array.array('Q') of the start of every
+    record, followed by the end of the last one.
+    
+    For SmartyParsers, records are consecutive messages, and only the 
+    fields needed to find their lengths are decoded (see
+    SmartyParser.record_offsets). For ListyParsers, records are the 
+    items of a single packed list.
+    '''
+    # Anything appended while scanning is picked up on open
+    fingerprint = _fingerprint(path)
+    offsets = _scan(schema, path)
+    _write_index(_index_path(path, index_path), offsets, fingerprint)
+    return offsets
+    
+    
+def open_indexed(schema, path, index_path=None):
+    ''' Opens the file at path for random access to its records, using
+    (and maintaining) its sidecar index. Any records appended since the
+    index was written are indexed on open. If the index is missing, or
+    the file has otherwise changed since it was indexed, it is rebuilt.
+    '''
+    return IndexedFile(schema, path, _index_path(path, index_path))
+    
+    
+class IndexedFile:
+    ''' Random access to the records of a file, through its index. 
+    Records are unpacked on access; indexing and slicing are O(1) in the
+    number of records.
+    
+    Unpacked Blobs reference the underlying file mapping, so they should
+    not be used after the IndexedFile is closed.
+    '''
+    
+    def __init__(self, schema, path, index_path):
+        self.schema = schema
+        self.path = os.fspath(path)
+        self.index_path = index_path
+        self._mapped = None
+        self._view = None
+        
+        index = _read_index(index_path)
+        if index is None or not _is_current(self.path, index[0]) or \
+            index[1][-1] > os.path.getsize(self.path):
+                offsets = build_index(schema, self.path, index_path)
+        else:
+            offsets = index[1]
+        self._offsets = offsets
+        self.refresh()
+        
+    def __enter__(self):
+        return self
+        
+    def __exit__(self, *exc):
+        self.close()
+        
+    def __len__(self):
+        return len(self._offsets) - 1
+        
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+            
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('Record index out of range.')
+            
+        start = self._offsets[index]
+        stop = self._offsets[index + 1]
+        view = self._ensure_mapped(stop)
+        
+        if isinstance(self.schema, ListyParser):
+            return self.schema._unpack_item(view[:stop], start)
+        return self.schema.unpack(view[start:stop])
+        
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+            
+    @property
+    def offsets(self):
+        ''' A read-only view of the record offsets.
+        '''
+        return memoryview(self._offsets).toreadonly()
+        
+    def refresh(self):
+        ''' Indexes any records appended to the file (by anyone) since
+        it was last indexed.
+        '''
+        end = self._offsets[-1]
+        if os.path.getsize(self.path) <= end:
+            return
+            
+        fingerprint = _fingerprint(self.path)
+        added = _scan(self.schema, self.path, end)[1:]
+        if added:
+            self._offsets.extend(added)
+            _extend_index(self.index_path, added, fingerprint)
+                
+    def append(self, obj):
+        ''' Packs obj as a new record at the end of the file, and indexes
+        it. Returns its record index.
+        '''
+        if isinstance(self.schema, ListyParser) and \
+            self.schema.terminant is not None:
+                raise ValueError('Cannot append to a terminated list.')
+                
+        self.refresh()
+        packed = self.schema._pack_batch([obj])
+        end = self._offsets[-1]
+        
+        with open(self.path, 'r+b') as f:
+            f.seek(end)
+            f.write(packed)
+            f.truncate()
+        
+        added = array.array('Q', [end + len(packed)])
+        self._offsets.extend(added)
+        _extend_index(self.index_path, added, _fingerprint(self.path))
+        return len(self) - 1
+        
+    def close(self):
+        if self._view is not None:
+            self._view.release()
+            try:
+                self._mapped.close()
+            # Records unpacked earlier may still reference the mapping; it
+            # will be closed once they're gone.
+            except BufferError:
+                pass
+            self._view = None
+            self._mapped = None
+            
+    def _ensure_mapped(self, stop):
+        ''' (Re)maps the file if it has grown past the current mapping.
+        '''
+        if self._view is None or len(self._view) < stop:
+            self.close()
+            self._mapped = _map(self.path)
+            self._view = memoryview(self._mapped)
+        return self._view
+        
+        
+class RecordWriter:
+    ''' Buffered, batched writing of records to a file-like object (or
+    a socket). Records are packed straight into a single reusable
+    buffer, which is written out once at least buffer_size bytes have
+    accumulated, so that many small records cost one write call instead
+    of one each.
+    
+    For SmartyParsers, records are consecutive messages. For 
+    ListyParsers, records are the items of a single list, and closing
+    the writer appends the terminant (if any), completing it. As the 
+    list is never seen as a whole, ListyParsers with pack callbacks 
+    can't be written this way.
+    
+    If a non-blocking file can't take everything, flush raises 
+    BlockingIOError, keeping whatever wasn't written for the next flush.
+    The file object itself is never closed. RecordWriters are not 
+    threadsafe.
+    '''
+    
+    def __init__(self, schema, fileobj, buffer_size=1 << 16, trusted=False):
+        if isinstance(schema, ListyParser) and \
+            (schema.callback_prepack or schema.callback_postpack):
+                raise ValueError('ListyParsers with pack callbacks cannot be '
+                                 'written record by record.')
+                                 
+        self.schema = schema
+        self.fileobj = fileobj
+        self.buffer_size = buffer_size
+        self.trusted = trusted
+        self.records = 0
+        self.closed = False
+        
+        # Sockets can only sendall; anything else partially written is
+        # retried until done. Only sendall and buffered (or text) files 
+        # write everything; a raw file returns None when it would block.
+        write = getattr(fileobj, 'write', None)
+        if write is None:
+            write = fileobj.sendall
+            self._writes_all = True
+        else:
+            self._writes_all = isinstance(
+                fileobj, (io.BufferedIOBase, io.TextIOBase))
+        self._write = write
+        self._buffer = bytearray(buffer_size)
+        self._fill = 0
+        
+    def __enter__(self):
+        return self
+        
+    def __exit__(self, exc_type, exc, tb):
+        # Don't complete a list that was interrupted partway through
+        if exc_type is None:
+            self.close()
+        else:
+            self.flush()
+            self.closed = True
+            
+    def write(self, obj):
+        ''' Packs obj as the next record, writing out the buffer if 
+        it's full.
+        '''
+        if self.closed:
+            raise ValueError('Cannot write to a closed RecordWriter.')
+            
+        # Anything partially packed by a failure is beyond _fill, and is
+        # simply overwritten by the next record.
+        self._fill = self.schema._pack_at(obj, self._buffer, self._fill,
+                                          self.trusted)
+        self.records += 1
+        if self._fill >= self.buffer_size:
+            self.flush()
+            
+    def write_many(self, objs):
+        for obj in objs:
+            self.write(obj)
+            
+    def flush(self):
+        ''' Writes out everything buffered so far, and flushes the file
+        object (if it can be).
+        '''
+        if self._fill:
+            try:
+                with memoryview(self._buffer) as view:
+                    self._write_all(view[:self._fill])
+            except BlockingIOError as exc:
+                # Keep only what's left, so a later flush can finish it
+                written = exc.characters_written
+                self._buffer[:self._fill - written] = \
+                    self._buffer[written:self._fill]
+                self._fill -= written
+                raise
+            self._fill = 0
+            
+            # Don't hold on to the memory from an outsized record forever
+            if len(self._buffer) > 2 * self.buffer_size:
+                self._buffer = bytearray(self.buffer_size)
+                
+        flush = getattr(self.fileobj, 'flush', None)
+        if flush is not None:
+            flush()
+            
+    def close(self):
+        ''' Completes any list being written, and flushes.
+        '''
+        if self.closed:
+            return
+            
+        if isinstance(self.schema, ListyParser) and \
+            self.schema.terminant is not None:
+            with self.schema._mutex:
+                packed = bytearray()
+                self.schema._pack_terminant(packed, self.trusted)
+            self._buffer[self._fill:self._fill + len(packed)] = packed
+            self._fill += len(packed)
+            
+        self.flush()
+        self.closed = True
+        
+    def _write_all(self, view):
+        total = 0
+        while view:
+            written = self._write(view)
+            if written is None:
+                if self._writes_all:
+                    break
+                raise BlockingIOError(errno.EAGAIN, 'Write would block.', 
+                                      total)
+            view = view[written:]
+            total += written
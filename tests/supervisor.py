@@ -3,6 +3,46 @@ test_import.test()
 
 import test_simple_reload
 test_simple_reload.test()
+test_simple_reload.test_repeat()
+test_simple_reload.test_iov()
+test_simple_reload.test_trusted()
+test_simple_reload.test_projection()
+test_simple_reload.test_pack_cache()
+test_simple_reload.test_link_count()
+test_simple_reload.test_align()
+test_simple_reload.test_link_offset()
+
+import test_parsers
+test_parsers.test_strings()
+test_parsers.test_probes()
+test_parsers.test_intern()
+test_parsers.test_arrays()
+
+import test_records
+test_records.test_iteration()
+test_records.test_parallel_unpack()
+test_records.test_parallel_pack()
+test_records.test_scan()
+test_records.test_index()
+test_records.test_writer()
+test_records.test_columns()
+
+import test_profiling
+test_profiling.test_paths()
+test_profiling.test_failed_attempts()
+
+import test_metrics
+test_metrics.test_registry()
+
+import test_errors
+test_errors.test_context()
+
+import test_persist
+test_persist.test_pickle()
+test_persist.test_cached()
+
+import test_buffers
+test_buffers.test_pool()
 
 import trashtest
 trashtest.run()
\ No newline at end of file
@@ -0,0 +1,103 @@
+'''
+Tests for pooled packing buffers.
+
+LICENSING
+-------------------------------------------------
+
+smartyparse: A python library for Muse object manipulation.
+    Copyright (C) 2016 Muterra, Inc.
+    
+    Contributors
+    ------------
+    Nick Badger 
+        badg@muterra.io | badg@nickbadger.com | nickbadger.com
+
+    This library is free software; you can redistribute it and/or
+    modify it under the terms of the GNU Lesser General Public
+    License as published by the Free Software Foundation; either
+    version 2.1 of the License, or (at your option) any later version.
+
+    This library is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+    Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public
+    License along with this library; if not, write to the 
+    Free Software Foundation, Inc.,
+    51 Franklin Street, 
+    Fifth Floor, 
+    Boston, MA  02110-1301 USA
+
+------------------------------------------------------
+
+'''
+
+
+import copy
+
+from smartyparse import SmartyParser
+from smartyparse import ParseHelper
+from smartyparse import ListyParser
+    
+from smartyparse.parsers import Blob
+from smartyparse.parsers import Int32
+from smartyparse.parsers import Literal
+
+from smartyparse.buffers import BufferPool
+
+# ###############################################
+# Setup
+# ###############################################
+
+tf_msg = SmartyParser()
+tf_msg['magic'] = ParseHelper(Blob(length=4))
+tf_msg['body_length'] = ParseHelper(Int32(signed=False))
+tf_msg['body'] = ParseHelper(Blob())
+tf_msg.link_length('body', 'body_length')
+
+tf_list = ListyParser(
+    parsers=[tf_msg], 
+    terminant=ParseHelper(Literal(b'\xff', verify=False))
+)
+
+tv_msgs = [
+    {'magic': b'[00]', 'body': b'first'},
+    {'magic': b'[01]', 'body': b'x' * 1000},
+    {'magic': b'[02]', 'body': b''},
+]
+
+# ###############################################
+# Testing
+# ###############################################
+
+def test_pool():
+    pool = BufferPool(min_size=64)
+    
+    for vector in tv_msgs * 3:
+        expected = tf_msg.pack(copy.copy(vector))
+        with tf_msg.pack(copy.copy(vector), pool=pool) as lease:
+            assert lease.view == expected
+            assert bytes(lease) == expected
+        assert tf_msg.unpack(expected) == vector
+        
+    # Buffers go back into the pool, so steady state doesn't allocate
+    allocations = pool.allocations
+    for vector in tv_msgs * 3:
+        tf_msg.pack(copy.copy(vector), pool=pool).release()
+    assert pool.allocations == allocations
+    assert len(pool) >= 1
+    
+    # Pools can be attached to schemas, and lists are pooled in full
+    tf_list.pool = pool
+    try:
+        expected = tf_list.pack([copy.copy(vector) for vector in tv_msgs], 
+                                pack_into=bytearray())
+        with tf_list.pack([copy.copy(vector) for vector in tv_msgs]) as lease:
+            assert lease.view == expected
+    finally:
+        del tf_list.pool
+        
+        
+if __name__ == '__main__':
+    test_pool()
@@ -0,0 +1,120 @@
+'''
+Tests for ParseError context.
+
+LICENSING
+-------------------------------------------------
+
+smartyparse: A python library for Muse object manipulation.
+    Copyright (C) 2016 Muterra, Inc.
+    
+    Contributors
+    ------------
+    Nick Badger 
+        badg@muterra.io | badg@nickbadger.com | nickbadger.com
+
+    This library is free software; you can redistribute it and/or
+    modify it under the terms of the GNU Lesser General Public
+    License as published by the Free Software Foundation; either
+    version 2.1 of the License, or (at your option) any later version.
+
+    This library is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+    Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public
+    License along with this library; if not, write to the 
+    Free Software Foundation, Inc.,
+    51 Franklin Street, 
+    Fifth Floor, 
+    Boston, MA  02110-1301 USA
+
+------------------------------------------------------
+
+'''
+
+import pickle
+
+from smartyparse import SmartyParser
+from smartyparse import ParseHelper
+from smartyparse import ListyParser
+from smartyparse import ParseError
+    
+from smartyparse.parsers import Blob
+from smartyparse.parsers import Int32
+from smartyparse.parsers import Literal
+
+# ###############################################
+# Setup
+# ###############################################
+
+record = SmartyParser()
+record['tag'] = ParseHelper(Literal(b'AB'))
+record['value'] = ParseHelper(Int32())
+
+message = SmartyParser()
+message['header'] = ParseHelper(Blob(length=4))
+message['records'] = ListyParser(parsers=[record])
+message['trailer'] = ParseHelper(Blob(length=4))
+
+tv_message = {
+    'header': b'head',
+    'records': [{'tag': b'AB', 'value': 1}, {'tag': b'AB', 'value': 2}],
+    'trailer': b'tail'
+}
+
+# ###############################################
+# Testing
+# ###############################################
+
+def test_context():
+    packed = message.pack(tv_message)
+    
+    # Truncated fixed-length field
+    try:
+        message.unpack(packed[:3])
+    except ParseError as exc:
+        assert exc.reason == 'length_mismatch'
+        assert exc.path == ('header',)
+        assert exc.offset == 0
+        assert exc.expected_length == 4
+        assert exc.actual_length == 3
+    else:
+        raise AssertionError('Truncated data did not raise.')
+        
+    # Corrupted list item
+    corrupted = bytearray(packed)
+    corrupted[10] = ord('X')
+    try:
+        message.unpack(corrupted)
+    except ParseError as exc:
+        assert exc.reason == 'no_valid_parser'
+        assert exc.path == ('records', 1)
+        assert exc.offset == 10
+        assert 'field records[1], offset 10' in str(exc)
+        assert '58 42 00 00' in exc.hexdump()
+        
+        # Errors (and so pickles of them) keep the context, not the buffer
+        assert not hasattr(exc, 'data')
+        unpickled = pickle.loads(pickle.dumps(exc))
+        assert unpickled.path == exc.path
+        assert unpickled.hexdump() == exc.hexdump()
+    else:
+        raise AssertionError('Corrupted data did not raise.')
+        
+    # Only a bounded window around the failure is copied
+    huge = bytearray(1 << 20)
+    try:
+        raise ParseError('Failed.', offset=1 << 19, data=huge)
+    except ParseError as exc:
+        # Resizing would fail if the buffer were still exported
+        huge.append(0)
+        lines = exc.hexdump(context=1 << 20).splitlines()
+        assert len(lines) == 2 * ParseError.context_limit // 16
+        assert lines[0].startswith('{:08x}'.format(
+            (1 << 19) - ParseError.context_limit
+        ))
+    
+                
+if __name__ == '__main__':
+    test_context()
@@ -0,0 +1,111 @@
+'''
+Tests for the metrics registry.
+
+LICENSING
+-------------------------------------------------
+
+smartyparse: A python library for Muse object manipulation.
+    Copyright (C) 2016 Muterra, Inc.
+    
+    Contributors
+    ------------
+    Nick Badger 
+        badg@muterra.io | badg@nickbadger.com | nickbadger.com
+
+    This library is free software; you can redistribute it and/or
+    modify it under the terms of the GNU Lesser General Public
+    License as published by the Free Software Foundation; either
+    version 2.1 of the License, or (at your option) any later version.
+
+    This library is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+    Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public
+    License along with this library; if not, write to the 
+    Free Software Foundation, Inc.,
+    51 Franklin Street, 
+    Fifth Floor, 
+    Boston, MA  02110-1301 USA
+
+------------------------------------------------------
+
+'''
+
+from smartyparse import SmartyParser
+from smartyparse import ParseHelper
+from smartyparse import ParseError
+    
+from smartyparse.parsers import Int32
+from smartyparse.parsers import Literal
+from smartyparse.metrics import MetricsRegistry
+from smartyparse.metrics import OTHER_ERROR
+
+# ###############################################
+# Testing
+# ###############################################
+
+def test_registry():
+    registry = MetricsRegistry()
+    header = SmartyParser()
+    header['magic'] = ParseHelper(Literal(b'SP'))
+    header['count'] = ParseHelper(Int32())
+    header.track('header', registry=registry)
+    
+    packed = header.pack({'magic': b'SP', 'count': 7})
+    for __ in range(3):
+        header.unpack(packed)
+    try:
+        header.unpack(b'XX' + packed[2:])
+    except ParseError as exc:
+        assert exc.reason == 'literal_mismatch'
+    else:
+        raise AssertionError('Bad magic did not raise.')
+        
+    snapshot = registry.snapshot()['schemas']['header']
+    assert snapshot['pack']['calls'] == 1
+    assert snapshot['pack']['bytes'] == 6
+    assert snapshot['unpack']['calls'] == 4
+    assert snapshot['unpack']['bytes'] == 18
+    assert snapshot['unpack']['errors'] == {'literal_mismatch': 1}
+    assert sum(snapshot['unpack']['latency']['counts']) == 4
+    
+    # Anything other than a ParseError is still counted
+    try:
+        header.pack({'magic': b'SP'})
+    except KeyError:
+        pass
+    else:
+        raise AssertionError('Missing count did not raise.')
+    snapshot = registry.snapshot()['schemas']['header']
+    assert snapshot['pack']['calls'] == 2
+    assert snapshot['pack']['bytes'] == 6
+    assert snapshot['pack']['errors'] == {OTHER_ERROR: 1}
+    
+    # Nested schemas are counted once per call of their parent, with only
+    # their own bytes
+    message = SmartyParser()
+    message['header'] = header
+    message['body'] = ParseHelper(Int32())
+    nested = message.pack({'header': {'magic': b'SP', 'count': 7}, 
+                           'body': 1})
+    message.unpack(nested)
+    snapshot = registry.snapshot()['schemas']['header']
+    assert snapshot['pack']['calls'] == 3
+    assert snapshot['pack']['bytes'] == 12
+    assert snapshot['unpack']['calls'] == 5
+    assert snapshot['unpack']['bytes'] == 24
+    
+    # Untracking restores the parser, but keeps what was recorded
+    header.untrack(registry=registry)
+    assert 'unpack' not in vars(header)
+    header.unpack(packed)
+    assert registry.snapshot()['schemas']['header']['unpack']['calls'] == 5
+    
+    registry.reset()
+    assert registry.snapshot()['schemas']['header']['unpack']['calls'] == 0
+    
+                
+if __name__ == '__main__':
+    test_registry()
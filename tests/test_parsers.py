@@ -0,0 +1,223 @@
+'''
+Round-trip tests for individual parsing primitives.
+
+LICENSING
+-------------------------------------------------
+
+smartyparse: A python library for Muse object manipulation.
+    Copyright (C) 2016 Muterra, Inc.
+    
+    Contributors
+    ------------
+    Nick Badger 
+        badg@muterra.io | badg@nickbadger.com | nickbadger.com
+
+    This library is free software; you can redistribute it and/or
+    modify it under the terms of the GNU Lesser General Public
+    License as published by the Free Software Foundation; either
+    version 2.1 of the License, or (at your option) any later version.
+
+    This library is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+    Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public
+    License along with this library; if not, write to the 
+    Free Software Foundation, Inc.,
+    51 Franklin Street, 
+    Fifth Floor, 
+    Boston, MA  02110-1301 USA
+
+------------------------------------------------------
+
+'''
+
+import sys
+import array
+
+from smartyparse import SmartyParser
+from smartyparse import ParseHelper
+from smartyparse import ListyParser
+from smartyparse import ParseError
+    
+from smartyparse.parsers import Blob
+from smartyparse.parsers import Int8
+from smartyparse.parsers import Int16
+from smartyparse.parsers import Int32
+from smartyparse.parsers import Float
+from smartyparse.parsers import Array
+from smartyparse.parsers import Literal
+from smartyparse.parsers import String
+from smartyparse.parsers import CString
+from smartyparse.parsers import InternTable
+
+# ###############################################
+# Setup
+# ###############################################
+
+string_format = SmartyParser()
+string_format['cstr'] = ParseHelper(CString())
+string_format['fixed'] = ParseHelper(String(length=8))
+string_format['wide'] = ParseHelper(
+    CString(encoding='utf-16-le', terminator=b'\x00\x00')
+)
+string_format['tail'] = ParseHelper(Int8())
+
+sv1 = {'cstr': 'hello', 'fixed': 'abc', 'wide': 'Āx', 'tail': 3}
+sv2 = {'cstr': '', 'fixed': '12345678', 'wide': 'zz', 'tail': -1}
+
+small = SmartyParser()
+small['tag'] = ParseHelper(Literal(b'S'))
+small['value'] = ParseHelper(Int8())
+
+large = SmartyParser()
+large['tag'] = ParseHelper(Literal(b'L'))
+large['value'] = ParseHelper(Int16())
+
+either = ListyParser(parsers=[small, large])
+
+# ###############################################
+# Testing
+# ###############################################
+
+def test_strings():
+    # Strings should decode straight from memoryviews
+    assert String().unpack(memoryview(b'hello')) == 'hello'
+    
+    assert String(length=6).pack('hi') == b'hi\x00\x00\x00\x00'
+    assert String(length=6).unpack(b'hi\x00\x00\x00\x00') == 'hi'
+    assert CString().pack('hi') == b'hi\x00'
+    assert CString().find_length(memoryview(b'hi\x00there\x00')) == 3
+    
+    # Multi-byte terminators only match whole code units
+    wide = CString(encoding='utf-16-le', terminator=b'\x00\x00')
+    assert wide.unpack(wide.pack('aĀ')) == 'aĀ'
+    
+    # Multi-character pads are stripped as whole units
+    padded = String(length=6, pad=b'ab')
+    assert padded.pack('xb') == b'xbabab'
+    assert padded.unpack(b'xbabab') == 'xb'
+    
+    try:
+        String(length=2).pack('too long')
+    except ParseError:
+        pass
+    else:
+        raise AssertionError('Oversized fixed string did not raise.')
+        
+    try:
+        CString().find_length(b'unterminated')
+    except ParseError:
+        pass
+    else:
+        raise AssertionError('Unterminated string did not raise.')
+    
+    # Serial reuse must not hold over lengths between runs
+    for vector in (sv1, sv2, sv1):
+        packed = string_format.pack(vector)
+        assert string_format.unpack(packed) == vector
+    
+        
+
+def test_probes():
+    assert Literal(b'ab').can_unpack(b'xxab', 2)
+    assert not Literal(b'ab').can_unpack(b'xxa', 2)
+    assert not Literal(b'ab').can_pack(b'ac')
+    assert Blob(length=4).can_pack(memoryview(b'abcd'))
+    assert not Blob(length=4).can_unpack(b'abcd', 1)
+    assert Int8().can_pack(-128)
+    assert not Int8().can_pack(128)
+    assert not Int8(signed=False).can_pack(-1)
+    assert not Int16().can_pack('1')
+    
+    # Nested SmartyParsers probe their leading fields
+    assert large.can_unpack(b'xL\x00\x01', 1)
+    assert not large.can_unpack(b'xS\x00\x01', 1)
+    assert not large.can_unpack(b'xL\x00', 1)
+    assert large.can_pack({'tag': b'L', 'value': 300})
+    assert not large.can_pack({'tag': b'S', 'value': 3})
+    assert not large.can_pack({'tag': b'L'})
+    
+    # Which ListyParsers use to pick a candidate without trial and error
+    items = [
+        {'tag': b'L', 'value': 300}, 
+        {'tag': b'S', 'value': 3}, 
+        {'tag': b'L', 'value': -2}
+    ]
+    packed = either.pack(items)
+    assert bytes(packed) == b'L\x01\x2cS\x03L\xff\xfe'
+    assert either.unpack(packed) == tuple(items)
+    
+    # Delimited items mustn't be probed against the last item's length
+    strings = ListyParser(parsers=[ParseHelper(CString())])
+    assert strings.unpack(b'hello\x00a\x00') == ('hello', 'a')
+    
+    
+def test_intern():
+    # One table shared across the whole schema
+    table = InternTable(max_size=3)
+    tagged = SmartyParser()
+    tagged['host'] = ParseHelper(CString(intern=table))
+    tagged['tag'] = ParseHelper(String(length=4, intern=table))
+    tagged['raw'] = ParseHelper(Blob(length=2, intern=table))
+    
+    vector = {'host': 'example', 'tag': 'ab', 'raw': b'xy'}
+    first = tagged.unpack(tagged.pack(dict(vector)))
+    second = tagged.unpack(tagged.pack(dict(vector)))
+    assert first == second == vector
+    assert isinstance(first['raw'], bytes)
+    for key in vector:
+        assert first[key] is second[key]
+    assert len(table) == 3
+    
+    # Full tables start over, rather than growing
+    other = tagged.unpack(tagged.pack({'host': 'other', 'tag': 'ab', 
+                                       'raw': b'xy'}))
+    assert len(table) == 3
+    assert other['raw'] == b'xy'
+    
+    parser = String(intern=True)
+    assert parser.unpack(bytearray(b'abc')) is parser.unpack(b'abc')
+    
+    
+def test_arrays():
+    samples = [1, -2, 3, 70000]
+    for endian in ('big', 'little'):
+        fixed = Array(Int32(endian=endian), count=4)
+        packed = bytes(fixed.pack(samples))
+        assert packed == b''.join(Int32(endian=endian).pack(sample) 
+                                  for sample in samples)
+        assert list(fixed.unpack(memoryview(packed))) == samples
+        # Matching buffers are copied in directly
+        assert bytes(fixed.pack(array.array('i', samples))) == packed
+        
+    try:
+        fixed.pack(samples[:3])
+    except ParseError as exc:
+        assert exc.reason == 'length_mismatch'
+    else:
+        raise AssertionError('Short array did not raise.')
+    
+    # Length-linked arrays, unpacked without copying when native
+    frames = SmartyParser()
+    frames['samples_length'] = ParseHelper(Int32(signed=False))
+    frames['samples'] = ParseHelper(Array(Float(endian=sys.byteorder)))
+    frames['tail'] = ParseHelper(Int8())
+    frames.link_length('samples', 'samples_length')
+    
+    values = array.array('d', (ii / 4 for ii in range(1000)))
+    packed = frames.pack({'samples': values, 'tail': 7})
+    assert len(packed) == 8005
+    unpacked = frames.unpack(packed)
+    assert isinstance(unpacked['samples'], memoryview)
+    assert unpacked['samples'].obj is packed
+    assert unpacked['samples'].tolist() == values.tolist()
+    assert unpacked['tail'] == 7
+    
+                
+if __name__ == '__main__':
+    test_strings()
+    test_probes()
+    test_intern()
+    test_arrays()
@@ -0,0 +1,128 @@
+'''
+Tests for schema persistence.
+
+LICENSING
+-------------------------------------------------
+
+smartyparse: A python library for Muse object manipulation.
+    Copyright (C) 2016 Muterra, Inc.
+    
+    Contributors
+    ------------
+    Nick Badger 
+        badg@muterra.io | badg@nickbadger.com | nickbadger.com
+
+    This library is free software; you can redistribute it and/or
+    modify it under the terms of the GNU Lesser General Public
+    License as published by the Free Software Foundation; either
+    version 2.1 of the License, or (at your option) any later version.
+
+    This library is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+    Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public
+    License along with this library; if not, write to the 
+    Free Software Foundation, Inc.,
+    51 Franklin Street, 
+    Fifth Floor, 
+    Boston, MA  02110-1301 USA
+
+------------------------------------------------------
+
+'''
+
+import os
+import sys
+import copy
+import pickle
+import tempfile
+import subprocess
+
+from smartyparse import persist
+
+from test_simple_reload import test_nest
+from test_simple_reload import tv3
+from test_parsers import string_format
+from test_parsers import either
+from test_parsers import sv1
+
+# ###############################################
+# Testing
+# ###############################################
+
+def test_pickle():
+    for schema, vector in ((test_nest, tv3), (string_format, sv1)):
+        packed = schema.pack(copy.deepcopy(vector))
+        loaded = pickle.loads(pickle.dumps(schema))
+        assert loaded.unpack(packed) == vector
+        assert loaded.pack(copy.deepcopy(vector)) == packed
+        
+    # Shared (reused) parsers must stay shared
+    loaded = pickle.loads(pickle.dumps(test_nest))
+    assert loaded['first'] is loaded['second']
+    
+    loaded = pickle.loads(pickle.dumps(either))
+    items = [{'tag': b'S', 'value': 1}, {'tag': b'L', 'value': 1000}]
+    assert loaded.unpack(either.pack(items)) == tuple(items)
+    
+    
+def build_nest():
+    return test_nest
+    
+    
+def build_strings():
+    # Nested code and frozenset constants must key the same everywhere
+    assert all(name in {'cstr', 'fixed', 'wide', 'tail'} 
+               for name in string_format._control)
+    return string_format
+    
+    
+def test_cached():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'nest.schema')
+        first = persist.cached(path, build_nest)
+        assert first is test_nest
+        second = persist.cached(path, build_nest)
+        assert second is not test_nest
+        assert second.unpack(test_nest.pack(copy.deepcopy(tv3))) == tv3
+        
+        # A different key must not load the cached schema
+        with open(path, 'rb') as f:
+            data = f.read()
+        try:
+            persist.loads(data, key='something else')
+        except ValueError:
+            pass
+        else:
+            raise AssertionError('Mismatched key did not raise.')
+        assert persist.cached(path, build_nest, key='v2') is test_nest
+        
+        # Caches of classes that no longer exist are rebuilt
+        for stale in (b'csmartyparse.core\nRemovedParser\n.', 
+                      b'cno_such_module\nSchema\n.'):
+            with open(path, 'wb') as f:
+                f.write(persist._header('v3') + stale)
+            assert persist.cached(path, build_nest, key='v3') is test_nest
+            assert persist.cached(path, build_nest, key='v3') is not \
+                   test_nest
+        
+    # Keys are stable across processes (and hash seeds)
+    here = os.path.dirname(os.path.abspath(__file__))
+    keys = set()
+    for seed in ('1', '2'):
+        env = dict(os.environ, PYTHONHASHSEED=seed, PYTHONPATH=os.pathsep.join(
+            (here, os.path.dirname(here), os.environ.get('PYTHONPATH', ''))
+        ))
+        keys.add(subprocess.check_output([
+            sys.executable, '-c', 'import test_persist; '
+            'from smartyparse.persist import _factory_key; '
+            'print(_factory_key(test_persist.build_strings))'
+        ], env=env, cwd=here))
+    assert len(keys) == 1
+    
+                
+if __name__ == '__main__':
+    test_pickle()
+    test_cached()
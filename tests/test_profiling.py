@@ -0,0 +1,137 @@
+'''
+Tests for per-field profiling.
+
+LICENSING
+-------------------------------------------------
+
+smartyparse: A python library for Muse object manipulation.
+    Copyright (C) 2016 Muterra, Inc.
+    
+    Contributors
+    ------------
+    Nick Badger 
+        badg@muterra.io | badg@nickbadger.com | nickbadger.com
+
+    This library is free software; you can redistribute it and/or
+    modify it under the terms of the GNU Lesser General Public
+    License as published by the Free Software Foundation; either
+    version 2.1 of the License, or (at your option) any later version.
+
+    This library is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+    Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public
+    License along with this library; if not, write to the 
+    Free Software Foundation, Inc.,
+    51 Franklin Street, 
+    Fifth Floor, 
+    Boston, MA  02110-1301 USA
+
+------------------------------------------------------
+
+'''
+
+import copy
+import collections
+
+from smartyparse import SmartyParser
+from smartyparse import ParseHelper
+from smartyparse import ListyParser
+    
+from smartyparse.parsers import Blob
+from smartyparse.parsers import Int8
+from smartyparse.parsers import Int16
+from smartyparse.parsers import Int32
+from smartyparse.parsers import Literal
+
+# ###############################################
+# Setup
+# ###############################################
+
+inner = SmartyParser()
+inner['magic'] = ParseHelper(Blob(length=4))
+inner['body_length'] = ParseHelper(Int32(signed=False))
+inner['body'] = ParseHelper(Blob())
+inner.link_length('body', 'body_length')
+
+outer = SmartyParser()
+outer['first'] = inner
+outer['second'] = inner
+
+tv_outer = {
+    'first': {'magic': b'[00]', 'body': b'first body'},
+    'second': {'magic': b'[aa]', 'body': b'second'},
+}
+
+tagged_a = SmartyParser()
+tagged_a['tag'] = ParseHelper(Literal(b'A'))
+tagged_a['value'] = ParseHelper(Int8())
+
+tagged_b = SmartyParser()
+tagged_b['tag'] = ParseHelper(Literal(b'B'))
+tagged_b['value'] = ParseHelper(Int16())
+
+tf_list = ListyParser(parsers=[tagged_a, tagged_b])
+tv_list = [
+    {'tag': b'A', 'value': 1}, 
+    {'tag': b'B', 'value': 2}, 
+    {'tag': b'B', 'value': 3}
+]
+
+# ###############################################
+# Testing
+# ###############################################
+
+def test_paths():
+    packed = outer.pack(copy.deepcopy(tv_outer))
+    
+    with outer.profile() as profiler:
+        outer.unpack(packed)
+        outer.pack(copy.deepcopy(tv_outer))
+    report = profiler.report()
+    
+    # Shared parsers must still be attributed to the right paths
+    assert report['first.body']['unpack']['bytes'] == 10
+    assert report['second.body']['unpack']['bytes'] == 6
+    assert report['first.body']['pack']['calls'] == 1
+    assert report['<root>']['unpack']['bytes'] == len(packed)
+    
+    # Disabling must restore the parsers exactly
+    assert 'unpack' not in vars(outer)
+    assert 'unpack' not in vars(inner['body'])
+    assert type(inner._control) is collections.OrderedDict
+    assert outer.unpack(packed) == tv_outer
+    
+    
+def test_failed_attempts():
+    packed = tf_list.pack(copy.deepcopy(tv_list))
+    
+    with tf_list.profile() as profiler:
+        tf_list.unpack(packed)
+    report = profiler.report()
+    
+    # Probing rules out the wrong tags before anything is unpacked
+    assert report['<root>']['unpack']['failed_attempts'] == 0
+    assert report['0']['unpack']['calls'] == 1
+    assert report['1']['unpack']['calls'] == 2
+    
+    # But anything that can't be ruled out in advance is counted
+    tagged_a.callback_preunpack = lambda data: data
+    tagged_a.callback_preunpack.modify = True
+    try:
+        with tf_list.profile() as profiler:
+            tf_list.unpack(packed)
+    finally:
+        del tagged_a.callback_preunpack
+    report = profiler.report()
+    
+    assert report['<root>']['unpack']['failed_attempts'] == 2
+    assert report['0']['unpack']['errors'] == 2
+    assert report['1']['unpack']['calls'] == 2
+    
+                
+if __name__ == '__main__':
+    test_paths()
+    test_failed_attempts()
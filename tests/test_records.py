@@ -0,0 +1,475 @@
+'''
+Tests for multi-message (record) sources.
+
+LICENSING
+-------------------------------------------------
+
+smartyparse: A python library for Muse object manipulation.
+    Copyright (C) 2016 Muterra, Inc.
+    
+    Contributors
+    ------------
+    Nick Badger 
+        badg@muterra.io | badg@nickbadger.com | nickbadger.com
+
+    This library is free software; you can redistribute it and/or
+    modify it under the terms of the GNU Lesser General Public
+    License as published by the Free Software Foundation; either
+    version 2.1 of the License, or (at your option) any later version.
+
+    This library is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+    Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public
+    License along with this library; if not, write to the 
+    Free Software Foundation, Inc.,
+    51 Franklin Street, 
+    Fifth Floor, 
+    Boston, MA  02110-1301 USA
+
+------------------------------------------------------
+
+'''
+
+import io
+import os
+import sys
+import copy
+import tempfile
+
+from smartyparse import SmartyParser
+from smartyparse import ParseHelper
+from smartyparse import ListyParser
+from smartyparse import ParseError
+    
+from smartyparse.parsers import Blob
+from smartyparse.parsers import Null
+from smartyparse.parsers import Int8
+from smartyparse.parsers import Int16
+from smartyparse.parsers import Int32
+from smartyparse.parsers import Float
+from smartyparse.parsers import ByteBool
+from smartyparse.parsers import Padding
+from smartyparse.parsers import String
+from smartyparse.parsers import Literal
+from smartyparse.parsers import CString
+from smartyparse.parsers import Array
+
+from smartyparse.records import build_index
+from smartyparse.records import open_indexed
+from smartyparse.records import RecordWriter
+
+from test_simple_reload import listed_format
+from test_simple_reload import lv1
+from test_simple_reload import lv2
+
+# ###############################################
+# Setup
+# ###############################################
+
+record_format = SmartyParser()
+record_format['magic'] = ParseHelper(Blob(length=4))
+record_format['version'] = ParseHelper(Int32(signed=False))
+record_format['cipher'] = ParseHelper(Int8(signed=False))
+record_format['body_length'] = ParseHelper(Int32(signed=False))
+record_format['body'] = ParseHelper(Blob())
+record_format.link_length('body', 'body_length')
+
+
+def make_vector(index):
+    return {
+        'magic': b'[rr]',
+        'version': index,
+        'cipher': index % 4,
+        'body': b'x' * (index % 17),
+    }
+    
+    
+def make_sampled():
+    sampled = SmartyParser()
+    sampled['id'] = ParseHelper(Int16(signed=False))
+    # Native order, so that they unpack to memoryviews
+    sampled['samples'] = ParseHelper(
+        Array(Int32(endian=sys.byteorder), count=4)
+    )
+    return sampled
+
+
+def make_records(count):
+    vectors = [make_vector(ii) for ii in range(count)]
+    packed = bytearray()
+    for vector in vectors:
+        packed += record_format.pack(copy.copy(vector))
+    return vectors, bytes(packed)
+
+# ###############################################
+# Testing
+# ###############################################
+
+def test_iteration():
+    vectors, packed = make_records(50)
+    
+    offsets = record_format.record_offsets(packed)
+    assert len(offsets) == 51
+    assert offsets[-1] == len(packed)
+    
+    for vector, recycled in zip(vectors, record_format.iter_unpack(packed)):
+        assert recycled == vector
+        
+    # Truncated trailing records are caught, even when skipped over
+    try:
+        record_format.record_offsets(packed[:-1])
+    except ParseError as exc:
+        assert exc.reason == 'length_mismatch'
+    else:
+        raise AssertionError('Truncated record did not raise.')
+        
+    # Records of varying length, whatever was unpacked before
+    short = bytes(listed_format.pack(copy.deepcopy(lv1)))
+    long = bytes(listed_format.pack(copy.deepcopy(lv2)))
+    listed_format.unpack(long)
+    assert listed_format.record_offsets(short + long + short).tolist() == \
+           [0, len(short), len(short) + len(long), 2 * len(short) + len(long)]
+    assert list(listed_format.iter_unpack(long + short)) == [lv2, lv1]
+    
+    # Zero-length messages would never advance
+    empty = SmartyParser()
+    empty['nothing'] = ParseHelper(Null())
+    for walk in (empty.iter_unpack, empty.record_offsets, 
+                 lambda data: empty.scan(data, {})):
+        try:
+            list(walk(b'\x00'))
+        except ParseError as exc:
+            assert exc.reason == 'indeterminate_length'
+        else:
+            raise AssertionError('Zero-length message did not raise.')
+        
+        
+def test_parallel_unpack():
+    vectors, packed = make_records(500)
+    
+    recycled = list(record_format.parallel_unpack(packed, workers=2,
+                                                  chunk_size=64))
+    assert len(recycled) == len(vectors)
+    for vector, recycle in zip(vectors, recycled):
+        assert recycle == vector
+        
+    # Arrays come back typed, just as from unpack (through either forked
+    # schemas or factories, which use shared memory)
+    sampled = make_sampled()
+    packed = bytearray()
+    for ii in range(100):
+        packed += sampled.pack({'id': ii, 'samples': [ii, -ii, 0, 7]})
+    expected = list(sampled.iter_unpack(bytes(packed)))
+    for factory in (None, make_sampled):
+        recycled = list(sampled.parallel_unpack(packed, workers=2, 
+                                                chunk_size=16,
+                                                factory=factory))
+        assert recycled == expected
+        assert recycled[5]['samples'].tolist() == [5, -5, 0, 7]
+        
+        
+def test_parallel_pack():
+    vectors, packed = make_records(500)
+    
+    repacked = record_format.parallel_pack(
+        (copy.copy(vector) for vector in vectors), 
+        workers=2, 
+        chunk_size=64
+    )
+    assert bytes(repacked) == packed
+    
+    # Lists must be terminated exactly as they would be serially
+    tf_list = ListyParser(
+        parsers=[record_format], 
+        terminant=ParseHelper(Literal(b'\xff', verify=False))
+    )
+    serial = tf_list.pack([copy.copy(vector) for vector in vectors])
+    repacked = tf_list.parallel_pack(
+        [copy.copy(vector) for vector in vectors], 
+        workers=2, 
+        chunk_size=64
+    )
+    assert bytes(repacked) == bytes(serial)
+    
+    # List callbacks need the whole list, terminated or not
+    unterminated = ListyParser(parsers=[record_format])
+    unterminated.register_callback('prepack', list, modify=True)
+    try:
+        unterminated.parallel_pack([make_vector(0)], workers=1)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('List pack callbacks did not raise.')
+    
+    
+def test_scan():
+    vectors, packed = make_records(200)
+    
+    matches = list(record_format.scan(packed, where={'cipher': 2}))
+    assert matches == [vector for vector in vectors if vector['cipher'] == 2]
+    
+    # Predicates and projections
+    matches = list(record_format.scan(
+        packed, 
+        where={'cipher': 1, 'version': lambda version: version > 100},
+        fields=['version', 'body']
+    ))
+    expected = [vector for vector in vectors 
+                if vector['cipher'] == 1 and vector['version'] > 100]
+    assert len(matches) == len(expected)
+    for match, vector in zip(matches, expected):
+        assert list(match) == ['version', 'body']
+        assert match['body'] == vector['body']
+        
+    # Terminated lists of varying length, skipped and matched
+    short = bytes(listed_format.pack(copy.deepcopy(lv1)))
+    long = bytes(listed_format.pack(copy.deepcopy(lv2)))
+    listed_format.unpack(short)
+    packed = long + short + long
+    assert list(listed_format.scan(packed, where={'tail': 6})) == [lv2, lv2]
+    matches = list(listed_format.scan(packed, where={'tail': 5}, 
+                                      fields=['tail']))
+    assert matches == [{'tail': 5}]
+    matches = list(listed_format.scan(
+        packed, where={'things': lambda things: len(things) == 2}
+    ))
+    assert matches == [lv1]
+    
+    
+def test_index():
+    vectors, packed = make_records(300)
+    item_list = ListyParser(parsers=[record_format])
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'records')
+        with open(path, 'wb') as f:
+            f.write(packed)
+            
+        offsets = build_index(record_format, path)
+        assert offsets == record_format.record_offsets(packed)
+        assert os.path.exists(path + '.idx')
+        
+        with open_indexed(record_format, path) as records:
+            assert len(records) == 300
+            assert records[123] == vectors[123]
+            assert records[-1] == vectors[-1]
+            assert records.append(make_vector(1000)) == 300
+            assert records[300] == make_vector(1000)
+            
+        # Records appended by anyone else are picked up on open
+        with open(path, 'ab') as f:
+            f.write(record_format.pack(make_vector(1001)))
+        with open_indexed(record_format, path) as records:
+            assert len(records) == 302
+            assert records[301] == make_vector(1001)
+            assert records[299] == vectors[299]
+            
+        # Rewritten files are reindexed, even at the same size: swapping
+        # the first two bodies moves the boundary between them
+        rewritten = [copy.copy(vector) for vector in vectors] + \
+                    [make_vector(1000), make_vector(1001)]
+        rewritten[0]['body'], rewritten[1]['body'] = b'x', b''
+        size = os.path.getsize(path)
+        with open(path, 'wb') as f:
+            for vector in rewritten:
+                f.write(record_format.pack(copy.copy(vector)))
+        assert os.path.getsize(path) == size
+        with open_indexed(record_format, path) as records:
+            assert records[0] == rewritten[0]
+            assert records[1] == rewritten[1]
+            
+        # ...or larger
+        rewritten = [dict(vector, cipher=9) for vector in vectors[1:]] * 2
+        with open(path, 'wb') as f:
+            for vector in rewritten:
+                f.write(record_format.pack(copy.copy(vector)))
+        assert os.path.getsize(path) > size
+        with open_indexed(record_format, path) as records:
+            assert len(records) == len(rewritten)
+            assert records[0] == rewritten[0]
+            assert records[-1] == rewritten[-1]
+            
+        # Truncated files raise ParseErrors (and not from closing them)
+        with open(path, 'wb') as f:
+            f.write(packed[:-1])
+        try:
+            build_index(record_format, path)
+        except ParseError as exc:
+            assert exc.reason == 'length_mismatch'
+        else:
+            raise AssertionError('Truncated file did not raise.')
+            
+        # Records of varying length
+        with open(path, 'wb') as f:
+            for vector in (lv1, lv2, lv1, lv2):
+                f.write(listed_format.pack(copy.deepcopy(vector)))
+        listed_format.unpack(listed_format.pack(copy.deepcopy(lv2)))
+        offsets = build_index(listed_format, path, path + '.listed')
+        assert len(offsets) == 5
+        with open_indexed(listed_format, path, path + '.listed') as records:
+            assert records[:] == [lv1, lv2, lv1, lv2]
+            
+        # List items can be indexed as records too
+        with open(path, 'wb') as f:
+            f.write(item_list.pack([copy.copy(vector) 
+                                    for vector in vectors[:50]]))
+        with open_indexed(item_list, path) as items:
+            assert len(items) == 50
+            assert items[42] == vectors[42]
+    
+    
+def test_writer():
+    vectors, packed = make_records(500)
+    
+    # Small buffers force plenty of flushes, including outsized records
+    out = io.BytesIO()
+    with RecordWriter(record_format, out, buffer_size=64) as writer:
+        writer.write_many(copy.copy(vector) for vector in vectors)
+        assert writer.records == 500
+    assert out.getvalue() == packed
+    
+    # Nothing is written until the buffer fills (or on flush)
+    out = io.BytesIO()
+    writer = RecordWriter(record_format, out)
+    writer.write(copy.copy(vectors[0]))
+    assert out.getvalue() == b''
+    writer.flush()
+    assert out.getvalue() == record_format.pack(copy.copy(vectors[0]))
+    
+    # Lists are terminated on close
+    tf_list = ListyParser(
+        parsers=[record_format], 
+        terminant=ParseHelper(Literal(b'\xff', verify=False))
+    )
+    out = io.BytesIO()
+    with RecordWriter(tf_list, out, buffer_size=256) as writer:
+        writer.write_many(copy.copy(vector) for vector in vectors)
+    assert out.getvalue() == \
+        bytes(tf_list.pack([copy.copy(vector) for vector in vectors]))
+        
+    # Raw files that would block aren't mistaken for having written it all
+    class Stalling(io.RawIOBase):
+        def __init__(self):
+            self.written = bytearray()
+            # Bytes to take before blocking
+            self.allowance = 10
+        def writable(self):
+            return True
+        def write(self, data):
+            if not self.allowance:
+                return None
+            data = data[:self.allowance]
+            self.written += data
+            self.allowance -= len(data)
+            return len(data)
+            
+    out = Stalling()
+    writer = RecordWriter(record_format, out)
+    writer.write_many(copy.copy(vector) for vector in vectors[:2])
+    try:
+        writer.flush()
+    except BlockingIOError as exc:
+        assert exc.characters_written == 10
+    else:
+        raise AssertionError('Stalled write did not raise.')
+    out.allowance = len(packed)
+    writer.close()
+    assert bytes(out.written) == b''.join(
+        record_format.pack(copy.copy(vector)) for vector in vectors[:2])
+    
+    # List callbacks would be silently skipped
+    unterminated = ListyParser(parsers=[record_format])
+    unterminated.register_callback('postpack', bytes, modify=True)
+    try:
+        RecordWriter(unterminated, io.BytesIO())
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('List pack callbacks did not raise.')
+    
+    
+    
+def test_columns():
+    vectors, packed = make_records(300)
+    
+    columns = record_format.unpack_columns(packed)
+    assert list(columns) == ['magic', 'version', 'cipher', 'body']
+    assert columns['version'].tolist() == [vector['version'] 
+                                           for vector in vectors]
+    assert columns['cipher'].typecode == 'B'
+    assert len(columns['body']) == 300
+    assert list(columns['body']) == [vector['body'] for vector in vectors]
+    assert columns['body'].offsets[-1] == len(columns['body'].values)
+    
+    # Projected, nested and string columns
+    tagged = SmartyParser()
+    tagged['host'] = ParseHelper(CString())
+    tagged['record'] = record_format
+    packed = b''.join(
+        bytes(tagged.pack({'host': 'host' + str(ii % 3), 
+                           'record': copy.copy(vector)}))
+        for ii, vector in enumerate(vectors[:30])
+    )
+    columns = tagged.unpack_columns(packed, fields=['host', 'record.cipher'])
+    assert list(columns) == ['host', 'record.cipher']
+    assert columns['host'][4] == 'host1'
+    assert columns['host'][-1] == 'host2'
+    assert bytes(columns['host'].values[:10]) == b'host0host1'
+    assert columns['record.cipher'].tolist() == [vector['cipher'] 
+                                                 for vector in vectors[:30]]
+    
+    # Messages are decoded straight into columns, without being unpacked
+    def refuse(*args, **kwargs):
+        raise AssertionError('Message was unpacked row by row.')
+    fixed = SmartyParser()
+    fixed['tag'] = ParseHelper(Literal(b'F'))
+    fixed['value'] = ParseHelper(Int16(endian='little'))
+    fixed['ratio'] = ParseHelper(Float(double=False))
+    fixed['flag'] = ParseHelper(ByteBool())
+    fixed['pad'] = ParseHelper(Padding(1))
+    fixed['name'] = ParseHelper(String(length=6, pad=b'ab'))
+    rows = [{'tag': b'F', 'value': -ii, 'ratio': ii / 2, 'flag': ii % 2 == 1, 
+             'pad': None, 'name': 'n' + 'b' * (1 + ii % 2 * 2)} 
+            for ii in range(20)]
+    packed = b''.join(bytes(fixed.pack(dict(row))) for row in rows)
+    fixed.unpack = refuse
+    try:
+        columns = fixed.unpack_columns(packed)
+    finally:
+        del fixed.unpack
+    for name, column in columns.items():
+        assert list(column) == [row[name] for row in rows]
+            
+    try:
+        fixed.unpack_columns(packed[:-1])
+    except ParseError as exc:
+        assert exc.reason == 'length_mismatch'
+    else:
+        raise AssertionError('Truncated message did not raise.')
+    try:
+        fixed.unpack_columns(packed.replace(b'F', b'G', 1))
+    except ParseError as exc:
+        assert exc.reason == 'literal_mismatch'
+        assert exc.path == ('tag',)
+    else:
+        raise AssertionError('Mismatched literal did not raise.')
+    
+    record_format.unpack = refuse
+    try:
+        columns = record_format.unpack_columns(make_records(300)[1])
+    finally:
+        del record_format.unpack
+    assert list(columns['body']) == [vector['body'] for vector in vectors]
+    
+                
+if __name__ == '__main__':
+    test_iteration()
+    test_parallel_unpack()
+    test_parallel_pack()
+    test_scan()
+    test_index()
+    test_writer()
+    test_columns()
@@ -34,11 +34,19 @@ smartyparse: A python library for Muse object manipulation.
 '''
 
 import sys
+import array
+import struct
 import collections
 import copy
+import pickle
+import mmap
+import tempfile
 
 from smartyparse import SmartyParser
 from smartyparse import ParseHelper
+from smartyparse import ListyParser
+from smartyparse import ParseError
+from smartyparse import Reference
     
 from smartyparse.parsers import Blob
 from smartyparse.parsers import Int8
@@ -46,6 +54,9 @@ from smartyparse.parsers import Int16
 from smartyparse.parsers import Int32
 from smartyparse.parsers import Int64
 from smartyparse.parsers import Null
+from smartyparse.parsers import Array
+from smartyparse.parsers import Float
+from smartyparse.parsers import Literal
 
 # ###############################################
 # Setup
@@ -82,6 +93,19 @@ tv2['body2'] = b'[new test byte string, 2nd]'
 
 tv3 = {'first': copy.deepcopy(tv1), 'second': copy.deepcopy(tv2)}
 
+# A terminated list of varying length, followed by another field. 
+# Terminants are packed from the list's own buffer, so substitute the
+# literal for it.
+list_terminant = ParseHelper(Literal(b'\xff'))
+list_terminant.register_callback('prepack', lambda __: b'\xff', modify=True)
+listed_format = SmartyParser()
+listed_format['things'] = ListyParser(parsers=[ParseHelper(Int16())],
+                                      terminant=list_terminant)
+listed_format['tail'] = ParseHelper(Int8())
+
+lv1 = {'things': (1, 2), 'tail': 5}
+lv2 = {'things': (1, 2, 3, 4), 'tail': 6}
+
 # ###############################################
 # Testing
 # ###############################################
@@ -125,6 +149,417 @@ def test():
     assert recycle2 == tv2
     assert recycle3 == tv3
     
+    
+def test_repeat():
+    # Repeated packing must not accumulate state (ex. deferred calls)
+    for __ in range(100):
+        bites1 = test_format.pack(copy.deepcopy(tv1))
+    assert all(len(waiting) <= 1 
+               for waiting in test_format._defer_eval[1].values())
+    assert test_format.unpack(bites1) == tv1
+    
+    # Nor repeated unpacking (ex. lists' lengths)
+    short = bytes(listed_format.pack(copy.deepcopy(lv1)))
+    long = bytes(listed_format.pack(copy.deepcopy(lv2)))
+    things = listed_format['things']
+    for __ in range(2):
+        assert listed_format.unpack(short) == lv1
+        assert listed_format.unpack(long) == lv2
+        assert things.unpack(long[:-1]) == lv2['things']
+        assert things.unpack(short[:-1]) == lv1['things']
+    
+    
+def test_iov():
+    # Large blobs should be passed through by reference
+    big = copy.deepcopy(tv1)
+    payload = bytearray(10000)
+    big['body1'] = payload
+    iov = test_format.pack_iov(big, min_size=1000)
+    assert any(buf is payload for buf in iov)
+    assert b''.join(iov) == bytes(test_format.pack(big))
+    assert test_format.unpack(b''.join(iov)) == big
+    
+    # Sizes are counted in bytes, not items
+    wide = copy.deepcopy(tv1)
+    wide['body1'] = array.array('d', bytes(1600))
+    iov = test_format.pack_iov(wide, min_size=1000)
+    assert len(iov) == 3
+    assert b''.join(iov) == bytes(test_format.pack(wide))
+    
+    # Small messages stay in one piece
+    iov = test_format.pack_iov(tv1, min_size=1000)
+    assert len(iov) == 1
+    assert bytes(iov[0]) == bytes(test_format.pack(tv1))
+
+    # Blobs are sized up after their prepack callbacks
+    def make_encoded():
+        encoded = SmartyParser()
+        encoded['version'] = ParseHelper(Int32(signed=False))
+        encoded['text'] = ParseHelper(Blob())
+        encoded['text'].register_callback('prepack', str.encode, 
+                                          modify=True)
+        return encoded
+        
+    for text in ('short', 'long' * 1000):
+        iov = make_encoded().pack_iov({'version': 1, 'text': text}, 
+                                      min_size=1000)
+        assert len(iov) == (1 if len(text) < 1000 else 2)
+        assert b''.join(iov) == \
+               bytes(make_encoded().pack({'version': 1, 'text': text}))
+
+
+def test_trusted():
+    # Trusted mode must produce exactly the same results, serially
+    for vector, parser in ((tv1, test_format), (tv2, test_format), 
+                           (tv3, test_nest), (tv1, test_format)):
+        bites = parser.pack(copy.deepcopy(vector))
+        assert parser.pack(copy.deepcopy(vector), trusted=True) == bites
+        assert parser.unpack(bites, trusted=True) == vector
+
+
+def test_projection():
+    bites = test_nest.pack(copy.deepcopy(tv3))
+    projected = test_nest.unpack(bites, fields=['first.body1', 
+                                                'second.version'])
+    assert list(projected) == ['first', 'second']
+    assert list(projected['first']) == ['body1']
+    assert projected['first']['body1'] == tv3['first']['body1']
+    assert list(projected['second']) == ['version']
+    assert projected['second']['version'] == tv3['second']['version']
+    # Skipped fields must still be measured
+    assert test_nest.length == len(bites)
+    
+    # Fields after a skipped length-linked blob must line up
+    bites = test_format.pack(copy.deepcopy(tv2))
+    projected = test_format.unpack(bites, fields=['body2'])
+    assert dict(projected.items()) == {'body2': tv2['body2']}
+    
+    # Skipped lists are measured afresh, whatever was unpacked before
+    short = bytes(listed_format.pack(copy.deepcopy(lv1)))
+    long = bytes(listed_format.pack(copy.deepcopy(lv2)))
+    for packed, vector in ((short, lv1), (long, lv2), (short, lv1)):
+        assert listed_format.unpack(packed) == vector
+        for other, expected in ((long, lv2), (short, lv1)):
+            projected = listed_format.unpack(other, fields=['tail'])
+            assert dict(projected.items()) == {'tail': expected['tail']}
+            assert listed_format.length == len(other)
+    
+    try:
+        test_format.unpack(bites, fields=['body3'])
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('Unknown field did not raise.')
+        
+        
+def test_pack_cache():
+    # A nested message as linked data, followed by another field
+    wrapper = SmartyParser()
+    wrapper['header_length'] = ParseHelper(Int16(signed=False))
+    wrapper['header'] = test_format
+    wrapper['trailer'] = ParseHelper(Int8(signed=False))
+    wrapper.link_length('header', 'header_length')
+    
+    vectors = [{'header': copy.deepcopy(tv), 'trailer': ii} 
+               for ii, tv in enumerate((tv1, tv2) * 10)]
+    expected = [wrapper.pack(copy.deepcopy(vector)) for vector in vectors]
+    
+    cache = wrapper.cache_field('header', max_bytes=1024)
+    try:
+        for vector, bites in zip(vectors, expected):
+            # Reuse the same header objects too, which packing modifies
+            assert wrapper.pack(vector) == bites
+            assert wrapper.unpack(bites) == vector
+    finally:
+        wrapper.uncache_field('header')
+        
+    assert cache.misses == 2
+    assert cache.hits == 18
+    assert wrapper.cache_stats() == {}
+    
+    # Eviction is LRU, by bytes
+    cache = test_nest.cache_field('first', max_bytes=len(test_format.pack(
+        copy.deepcopy(tv2))))
+    try:
+        for tv in (tv1, tv2, tv1, tv1):
+            vector = {'first': copy.deepcopy(tv), 'second': copy.deepcopy(tv)}
+            bites = test_nest.pack(copy.deepcopy(vector))
+            assert test_nest.unpack(bites) == vector
+        assert cache.stats()['evictions'] == 2
+        assert cache.stats()['hits'] == 1
+        assert cache.stats()['entries'] == 1
+    finally:
+        test_nest.uncache_field('first')
+    
+        
+        
+def test_link_count():
+    entry = SmartyParser()
+    entry['kind'] = ParseHelper(Int8())
+    entry['value'] = ParseHelper(Int16())
+    
+    counted = SmartyParser()
+    counted['sample_count'] = ParseHelper(Int16(signed=False))
+    counted['entry_count'] = ParseHelper(Int8(signed=False))
+    counted['samples'] = ParseHelper(Array(Int32()))
+    counted['entries'] = ListyParser(parsers=[entry])
+    counted['tail'] = ParseHelper(Int8())
+    counted.link_count('samples', 'sample_count')
+    counted.link_count('entries', 'entry_count')
+    
+    vectors = [
+        {'samples': [1, 2, 3], 
+         'entries': [{'kind': 1, 'value': 300}, {'kind': 2, 'value': -1}],
+         'tail': 7},
+        {'samples': [], 
+         'entries': [{'kind': 3, 'value': 5}],
+         'tail': -7},
+    ]
+    
+    for vector in vectors + vectors:
+        bites = counted.pack(copy.deepcopy(vector))
+        assert bites[:3] == bytes([0, len(vector['samples']), 
+                                   len(vector['entries'])])
+        recycled = counted.unpack(bites)
+        assert list(recycled) == ['samples', 'entries', 'tail']
+        assert recycled['samples'].tolist() == vector['samples']
+        assert recycled['entries'] == tuple(vector['entries'])
+        assert recycled['tail'] == vector['tail']
+        
+    # Fixed-size items are skipped over without being decoded
+    with counted.profile() as profiler:
+        projected = counted.unpack(bites, fields=['tail'])
+    assert projected['tail'] == vectors[1]['tail']
+    assert 'entries.0' not in profiler.report()
+    
+    # Variable-length items stop at the count, without a terminant
+    nested = SmartyParser()
+    nested['message_count'] = ParseHelper(Int8(signed=False))
+    nested['messages'] = ListyParser(parsers=[test_format])
+    nested['tail'] = ParseHelper(Int8())
+    nested.link_count('messages', 'message_count')
+    vector = {'messages': [tv1, tv2, tv1], 'tail': 1}
+    recycled = nested.unpack(nested.pack(copy.deepcopy(vector)))
+    assert recycled['messages'] == (tv1, tv2, tv1)
+    assert recycled['tail'] == 1
+    
+    # Counts running past the end of the data are truncations
+    short = SmartyParser()
+    short['count'] = ParseHelper(Int8(signed=False))
+    short['samples'] = ParseHelper(Array(Int16()))
+    short.link_count('samples', 'count')
+    try:
+        short.unpack(b'\x05\x00\x01')
+    except ParseError as exc:
+        assert exc.reason == 'length_mismatch'
+    else:
+        raise AssertionError('Truncated array did not raise.')
+    
+    try:
+        nested.link_count('messages', 'tail')
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('Trailing count did not raise.')
+    
+    
+def test_align():
+    # Same layout as struct { int8_t; int32_t; int16_t; } in C
+    point = SmartyParser(align='native')
+    point['flag'] = ParseHelper(Int8(endian=sys.byteorder))
+    point['x'] = ParseHelper(Int32(endian=sys.byteorder))
+    point['y'] = ParseHelper(Int16(endian=sys.byteorder))
+    vector = {'flag': 1, 'x': -7, 'y': 300}
+    
+    packed = point.pack(dict(vector))
+    assert bytes(packed) == struct.pack('@bih', 1, -7, 300) + bytes(2)
+    assert point.unpack(packed) == vector
+    assert point.unpack_from(packed) == vector
+    assert point._get_layout()[2][0].size == 12
+    
+    # Straight in and out of shared buffers, at any offset
+    shared = bytearray(64)
+    assert point.pack_into(shared, 16, vector) == 12
+    assert shared[16:28] == packed
+    assert point.unpack_from(memoryview(shared), 16) == vector
+    
+    # Explicit alignments cap the natural ones
+    pair = SmartyParser(align=2)
+    pair['flag'] = ParseHelper(Int8())
+    pair['value'] = ParseHelper(Float())
+    packed = pair.pack({'flag': 1, 'value': .5})
+    assert len(packed) == 10
+    assert pair.unpack_from(packed) == {'flag': 1, 'value': .5}
+    
+    # Nested and variable-length messages are padded as they're packed
+    framed = SmartyParser(align='native')
+    framed['tag'] = ParseHelper(Int8())
+    framed['body_length'] = ParseHelper(Int16(signed=False))
+    framed['body'] = ParseHelper(Blob())
+    framed['point'] = point
+    framed.link_length('body', 'body_length')
+    assert framed._get_layout()[2] is None
+    vector = {'tag': 2, 'body': b'abc', 'point': dict(vector)}
+    packed = framed.pack(copy.deepcopy(vector))
+    assert len(packed) == 20
+    assert framed.unpack(packed) == vector
+    assert framed.unpack_from(b'\xff' + bytes(packed), 1) == vector
+    
+    try:
+        framed.unpack(packed[:-1])
+    except ParseError as exc:
+        assert exc.reason == 'length_mismatch'
+    else:
+        raise AssertionError('Truncated padding did not raise.')
+        
+    # Blobs are held to their lengths, as they are by pack
+    tagged = SmartyParser()
+    tagged['tag'] = ParseHelper(Blob(length=4))
+    tagged['value'] = ParseHelper(Int16())
+    assert tagged.pack_into(shared, 0, {'tag': b'abcd', 'value': 1}) == 6
+    for tag in (b'abc', b'abcde'):
+        try:
+            tagged.pack_into(shared, 0, {'tag': tag, 'value': 1})
+        except ParseError as exc:
+            assert exc.reason == 'length_mismatch'
+        else:
+            raise AssertionError('Mismatched blob did not raise.')
+            
+    # Callbacks and links added after the first use aren't compiled away
+    tagged['value'].register_callback('prepack', lambda value: value + 1,
+                                      modify=True)
+    tagged.pack_into(shared, 0, {'tag': b'abcd', 'value': 1})
+    assert shared[4:6] == b'\x00\x02'
+    
+    sized = SmartyParser()
+    sized['length'] = ParseHelper(Int8(signed=False))
+    sized['body'] = ParseHelper(Blob(length=3))
+    assert sized.unpack_from(b'\x03abc') == {'length': 3, 'body': b'abc'}
+    sized.link_length('body', 'length')
+    assert sized.pack_into(shared, 0, {'body': b'xyz'}) == 4
+    assert shared[:4] == b'\x03xyz'
+    assert sized.unpack_from(shared) == {'body': b'xyz'}
+    
+    
+def test_link_offset():
+    # A container whose header points to its sections
+    container = SmartyParser()
+    container['magic'] = ParseHelper(Blob(length=4))
+    container['index_offset'] = ParseHelper(Int32(signed=False))
+    container['payload_offset'] = ParseHelper(Int32(signed=False))
+    container['index'] = test_format
+    container['payload'] = test_nest
+    container.link_offset('index', 'index_offset')
+    container.link_offset('payload', 'payload_offset', 
+                          base='payload_offset')
+    
+    vector = {'magic': b'CNTR', 'index': tv1, 'payload': tv3}
+    packed = container.pack(copy.deepcopy(vector))
+    index_length = len(test_format.pack(copy.deepcopy(tv1)))
+    assert bytes(packed[4:12]) == bytes(Int32().pack(12)) + \
+                                  bytes(Int32().pack(4 + index_length))
+    
+    # Nothing past the header is parsed until it's needed, but the 
+    # message still runs to the end of its sections
+    unpacked = container.unpack(packed)
+    assert container.length == len(packed)
+    assert isinstance(unpacked['payload'], Reference)
+    assert unpacked['payload'].deref() == tv3
+    assert unpacked['index'].deref() == tv1
+    assert unpacked['index'].deref() is unpacked['index'].deref()
+    
+    # Unparsed references are packed straight back
+    assert container.pack(container.unpack(packed)) == packed
+    
+    # Sections can be read straight out of a mapped file
+    with tempfile.TemporaryFile() as f:
+        f.write(packed)
+        f.flush()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            unpacked = container.unpack(mapped, fields=['payload'])
+            assert list(unpacked) == ['payload']
+            assert unpacked['payload'].deref() == tv3
+            del unpacked
+    
+    # Sections are measured, so truncations are caught up front
+    try:
+        container.unpack(packed[:20])
+    except ParseError as exc:
+        assert exc.reason == 'length_mismatch'
+    else:
+        raise AssertionError('Truncated section did not raise.')
+        
+    # Nested messages pick up after their parent's sections
+    inner = SmartyParser()
+    inner['off'] = ParseHelper(Int8(signed=False))
+    inner['x'] = ParseHelper(Int8())
+    inner['sec'] = ParseHelper(Int16())
+    inner.link_offset('sec', 'off')
+    outer = SmartyParser()
+    outer['a'] = inner
+    outer['tail'] = ParseHelper(Int8())
+    
+    vector = {'a': {'x': 1, 'sec': 500}, 'tail': 9}
+    packed = outer.pack(copy.deepcopy(vector))
+    assert bytes(packed) == b'\x02\x01\x01\xf4\t'
+    unpacked = outer.unpack(packed)
+    assert unpacked['tail'] == 9
+    assert unpacked['a']['x'] == 1
+    assert unpacked['a']['sec'].deref() == 500
+    assert outer.unpack(packed, fields=['tail']) == {'tail': 9}
+    
+    listy = ListyParser(parsers=[inner])
+    assert [message['sec'].deref() for message in 
+            listy.unpack(bytes(packed[:4]) * 3)] == [500] * 3
+    assert inner.record_offsets(bytes(packed[:4]) * 2).tolist() == \
+           [0, 4, 8]
+    
+    try:
+        container.link_offset('payload', 'magic')
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('Non-integer offset did not raise.')
+
+    # Terminated lists end at their terminant, not at the end of the data
+    def terminated(verify):
+        listed = SmartyParser()
+        listed['off'] = ParseHelper(Int8(signed=False))
+        listed['numbers'] = ListyParser(
+            parsers=[ParseHelper(Int16())],
+            terminant=ParseHelper(Literal(b'\xff', verify=verify))
+        )
+        listed['tail'] = ParseHelper(Int8())
+        listed.link_offset('numbers', 'off')
+        return listed
+
+    packed = terminated(False).pack({'numbers': [1, 2, 3], 'tail': 4})
+    listed = terminated(True)
+    unpacked = listed.unpack(bytes(packed) + b'zz')
+    assert listed.length == len(packed)
+    assert unpacked['numbers'].deref() == (1, 2, 3)
+    # Pickled references carry just their own section
+    assert pickle.loads(pickle.dumps(unpacked['numbers'])).deref() == \
+           (1, 2, 3)
+
+    unsized = SmartyParser()
+    unsized['off'] = ParseHelper(Int8(signed=False))
+    unsized['body'] = ParseHelper(Blob())
+    try:
+        unsized.link_offset('body', 'off')
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('Unbounded section did not raise.')
+
                 
 if __name__ == '__main__':
-    test()
\ No newline at end of file
+    test()
+    test_repeat()
+    test_iov()
+    test_trusted()
+    test_projection()
+    test_pack_cache()
+    test_link_count()
+    test_align()
+    test_link_offset()